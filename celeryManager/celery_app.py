@@ -4,6 +4,8 @@ import os
 from dotenv import load_dotenv
 from celery import Celery
 from kombu import Queue
+from source.shard_router import shard_queue_name
+from celeryManager.retry_queues import delay_queues, retry_queues
 
 # Carrega variáveis de ambiente do arquivo .env.prd
 # Garante que este arquivo esteja no diretório raiz do projeto
@@ -48,25 +50,79 @@ celery.conf.task_queues = (
     Queue('pricing', routing_key='pricing.#'),       # Para enriquecimento de preços (TimescaleDB)
     Queue('commission', routing_key='commission.#'), # Para cálculo e registro de comissões
     Queue('virtual', routing_key='virtual.#'),       # Para operações virtuais (simulação de estratégia)
+    Queue('virtual_record', routing_key='virtual_record.#'),  # Registro virtual em lote (celeryManager/virtual_recorder.py)
 )
 
+# Filas de shard da lógica: cada instância é roteada por hash consistente para
+# uma delas (source/shard_router.py), consumida por um único processo.
+# LOGIC_SHARD_COUNT=0 (padrão) mantém todo o processamento na fila 'logic'.
+LOGIC_SHARD_COUNT = int(os.getenv("LOGIC_SHARD_COUNT", "0"))
+celery.conf.task_queues += tuple(
+    Queue(shard_queue_name(shard), routing_key=f'{shard_queue_name(shard)}.#')
+    for shard in range(LOGIC_SHARD_COUNT)
+)
+
+# Filas de espera para retries com atraso (TTL + dead-letter de volta à fila
+# de trabalho), em vez de ETA retido na memória do worker.
+celery.conf.task_queues += retry_queues()
+
+# Janela de coalescência de sinais: a avaliação agendada espera numa fila de
+# espera com TTL igual à janela e cai na fila de lógica (ou de shard) ao expirar.
+SIGNAL_COALESCE_WINDOW_MS = int(os.getenv("SIGNAL_COALESCE_WINDOW_MS", "0"))
+if SIGNAL_COALESCE_WINDOW_MS > 0:
+    celery.conf.task_queues += delay_queues(
+        ['logic'] + [shard_queue_name(shard) for shard in range(LOGIC_SHARD_COUNT)],
+        SIGNAL_COALESCE_WINDOW_MS
+    )
+
 # === ROTEAMENTO DAS TAREFAS (ÚNICA FONTE DA VERDADE) ===
 # Mapeia o nome exato da tarefa para a fila e a chave de roteamento desejadas.
 # Isso centraliza toda a lógica de roteamento aqui.
 celery.conf.task_routes = {
     'webhook.receipt':              {'queue': 'webhook', 'routing_key': 'webhook.receipt'},
     'webhook.processor':            {'queue': 'logic',   'routing_key': 'logic.process'},
+    'webhook.evaluate_coalesced':   {'queue': 'logic',   'routing_key': 'logic.evaluate'},
     'panic.processor':              {'queue': 'logic',   'routing_key': 'logic.panic'},
     'trade.execute_operation':      {'queue': 'ops',     'routing_key': 'ops.execute'},
     'trade.save_operation':         {'queue': 'db',      'routing_key': 'db.save'},
     'process_sharing_operations':   {'queue': 'sharing', 'routing_key': 'sharing.process'},
     'account.get_balance':          {'queue': 'ops',     'routing_key': 'ops.balance'},
+    'account.balance_stats':        {'queue': 'ops',     'routing_key': 'ops.stats'},
     'price.fetch_execution_price':  {'queue': 'pricing', 'routing_key': 'pricing.fetch'},
+    'price.enrich_pending':         {'queue': 'pricing', 'routing_key': 'pricing.batch'},
     'commission.process':           {'queue': 'commission', 'routing_key': 'commission.process'},
+    'commission.reconcile':         {'queue': 'commission', 'routing_key': 'commission.reconcile'},
     'virtual.record_operation':     {'queue': 'virtual', 'routing_key': 'virtual.record'},
     'virtual.enrich_price':         {'queue': 'virtual', 'routing_key': 'virtual.enrich'},
+    'virtual.enrich_batch':         {'queue': 'virtual', 'routing_key': 'virtual.enrich'},
+    'virtual.apply_performance':    {'queue': 'virtual', 'routing_key': 'virtual.performance'},
 }
 
+# === TAREFAS PERIÓDICAS (celery beat) ===
+# Executadas pelo serviço celery_beat; cada entrada só é agendada quando o
+# recurso correspondente está ativo.
+celery.conf.beat_schedule = {}
+if os.getenv("PRICE_BATCH_ENABLED", "false").strip().lower() not in ("false", "0", "no"):
+    celery.conf.beat_schedule['price-enrich-pending'] = {
+        'task': 'price.enrich_pending',
+        'schedule': float(os.getenv("PRICE_BATCH_INTERVAL_SECONDS", "5")),
+        'options': {'expires': float(os.getenv("PRICE_BATCH_INTERVAL_SECONDS", "5"))},
+    }
+if os.getenv("COMMISSION_RECONCILE_ENABLED", "false").strip().lower() not in ("false", "0", "no"):
+    celery.conf.beat_schedule['commission-reconcile'] = {
+        'task': 'commission.reconcile',
+        'schedule': float(os.getenv("COMMISSION_RECONCILE_INTERVAL_SECONDS", "60")),
+        'options': {'expires': float(os.getenv("COMMISSION_RECONCILE_INTERVAL_SECONDS", "60"))},
+    }
+# Ciclos virtuais que a precificação não conseguiu consolidar (compra e venda
+# precificadas em transações concorrentes, ou falha no savepoint).
+if os.getenv("VIRTUAL_PERFORMANCE_CATCHUP_ENABLED", "true").strip().lower() not in ("false", "0", "no"):
+    celery.conf.beat_schedule['virtual-performance-catchup'] = {
+        'task': 'virtual.apply_performance',
+        'schedule': float(os.getenv("VIRTUAL_PERFORMANCE_CATCHUP_INTERVAL_SECONDS", "60")),
+        'options': {'expires': float(os.getenv("VIRTUAL_PERFORMANCE_CATCHUP_INTERVAL_SECONDS", "60"))},
+    }
+
 # === DESCOBERTA AUTOMÁTICA DE TAREFAS ===
 # O Celery irá procurar por tarefas nos arquivos dentro do pacote especificado.
 # Garanta que sua estrutura de pastas seja `celeryManager/tasks/`.
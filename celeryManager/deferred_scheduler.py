@@ -0,0 +1,111 @@
+"""
+Deferred-signal scheduler.
+
+Releases delayed signals (indicators with delay_seconds) into the logic queue
+when they come due. Signals are persisted in `deferred_signals` by the webhook
+receipt; this process keeps only the ones firing within the next
+DEFERRED_SCHEDULER_HORIZON_SECONDS in a hierarchical timer wheel (ids only),
+so memory stays flat no matter how many signals are waiting, and nothing is
+held in worker prefetch. Pending rows are reloaded on start, so signals that
+came due while the scheduler was down are released immediately.
+
+Releasing marks the rows and publishes webhook.processor inside one
+transaction; a publish failure rolls back and the rows are retried on the
+next load.
+
+Run a single instance:
+    python -m celeryManager.deferred_scheduler
+"""
+
+import os
+import signal
+import time
+
+from celeryManager.celery_app import celery as celery_app
+from celeryManager.tasks.base import logger
+from interface.deferred_signals import load_due_deferred_signals
+from source.context import get_db_connection
+from source.dbmanager import load_query
+from source.shard_router import get_shard_router
+from source.timer_wheel import TimerWheel
+
+TICK_MS = int(os.environ.get("DEFERRED_SCHEDULER_TICK_MS", "10"))
+HORIZON_SECONDS = int(os.environ.get("DEFERRED_SCHEDULER_HORIZON_SECONDS", "60"))
+POLL_SECONDS = float(os.environ.get("DEFERRED_SCHEDULER_POLL_SECONDS", "1"))
+LOAD_LIMIT = int(os.environ.get("DEFERRED_SCHEDULER_LOAD_LIMIT", "5000"))
+
+
+class DeferredScheduler:
+    def __init__(self):
+        self.wheel = TimerWheel(tick_ms=TICK_MS)
+        self.scheduled = set()  # ids currently in the wheel
+        self.running = True
+
+    def stop(self, *_):
+        self.running = False
+
+    def load(self):
+        """Pull pending rows due within the horizon into the wheel."""
+        added = 0
+        for signal_id, fire_at_ms in load_due_deferred_signals(HORIZON_SECONDS, LOAD_LIMIT):
+            if signal_id in self.scheduled:
+                continue
+            self.wheel.add(fire_at_ms, signal_id)
+            self.scheduled.add(signal_id)
+            added += 1
+        if added:
+            logger.info(f"[DeferredScheduler] Loaded {added} signals ({len(self.wheel)} in wheel)")
+
+    def release(self, signal_ids):
+        """Mark due signals released and publish them, in one transaction."""
+        router = get_shard_router()
+        with get_db_connection() as db_client:
+            db_client.cursor.execute(load_query("release_deferred_signals.sql"), (signal_ids,))
+            rows = db_client.cursor.fetchall()
+
+            with celery_app.producer_or_acquire() as producer:
+                for signal_id, instance_id, payload in rows:
+                    celery_app.send_task(
+                        "webhook.processor",
+                        kwargs=payload,
+                        queue=router.route(instance_id),
+                        producer=producer
+                    )
+            db_client.conn.commit()
+
+        logger.info(f"[DeferredScheduler] Released {len(rows)} signals: {[row[0] for row in rows]}")
+
+    def run(self):
+        logger.info(
+            f"[DeferredScheduler] Started (tick={TICK_MS}ms, horizon={HORIZON_SECONDS}s, poll={POLL_SECONDS}s)"
+        )
+        next_load = 0.0
+        while self.running:
+            try:
+                if time.monotonic() >= next_load:
+                    self.load()
+                    next_load = time.monotonic() + POLL_SECONDS
+
+                due = self.wheel.advance()
+                if due:
+                    self.scheduled.difference_update(due)
+                    self.release(due)
+            except Exception as e:
+                # Released rows were rolled back and are still pending: drop
+                # the in-memory copy so the next load picks them up again.
+                logger.error(f"[DeferredScheduler] Cycle failed: {e}", exc_info=True)
+                self.wheel = TimerWheel(tick_ms=TICK_MS)
+                self.scheduled.clear()
+                next_load = time.monotonic() + POLL_SECONDS
+
+            sleep_ms = self.wheel.next_fire_ms() - int(time.time() * 1000)
+            time.sleep(max(sleep_ms, 1) / 1000.0)
+
+        logger.info("[DeferredScheduler] Stopped")
+
+
+if __name__ == "__main__":
+    scheduler = DeferredScheduler()
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    signal.signal(signal.SIGINT, scheduler.stop)
+    scheduler.run()
@@ -0,0 +1,99 @@
+"""
+Task outbox relay.
+
+Publishes the tasks that DB-writing stages committed to `task_outbox`
+(source/outbox.py) and removes them. Each cycle takes up to
+OUTBOX_RELAY_BATCH_SIZE of the oldest rows (FOR UPDATE SKIP LOCKED), publishes
+them over one producer and deletes them in the same transaction: a publish
+failure rolls back and the rows are retried on the next cycle. Rows keep the
+Celery task id given when staged, so a batch published again after a crash
+between publish and commit carries the same ids.
+
+Full batches are followed immediately by the next one; otherwise the relay
+waits for a NOTIFY task_outbox (sent by each committed stage) or at most
+OUTBOX_RELAY_POLL_SECONDS.
+
+Run a single instance (more are safe but don't keep the publish order):
+    python -m celeryManager.outbox_relay
+"""
+
+import os
+import signal
+import threading
+import time
+
+from celeryManager.celery_app import celery as celery_app
+from celeryManager.tasks.base import logger
+from source.context import get_db_connection
+from source.dbmanager import load_query
+from source.outbox import CHANNEL
+from source.pg_listener import PgListener
+
+BATCH_SIZE = int(os.environ.get("OUTBOX_RELAY_BATCH_SIZE", "500"))
+POLL_SECONDS = float(os.environ.get("OUTBOX_RELAY_POLL_SECONDS", "1"))
+
+
+class OutboxRelay:
+    def __init__(self):
+        self.running = True
+        self.wakeup = threading.Event()
+
+    def stop(self, *_):
+        self.running = False
+        self.wakeup.set()
+
+    def relay_batch(self, db_client):
+        """Publish and delete one batch in one transaction; returns its size."""
+        db_client.cursor.execute(load_query("claim_task_outbox.sql"), (BATCH_SIZE,))
+        rows = sorted(db_client.cursor.fetchall())
+        if not rows:
+            db_client.conn.rollback()
+            return 0
+
+        try:
+            with celery_app.producer_or_acquire() as producer:
+                for _, task_name, kwargs, queue, task_id in rows:
+                    celery_app.send_task(
+                        task_name,
+                        kwargs=kwargs,
+                        queue=queue,
+                        task_id=task_id,
+                        producer=producer
+                    )
+        except Exception:
+            db_client.conn.rollback()
+            raise
+        db_client.conn.commit()
+
+        logger.info(f"[OutboxRelay] Published {len(rows)} tasks (ids {rows[0][0]}..{rows[-1][0]})")
+        return len(rows)
+
+    def run(self):
+        logger.info(f"[OutboxRelay] Started (batch={BATCH_SIZE}, poll={POLL_SECONDS}s)")
+        listener = PgListener(
+            "outbox-relay", [CHANNEL],
+            on_notify=lambda channel, payload: self.wakeup.set(),
+            on_connect=self.wakeup.set,
+        ).start()
+
+        while self.running:
+            try:
+                with get_db_connection() as db_client:
+                    while self.running:
+                        self.wakeup.clear()
+                        if self.relay_batch(db_client) < BATCH_SIZE:
+                            self.wakeup.wait(POLL_SECONDS)
+            except Exception as e:
+                # Claimed rows were rolled back and stay in the outbox
+                logger.error(f"[OutboxRelay] Cycle failed: {e}; retrying", exc_info=True)
+                time.sleep(POLL_SECONDS)
+
+        listener.stop()
+        logger.info("[OutboxRelay] Stopped")
+
+
+if __name__ == "__main__":
+    relay = OutboxRelay()
+    signal.signal(signal.SIGTERM, relay.stop)
+    signal.signal(signal.SIGINT, relay.stop)
+    relay.run()
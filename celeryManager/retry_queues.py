@@ -0,0 +1,65 @@
+"""
+Broker-side delayed retries.
+
+`self.retry(eta=...)` publishes the retry straight back to the work queue and
+the worker that receives it keeps the message reserved in memory until the ETA.
+Instead, a retry is published to a parking queue with no consumers whose
+x-message-ttl is the delay; when the TTL expires RabbitMQ dead-letters the
+message back to the work queue, where it runs immediately. Pending retries are
+visible as the depth of `<queue>_retry_<n>s`.
+
+The same parking scheme delays first deliveries: a task published to
+`<queue>_delay_<n>ms` reaches `<queue>` n milliseconds later.
+"""
+
+from kombu import Queue
+
+# Work queue -> retry delays (seconds) its tasks use
+RETRY_DELAYS = {
+    'pricing': (10, 15),
+    'virtual': (10,),
+}
+
+
+def retry_queue_name(queue, delay_seconds):
+    return f"{queue}_retry_{delay_seconds}s"
+
+
+def delay_queue_name(queue, delay_ms):
+    return f"{queue}_delay_{delay_ms}ms"
+
+
+def _parking_queue(name, delay_ms, queue):
+    return Queue(
+        name,
+        routing_key=name,
+        queue_arguments={
+            'x-message-ttl': delay_ms,
+            'x-dead-letter-exchange': '',       # default exchange: routes by queue name
+            'x-dead-letter-routing-key': queue,
+        },
+    )
+
+
+def retry_queues():
+    """Parking queues that dead-letter back to their work queue after the delay."""
+    return tuple(
+        _parking_queue(retry_queue_name(queue, delay), delay * 1000, queue)
+        for queue, delays in RETRY_DELAYS.items()
+        for delay in delays
+    )
+
+
+def delay_queues(queues, delay_ms):
+    """Parking queues that hold a task `delay_ms` before it reaches each of `queues`."""
+    return tuple(_parking_queue(delay_queue_name(queue, delay_ms), delay_ms, queue) for queue in queues)
+
+
+def delayed_retry(task, delay_seconds, queue, exc=None):
+    """
+    Retry `task` after `delay_seconds` through the parking queue.
+
+    Use as `raise delayed_retry(self, 10, 'pricing', exc=...)`. countdown=0
+    keeps Celery from adding its own ETA delay on top of the queue TTL.
+    """
+    return task.retry(countdown=0, queue=retry_queue_name(queue, delay_seconds), exc=exc)
@@ -0,0 +1,113 @@
+"""
+Shard drainer.
+
+A logic shard that leaves the ring (its worker stopped) keeps the messages
+already routed to it; nobody consumes them until the worker comes back, and
+by then their instances belong to other shards. This process watches ring
+membership (source/shard_router.py) and republishes the messages left on
+every shard that is off the ring to the current owners of their instances
+(the 'logic' queue if no shard is live), in queue order.
+
+Each message is acked only after its copy is published, so a failure leaves
+it in place for the next pass (at worst a message is published twice, never
+lost). Draining here, in a single process, keeps the receipt's `route` cheap
+and read-only and preserves the per-instance order of the moved messages.
+
+Run a single instance (only useful with LOGIC_SHARD_COUNT > 0):
+    python -m celeryManager.shard_drainer
+"""
+
+import os
+import signal
+import time
+
+from kombu import Producer
+
+from celeryManager.celery_app import celery as celery_app
+from celeryManager.tasks.base import logger
+from source.shard_router import get_shard_router, shard_queue_name
+
+POLL_SECONDS = float(os.environ.get("SHARD_DRAINER_POLL_SECONDS", "5"))
+DRAIN_LIMIT = int(os.environ.get("SHARD_DRAINER_LIMIT", "10000"))  # messages moved per shard and pass
+
+
+def _message_instance_id(message):
+    """instance_id of a queued logic task (webhook.processor / evaluate_coalesced), or None."""
+    try:
+        _, kwargs, _ = message.decode()
+    except Exception:
+        return None
+    return kwargs.get("instance_id") or (kwargs.get("signal_data") or {}).get("instance_id")
+
+
+def drain_shard(router, shard):
+    """Republish up to DRAIN_LIMIT messages of an offline shard's queue; returns how many moved."""
+    queue = shard_queue_name(shard)
+    moved = 0
+    with celery_app.connection_for_write() as conn:
+        channel = conn.channel()
+        producer = Producer(channel)
+        while moved < DRAIN_LIMIT:
+            raw = channel.basic_get(queue=queue, no_ack=False)
+            if raw is None:
+                break
+            message = channel.message_to_python(raw)
+            instance_id = _message_instance_id(message)
+            target = (router.route(instance_id) if instance_id is not None else None) or "logic"
+            if target == queue:
+                # The shard rejoined meanwhile: leave the rest to its worker
+                message.requeue()
+                break
+            producer.publish(
+                message.body,
+                exchange="",
+                routing_key=target,
+                headers=message.headers,
+                content_type=message.content_type,
+                content_encoding=message.content_encoding,
+                correlation_id=message.properties.get("correlation_id"),
+                reply_to=message.properties.get("reply_to"),
+                delivery_mode=2,
+            )
+            message.ack()
+            moved += 1
+    return moved
+
+
+class ShardDrainer:
+    def __init__(self):
+        self.router = get_shard_router()
+        self.running = True
+
+    def stop(self, *_):
+        self.running = False
+
+    def drain(self):
+        for shard in sorted(self.router.offline_shards()):
+            try:
+                moved = drain_shard(self.router, shard)
+            except Exception as e:
+                logger.error(f"[ShardDrainer] Drain of {shard_queue_name(shard)} failed: {e}")
+                continue
+            if moved:
+                logger.info(f"[ShardDrainer] Moved {moved} queued messages off offline shard {shard}")
+
+    def run(self):
+        logger.info(
+            f"[ShardDrainer] Started (shards={self.router.shard_count}, poll={POLL_SECONDS}s, "
+            f"departure_checks={self.router.departure_checks})"
+        )
+        while self.running:
+            try:
+                self.drain()
+            except Exception as e:
+                logger.error(f"[ShardDrainer] Cycle failed: {e}", exc_info=True)
+            time.sleep(POLL_SECONDS)
+        logger.info("[ShardDrainer] Stopped")
+
+
+if __name__ == "__main__":
+    drainer = ShardDrainer()
+    signal.signal(signal.SIGTERM, drainer.stop)
+    signal.signal(signal.SIGINT, drainer.stop)
+    drainer.run()
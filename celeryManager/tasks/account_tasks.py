@@ -1,7 +1,7 @@
 # celeryManager/tasks/account_tasks.py
 
 from celery import shared_task
-from source.exchange_interface import get_exchange_interface
+from source.account_balance import fetch_account_balance, get_account_balance_cache, shared_stats
 # Se você tiver um logger central, é uma boa ideia usá-lo aqui
 # from log.log import general_logger
 
@@ -10,8 +10,10 @@ def get_account_balance(data: dict):
     """
     Busca o saldo da conta de um usuário em uma exchange específica.
 
-    Esta tarefa recebe os IDs necessários, inicializa a interface da exchange
-    correta e chama o método get_balance().
+    Esta tarefa recebe os IDs necessários e obtém o saldo via
+    fetch_account_balance: requisições repetidas da mesma chave dentro do TTL
+    são respondidas do cache e requisições simultâneas compartilham uma única
+    chamada à exchange (ver source/account_balance.py).
 
     Args:
         data (dict): Um dicionário contendo:
@@ -40,17 +42,14 @@ def get_account_balance(data: dict):
         }
 
     try:
-        # 1. Usa sua função para obter a interface correta (real ou demo)
-        interface = get_exchange_interface(
+        # 1. Busca o saldo (cache compartilhado / chamada única à exchange)
+        balance_result = fetch_account_balance(
             exchange_id=exchange_id,
             user_id=user_id,
-            api_key=api_key_id
+            api_key_id=api_key_id
         )
 
-        # 2. Chama o método get_balance() da interface
-        balance_result = interface.get_balance()
-
-        # 3. Retorna o resultado com sucesso
+        # 2. Retorna o resultado com sucesso
         print(f"[Task account.get_balance] Saldo obtido com sucesso para user:{user_id}")
         return {
             "status": "success",
@@ -65,4 +64,23 @@ def get_account_balance(data: dict):
         return {
             "status": "error",
             "message": error_message
-        }
\ No newline at end of file
+        }
+
+
+@shared_task(name="account.balance_stats")
+def get_account_balance_stats():
+    """
+    Contadores do cache de saldos (hit, coalesced, miss, direct) e a taxa de
+    acerto: "shared" soma todos os processos (até o último flush de cada um),
+    "process" é o do worker que executou a tarefa.
+    """
+    try:
+        shared = shared_stats()
+    except Exception as e:
+        print(f"[Task account.balance_stats] Falha ao ler os contadores compartilhados: {e}")
+        shared = None
+    return {
+        "status": "success",
+        "shared": shared,
+        "process": get_account_balance_cache().stats(),
+    }
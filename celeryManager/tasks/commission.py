@@ -2,76 +2,121 @@
 Commission calculation task — triggered after sell price enrichment.
 
 Fetches closed position entries for a sell operation, calculates PnL per entry,
-and records commission in the ledger for profitable entries.
+and records commission in the ledger for profitable entries — one read, one
+multi-row insert and one transaction per sell (`calculate_commissions`).
+The price enricher runs it inline, in the transaction that writes the sell's
+price; the commission.process task covers sells priced at save time and
+inline failures.
+
+`commission.reconcile` (celery beat, COMMISSION_RECONCILE_ENABLED=true) charges
+in bulk the closed entries this per-sell path missed.
 """
 from celery import shared_task
 from decimal import Decimal
+import os
 from celeryManager.tasks.base import logger
 from source.context import get_db_connection
 from source.dbmanager import load_query
+from source.platform_config import get_platform_config
 from source.tracing import record_stage
 
 
-def _get_platform_config_value(key):
-    """Fetch a value from platform_config table."""
-    with get_db_connection() as db_client:
-        db_client.cursor.execute(
-            "SELECT config_value FROM platform_config WHERE config_key = %s",
-            (key,),
-        )
-        row = db_client.cursor.fetchone()
-        return row[0] if row else None
-
-
-def _get_closed_entries_for_sell(sell_operation_id):
-    """Fetch closed position entries with enriched buy/sell prices."""
-    query = load_query('select_position_entries_for_commission.sql')
-    with get_db_connection() as db_client:
-        db_client.cursor.execute(query, (sell_operation_id,))
-        rows = db_client.cursor.fetchall()
-    return rows
-
-
-def _get_operation_environment(sell_operation_id):
+def calculate_commissions(db_client, sell_operation_id):
     """
-    Resolve the live/demo environment for an operation via its api_key.
+    Compute and insert the commission ledger rows of one sell.
+
+    Commission settings come from the platform_config cache, one query loads
+    the sell's environment and its closed entries, PnL is computed for all
+    entries in one pass and every profitable entry is written with a single
+    multi-row INSERT. The priced entries are marked commission_checked_at so
+    commission.reconcile skips them. Runs on the caller's transaction (the
+    caller commits).
 
     Demo (paper-trading) sells still flow through this pipeline so the trial
     shows what the platform would retain; the environment tag keeps those rows
     distinguishable from real revenue. Defaults to 'live' if unresolved.
+
+    Returns:
+        dict: status plus commissions_created, total_commission,
+        skipped_null_prices (or the skip reason)
     """
-    query = """
-        SELECT nak.environment
-        FROM operations o
-        JOIN neouser_apikeys nak ON o.api_key = nak.id
-        WHERE o.id = %s
-    """
-    with get_db_connection() as db_client:
-        db_client.cursor.execute(query, (sell_operation_id,))
-        row = db_client.cursor.fetchone()
-    return row[0] if row and row[0] else 'live'
-
-
-def _insert_commission_ledger(user_id, entry_id, sell_operation_id,
-                              profit, commission_rate, commission_amount,
-                              commission_token, environment='live'):
-    """Insert a pending commission ledger entry. Returns ledger_id."""
-    query = """
-        INSERT INTO commission_ledger
-            (user_id, position_entry_id, sell_operation_id,
-             profit, commission_rate, commission_amount, commission_token, environment)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        RETURNING id
-    """
-    with get_db_connection() as db_client:
-        db_client.cursor.execute(query, (
-            user_id, entry_id, sell_operation_id,
-            float(profit), float(commission_rate),
-            float(commission_amount), commission_token, environment,
+    config = get_platform_config()
+    commission_rate = config.get_decimal("commission_rate")
+    if commission_rate is None:
+        logger.warning(
+            f"COMMISSION: commission_rate not configured, skipping op {sell_operation_id}"
+        )
+        return {"status": "skipped", "reason": "commission_rate_not_configured"}
+    commission_token = config.get("commission_token", "USDT")
+
+    db_client.cursor.execute(load_query('select_commission_inputs.sql'), (sell_operation_id,))
+    rows = db_client.cursor.fetchall()
+
+    environment = rows[0][5] if rows else 'live'
+    entries = [row[:5] for row in rows if row[0] is not None]
+
+    if not entries:
+        logger.info(f"COMMISSION: No position entries for sell op {sell_operation_id}")
+        return {"status": "success", "commissions_created": 0, "reason": "no_entries"}
+
+    priced = [row for row in entries if row[2] is not None and row[3] is not None]
+    skipped_null = len(entries) - len(priced)
+    if skipped_null:
+        logger.warning(
+            f"COMMISSION: Skipping {skipped_null} entries of sell op {sell_operation_id} — "
+            f"price not enriched"
+        )
+
+    # (entry_id, user_id, profit) for every priced entry, in one pass
+    pnl = [
+        (entry_id, user_id,
+         (Decimal(str(sell_price)) - Decimal(str(buy_price))) * Decimal(str(base_qty)))
+        for entry_id, user_id, buy_price, sell_price, base_qty in priced
+    ]
+    profitable = [(entry_id, user_id, profit) for entry_id, user_id, profit in pnl if profit > 0]
+    amounts = [profit * commission_rate for _, _, profit in profitable]
+
+    created = {}  # entry_id -> commission_amount, only rows actually inserted
+    if profitable:
+        db_client.cursor.execute(load_query('insert_commission_ledger_batch.sql'), (
+            sell_operation_id, commission_rate, commission_token, environment,
+            [user_id for _, user_id, _ in profitable],
+            [entry_id for entry_id, _, _ in profitable],
+            [profit for _, _, profit in profitable],
+            amounts,
         ))
-        ledger_id = db_client.cursor.fetchone()[0]
-        db_client.conn.commit()
-    return ledger_id
+        ledger_ids = {entry_id: ledger_id for ledger_id, entry_id in db_client.cursor.fetchall()}
+        for (entry_id, user_id, profit), amount in zip(profitable, amounts):
+            if entry_id not in ledger_ids:
+                logger.info(f"COMMISSION: Entry {entry_id} already charged, skipping")
+                continue
+            created[entry_id] = amount
+            logger.info(
+                f"COMMISSION: Entry {entry_id} | user:{user_id} | "
+                f"profit={profit:.8f} | commission={amount:.8f} {commission_token} | "
+                f"ledger_id={ledger_ids[entry_id]}"
+            )
+
+    # Evaluated now: keep them out of the commission.reconcile scan
+    db_client.cursor.execute(load_query('mark_commission_checked.sql'), ([entry_id for entry_id, _, _ in pnl],))
+
+    not_profitable = len(pnl) - len(profitable)
+    if not_profitable:
+        logger.info(
+            f"COMMISSION: {not_profitable} entries of sell op {sell_operation_id} not profitable, no commission"
+        )
+
+    total_commission = sum(created.values(), Decimal('0'))
+    logger.info(
+        f"COMMISSION: Sell op {sell_operation_id} processed — "
+        f"{len(created)} commissions, total={total_commission:.8f} {commission_token}"
+    )
+    return {
+        "status": "success",
+        "commissions_created": len(created),
+        "total_commission": float(total_commission),
+        "skipped_null_prices": skipped_null,
+    }
 
 
 @shared_task(name="commission.process", bind=True)
@@ -79,7 +124,8 @@ def process_commission_task(self, sell_operation_id, trace_id=None):
     """
     Calculate and record commissions for a completed sell operation.
 
-    Triggered by price_enricher after successfully enriching a sell operation's price.
+    Triggered for sells priced at save time (exchange fill price) and when the
+    price enricher's inline calculation fails.
     Commission = (sell_price - buy_price) * quantity * commission_rate
     Only charged on profitable entries.
     """
@@ -89,96 +135,17 @@ def process_commission_task(self, sell_operation_id, trace_id=None):
                  metadata={"sell_operation_id": sell_operation_id})
 
     try:
-        # Fetch commission rate from platform config
-        rate_str = _get_platform_config_value("commission_rate")
-        if not rate_str:
-            logger.warning(
-                f"COMMISSION: commission_rate not configured, skipping op {sell_operation_id}"
-            )
-            record_stage(trace_id, "commission_process", status="skipped",
-                         metadata={"reason": "commission_rate_not_configured"})
-            return {"status": "skipped", "reason": "commission_rate_not_configured"}
-
-        commission_rate = Decimal(rate_str)
-        commission_token = _get_platform_config_value("commission_token") or "USDT"
-        environment = _get_operation_environment(sell_operation_id)
+        with get_db_connection() as db_client:
+            result = calculate_commissions(db_client, sell_operation_id)
+            db_client.conn.commit()
 
-        # Fetch closed entries for this sell
-        entries = _get_closed_entries_for_sell(sell_operation_id)
-
-        if not entries:
-            logger.info(f"COMMISSION: No position entries for sell op {sell_operation_id}")
+        if result["status"] == "skipped":
+            record_stage(trace_id, "commission_process", status="skipped",
+                         metadata={"reason": result["reason"]})
+        else:
             record_stage(trace_id, "commission_process", status="completed",
-                         metadata={"commissions_created": 0, "reason": "no_entries"})
-            return {"status": "success", "commissions_created": 0}
-
-        commissions_created = 0
-        total_commission = Decimal('0')
-        skipped_null = 0
-
-        for row in entries:
-            entry_id, user_id, buy_price, sell_price, base_qty = row
-
-            if buy_price is None or sell_price is None:
-                skipped_null += 1
-                logger.warning(
-                    f"COMMISSION: Skipping entry {entry_id} — price not enriched "
-                    f"(buy={buy_price}, sell={sell_price})"
-                )
-                continue
-
-            buy_price = Decimal(str(buy_price))
-            sell_price = Decimal(str(sell_price))
-            base_qty = Decimal(str(base_qty))
-
-            profit = (sell_price - buy_price) * base_qty
-
-            if profit <= 0:
-                logger.info(
-                    f"COMMISSION: Entry {entry_id} not profitable "
-                    f"(PnL={profit:.8f}), no commission"
-                )
-                continue
-
-            commission_amount = profit * commission_rate
-
-            ledger_id = _insert_commission_ledger(
-                user_id=user_id,
-                entry_id=entry_id,
-                sell_operation_id=sell_operation_id,
-                profit=profit,
-                commission_rate=commission_rate,
-                commission_amount=commission_amount,
-                commission_token=commission_token,
-                environment=environment,
-            )
-
-            commissions_created += 1
-            total_commission += commission_amount
-
-            logger.info(
-                f"COMMISSION: Entry {entry_id} | user:{user_id} | "
-                f"profit={profit:.8f} | commission={commission_amount:.8f} {commission_token} | "
-                f"ledger_id={ledger_id}"
-            )
-
-        record_stage(trace_id, "commission_process", status="completed",
-                     metadata={
-                         "commissions_created": commissions_created,
-                         "total_commission": float(total_commission),
-                         "skipped_null_prices": skipped_null,
-                     })
-
-        logger.info(
-            f"COMMISSION: Sell op {sell_operation_id} processed — "
-            f"{commissions_created} commissions, total={total_commission:.8f} {commission_token}"
-        )
-
-        return {
-            "status": "success",
-            "commissions_created": commissions_created,
-            "total_commission": float(total_commission),
-        }
+                         metadata={key: value for key, value in result.items() if key != "status"})
+        return result
 
     except Exception as e:
         logger.error(
@@ -188,3 +155,56 @@ def process_commission_task(self, sell_operation_id, trace_id=None):
         record_stage(trace_id, "commission_process", status="failed",
                      error=str(e))
         raise
+
+
+# Up to BATCH_SIZE entries per pass, MAX_PASSES passes per beat run
+COMMISSION_RECONCILE_BATCH_SIZE = int(os.environ.get("COMMISSION_RECONCILE_BATCH_SIZE", "5000"))
+COMMISSION_RECONCILE_MAX_PASSES = int(os.environ.get("COMMISSION_RECONCILE_MAX_PASSES", "10"))
+# Entries closed more recently are left to the regular commission.process
+COMMISSION_RECONCILE_GRACE_SECONDS = int(os.environ.get("COMMISSION_RECONCILE_GRACE_SECONDS", "300"))
+
+
+@shared_task(name="commission.reconcile")
+def reconcile_commissions_task():
+    """
+    Charge closed entries that commission.process missed (price enriched late,
+    dispatch lost, skipped_null) with set-based passes of
+    reconcile_commissions.sql, each in its own transaction.
+    """
+    config = get_platform_config()
+    commission_rate = config.get_decimal("commission_rate")
+    if commission_rate is None:
+        logger.warning("COMMISSION_RECONCILE: commission_rate not configured, skipping")
+        return {"status": "skipped", "reason": "commission_rate_not_configured"}
+
+    params = {
+        "limit": COMMISSION_RECONCILE_BATCH_SIZE,
+        "grace_seconds": COMMISSION_RECONCILE_GRACE_SECONDS,
+        "commission_rate": commission_rate,
+        "commission_token": config.get("commission_token", "USDT"),
+    }
+    query = load_query('reconcile_commissions.sql')
+    checked = created = 0
+    total_commission = Decimal('0')
+    for _ in range(COMMISSION_RECONCILE_MAX_PASSES):
+        with get_db_connection() as db_client:
+            db_client.cursor.execute(query, params)
+            pass_checked, pass_created, pass_total = db_client.cursor.fetchone()
+            db_client.conn.commit()
+        checked += pass_checked
+        created += pass_created
+        total_commission += pass_total
+        if pass_checked < COMMISSION_RECONCILE_BATCH_SIZE:
+            break
+
+    if created:
+        logger.info(
+            f"COMMISSION_RECONCILE: {checked} entries checked, {created} commissions created, "
+            f"total={total_commission:.8f} {params['commission_token']}"
+        )
+    return {
+        "status": "success",
+        "entries_checked": checked,
+        "commissions_created": created,
+        "total_commission": float(total_commission),
+    }
@@ -1,73 +1,102 @@
 from celery import shared_task
-from source.context import get_db_connection
+from source.context import db_transaction
 from celeryManager.tasks.base import logger
 from source.dbmanager import load_query
 import json
 from decimal import Decimal
-from source.celery_client import get_client
+from source.outbox import TaskDispatch
+from source.idempotency import get_idempotency_store
 from source.position import add_position_entry, close_position_entries
+from source.fill_extractor import extract_fill_price
 from source.tracing import record_stage
+from celeryManager.tasks.price_enricher import PRICE_BATCH_ENABLED
 
 
-def _update_spot_position(operation_data, operation_id):
+def _update_spot_position(operation_data, operation_id, db_client):
     """
-    Create or close spot position entries after an operation is saved.
+    Create or close spot position entries for a saved operation, in the
+    operation's transaction (db_client).
 
     - BUY: creates a new 'open' entry linking to the buy operation_id
     - SELL: closes all open entries referenced by entry_ids, linking to the sell operation_id
 
-    This must NOT fail the save task — position entries can be reconstructed
-    from operation history if needed.
+    Errors propagate: the operation and its position entries are committed
+    together or not at all (the save task retries the whole unit).
     """
-    try:
-        side = operation_data.get("side", "").lower()
-
-        if side == "buy":
-            filled_base_qty_str = operation_data.get("filled_base_qty")
-            if not filled_base_qty_str:
-                logger.warning(f"No filled_base_qty for buy operation {operation_id}, skipping position entry")
-                return
-
-            filled_base_qty = Decimal(str(filled_base_qty_str))
-            if filled_base_qty <= 0:
-                logger.warning(f"filled_base_qty <= 0 for buy operation {operation_id}, skipping position entry")
-                return
-
-            entry_id = add_position_entry(
-                operation_id=operation_id,
-                instance_id=operation_data.get("instance_id"),
-                user_id=operation_data.get("user_id"),
-                symbol=operation_data.get("symbol"),
-                base_currency=operation_data.get("base_currency", ""),
-                base_qty=filled_base_qty
-            )
-            logger.info(f"Position entry {entry_id} created for buy operation {operation_id}")
-
-        elif side == "sell":
-            entry_ids = operation_data.get("entry_ids")
-            if not entry_ids:
-                logger.info(f"No entry_ids for sell operation {operation_id}, skipping position close")
-                return
-
-            close_position_entries(entry_ids, operation_id)
-            logger.info(f"Closed {len(entry_ids)} position entries for sell operation {operation_id}")
-
-    except Exception as e:
-        logger.error(f"Failed to update spot position for operation {operation_id}: {e}", exc_info=True)
+    side = operation_data.get("side", "").lower()
+
+    if side == "buy":
+        filled_base_qty_str = operation_data.get("filled_base_qty")
+        if not filled_base_qty_str:
+            logger.warning(f"No filled_base_qty for buy operation {operation_id}, skipping position entry")
+            return
+
+        filled_base_qty = Decimal(str(filled_base_qty_str))
+        if filled_base_qty <= 0:
+            logger.warning(f"filled_base_qty <= 0 for buy operation {operation_id}, skipping position entry")
+            return
+
+        entry_id = add_position_entry(
+            operation_id=operation_id,
+            instance_id=operation_data.get("instance_id"),
+            user_id=operation_data.get("user_id"),
+            symbol=operation_data.get("symbol"),
+            base_currency=operation_data.get("base_currency", ""),
+            base_qty=filled_base_qty,
+            db_client=db_client
+        )
+        logger.info(f"Position entry {entry_id} created for buy operation {operation_id}")
+
+    elif side == "sell":
+        entry_ids = operation_data.get("entry_ids")
+        if not entry_ids:
+            logger.info(f"No entry_ids for sell operation {operation_id}, skipping position close")
+            return
+
+        close_position_entries(entry_ids, operation_id, db_client=db_client)
+        logger.info(f"Closed {len(entry_ids)} position entries for sell operation {operation_id}")
+
+
+def _dispatch_commission(dispatch, operation_data, operation_id, trace_id):
+    """Sell priced at save time: trigger commission like the price enricher does."""
+    if operation_data.get("side", "").lower() != "sell":
+        return
+    dispatch.add(
+        "commission.process",
+        {"sell_operation_id": operation_id, "trace_id": trace_id},
+        queue="commission",
+    )
 
 
 @shared_task(name="trade.save_operation", bind=True, max_retries=3, default_retry_delay=5)
 def save_operation_task(self, operation_data):
     """
     Salva a operação e dispara a task de enriquecimento de preço.
+
+    Operação, entradas de posição e estágios de tracing são gravados numa
+    única transação em uma conexão do pool (db_transaction): ou tudo é
+    persistido, ou nada (e a task tenta de novo). As tasks seguintes
+    (preço, comissão) entram no outbox na mesma transação (source/outbox.py);
+    com o outbox desligado são publicadas depois do commit.
+
+    Ordens com client_order_id são salvas uma única vez: a mesma transação
+    registra o id no idempotency store (trade_save), e uma entrega repetida
+    (retry, outbox, reexecução da ordem) desfaz a sua e devolve a operação
+    já salva.
     """
     trace_id = operation_data.get("trace_id")
     task_id = self.request.id
-    record_stage(trace_id, "trade_save", status="started", celery_task_id=task_id)
+
+    op_status = operation_data.get("status", "")
+    # Fill price reported by the exchange: stored with the row, no enrichment needed
+    fill_price = None if op_status.startswith("virtual") else extract_fill_price(operation_data.get("order_response"))
+    # Batch pricing: queue the row for price.enrich_pending (attempts = 0)
+    batch_priced = PRICE_BATCH_ENABLED and not op_status.startswith("virtual") and fill_price is None
 
     try:
         query = load_query('insert_operation.sql')
-        with get_db_connection() as db_client:
+        dispatch = TaskDispatch()
+        with db_transaction() as db_client:
             db_client.cursor.execute(query, (
                 operation_data.get("user_id"),
                 operation_data.get("api_key"),
@@ -77,41 +106,70 @@ def save_operation_task(self, operation_data):
                 json.dumps(operation_data.get("order_response")),
                 operation_data.get("instance_id"),
                 operation_data.get("status"),
-                operation_data.get("executed_at")
+                operation_data.get("executed_at"),
+                trace_id,
+                0 if batch_priced else None,
+                fill_price
             ))
             operation_id = db_client.cursor.fetchone()[0]
-            db_client.conn.commit()
 
-            logger.info(f"Operação salva com sucesso (ID: {operation_id} User_id: {operation_data.get('user_id')}): {operation_data.get('symbol')}")
+            client_order_id = operation_data.get("client_order_id")
+            if client_order_id and not get_idempotency_store().claim(
+                    client_order_id, "trade_save", db_client, result={"operation_id": operation_id}):
+                db_client.conn.rollback()
+                saved = get_idempotency_store().get(client_order_id, "trade_save")
+                saved_id = (saved["result"] or {}).get("operation_id") if saved else None
+                logger.info(f"Ordem {client_order_id} já salva (operation_id: {saved_id}); entrega duplicada ignorada")
+                return saved_id
+
+            # Depois do INSERT: a transação já está aberta e os estágios de
+            # tracing usam savepoints dentro dela
+            record_stage(trace_id, "trade_save", status="started", celery_task_id=task_id,
+                         db_client=db_client)
 
-            _update_spot_position(operation_data, operation_id)
+            _update_spot_position(operation_data, operation_id, db_client)
 
             record_stage(trace_id, "trade_save", status="completed",
                          metadata={"operation_id": operation_id},
-                         is_terminal=True)
+                         is_terminal=True, db_client=db_client)
 
-            op_status = operation_data.get("status", "")
             if op_status.startswith("virtual"):
-                logger.info(f"Skipping price enrichment for virtual operation {operation_id} (status: {op_status})")
                 record_stage(trace_id, "price_enrichment", status="skipped",
-                             metadata={"reason": f"virtual operation ({op_status})"})
-            else:
-                try:
-                    get_client().send_task(
-                        "price.fetch_execution_price",
-                        kwargs={
-                            "operation_id": operation_id,
-                            "symbol": operation_data.get("symbol"),
-                            "executed_at": operation_data.get("executed_at"),
-                            "trace_id": trace_id
-                        },
-                        queue='pricing'
-                    )
-                    logger.info(f"Task price.fetch_execution_price disparada para operation_id: {operation_id}")
-                except Exception as e:
-                    logger.error(f"Falha ao disparar task 'price.fetch_execution_price' para op_id {operation_id}: {e}")
-
-            return operation_id
+                             metadata={"reason": f"virtual operation ({op_status})"},
+                             db_client=db_client)
+            elif fill_price is not None:
+                record_stage(trace_id, "price_enrichment", status="completed",
+                             metadata={"price": float(fill_price), "operation_id": operation_id,
+                                       "source": "exchange_fill"},
+                             db_client=db_client)
+                _dispatch_commission(dispatch, operation_data, operation_id, trace_id)
+            elif not batch_priced:
+                dispatch.add(
+                    "price.fetch_execution_price",
+                    {
+                        "operation_id": operation_id,
+                        "symbol": operation_data.get("symbol"),
+                        "executed_at": operation_data.get("executed_at"),
+                        "trace_id": trace_id
+                    },
+                    queue='pricing'
+                )
+
+            dispatch.stage(db_client)
+
+        logger.info(f"Operação salva com sucesso (ID: {operation_id} User_id: {operation_data.get('user_id')}): {operation_data.get('symbol')}")
+        dispatch.publish()
+
+        if op_status.startswith("virtual"):
+            logger.info(f"Skipping price enrichment for virtual operation {operation_id} (status: {op_status})")
+        elif fill_price is not None:
+            logger.info(f"Operation {operation_id} priced from exchange fill: {fill_price}")
+        elif batch_priced:
+            logger.info(f"Operation {operation_id} queued for batch price enrichment")
+        else:
+            logger.info(f"Task price.fetch_execution_price disparada para operation_id: {operation_id}")
+
+        return operation_id
 
     except Exception as e:
         logger.error(f"Erro ao salvar operação (tentativa {self.request.retries + 1}/{self.max_retries + 1}): {e}", exc_info=True)
@@ -35,7 +35,9 @@ def task_execute_operation(self, data):
     - flat_value: Use exact flat value amount
 
     Args:
-        data: Dict containing operation parameters including size_mode and flat_value
+        data: Dict containing operation parameters including size_mode and flat_value.
+            `order_key` (copy trading: the owner's trace id), else the trace id,
+            else this task's id identifies the order for idempotency.
 
     Returns:
         dict: Operation result with normalized exchange response
@@ -58,7 +60,8 @@ def task_execute_operation(self, data):
             max_amount_size=data.get("max_amount_size"),
             size_mode=data.get("size_mode", "percentage"),
             flat_value=data.get("flat_value"),
-            trace_id=trace_id
+            trace_id=trace_id,
+            order_key=data.get("order_key") or trace_id or task_id
         )
 
         result['order_response'] = normalize_exchange_response(result.get('order_response'))
@@ -1,13 +1,19 @@
 from celery import shared_task
+from celery.exceptions import Retry
+from celery.signals import worker_init
 from celeryManager.tasks.base import logger
+from celeryManager.tasks.commission import calculate_commissions
+from celeryManager.retry_queues import delayed_retry
 from source.dbmanager import load_query
 from decimal import Decimal
 import os
 from typing import Union, Optional
-from datetime import datetime, timedelta
 from time import time
 
-from source.context import get_db_connection, get_timescale_db_connection
+from source.context import get_db_connection
+from source.price_cache import get_price_cache
+from source.symbol_index import get_symbol_index, start_symbol_index
+from source.timescale import nearest_price, nearest_prices
 from source.tracing import record_stage
 from source.celery_client import get_client
 
@@ -20,6 +26,19 @@ from source.celery_client import get_client
 _symbol_tracking_cache = {}
 _cache_ttl_seconds = 300  # 5 minutos
 
+# Com SYMBOL_INDEX_ENABLED=true o cache acima só é usado como fallback
+# enquanto o índice compartilhado (source/symbol_index.py) não está ouvindo.
+SYMBOL_INDEX_STATS_EVERY = 1000
+
+
+@worker_init.connect
+def _start_symbol_index(**kwargs):
+    """Carrega o índice no processo pai, antes do fork dos filhos do pool."""
+    try:
+        start_symbol_index()
+    except Exception as e:
+        logger.error(f"PRICE_ENRICHER: Falha ao iniciar índice de símbolos: {e}", exc_info=True)
+
 
 def is_symbol_tracked(symbol: str) -> bool:
     """
@@ -33,6 +52,21 @@ def is_symbol_tracked(symbol: str) -> bool:
         True se o símbolo está sendo rastreado, False caso contrário
     """
     normalized_symbol = symbol.replace("-", "").replace("/", "").upper()
+
+    # Índice compartilhado (atualizado por NOTIFY): responde sem DB nem TTL
+    index = get_symbol_index()
+    if index is not None:
+        tracked = index.lookup(normalized_symbol)
+        if index.lookups % SYMBOL_INDEX_STATS_EVERY == 0:
+            logger.info(f"PRICE_ENRICHER: Symbol index stats: {index.stats()}")
+        if tracked is not None:
+            if not tracked:
+                logger.warning(
+                    f"PRICE_ENRICHER: Símbolo '{normalized_symbol}' NÃO está sendo rastreado "
+                    f"pelo price oracle (is_tracked=false ou não existe)"
+                )
+            return tracked
+
     cache_key = f"tracked_{normalized_symbol}"
 
     # Verifica se está no cache e se ainda é válido
@@ -110,27 +144,20 @@ def get_price_from_timescale(symbol: str, executed_at_str: str) -> Union[Decimal
     # A janela de '5 minutes' é uma salvaguarda de segurança. Se o oráculo
     # esteve fora por 1 hora, NÃO queremos um preço de 1 hora atrás.
     normalized_symbol = symbol.replace("-", "").replace("/", "").upper()
-    query = """
-        SELECT price
-        FROM market_trades
-        WHERE
-            symbol = %s
-            AND timestamp <= %s::timestamptz
-            AND timestamp >= (%s::timestamptz - '5 minutes'::interval)
-        ORDER BY timestamp DESC
-        LIMIT 1;
-    """
 
-    price = None
-    try:
-        # Usa a NOVA função de conexão com o TimescaleDB
-        with get_timescale_db_connection() as ts_cursor:
-            ts_cursor.execute(query, (normalized_symbol, executed_at_str, executed_at_str))
-            result = ts_cursor.fetchone()
-            if result:
-                price = result[0]  # O banco retorna um Decimal
+    # Buffer local de últimos preços: Timescale só para misses históricos
+    cache = get_price_cache()
+    if cache is not None:
+        try:
+            price = cache.nearest_price(normalized_symbol, executed_at_str)
+            if price is not None:
+                return price
+        except Exception as e:
+            logger.warning(f"PRICE_ENRICHER: Erro no cache de preços para {symbol}: {e}")
 
-        return price
+    try:
+        # Pool de conexões + prepared statement (source/timescale.py)
+        return nearest_price(normalized_symbol, executed_at_str)
 
     except Exception as e:
         logger.error(f"PRICE_ENRICHER: Erro ao consultar TimescaleDB para {symbol} @ {executed_at_str}: {e}")
@@ -164,6 +191,46 @@ def mark_operation_as_price_error(operation_id: int, error_message: str):
         logger.error(f"PRICE_ENRICHER: Erro ao marcar operação {operation_id} com erro de preço: {e}")
 
 
+def _commission_inline(db_client, operation_id):
+    """
+    Calcula a comissão de uma venda na transação do preço, num savepoint:
+    uma falha aqui não desfaz o preço. Retorna o resultado de
+    calculate_commissions ou None em caso de erro.
+    """
+    try:
+        with db_client.conn.transaction():
+            return calculate_commissions(db_client, operation_id)
+    except Exception as e:
+        logger.error(f"PRICE_ENRICHER: Comissão inline falhou para op {operation_id}: {e}", exc_info=True)
+        return None
+
+
+def _finish_commission(operation_id, trace_id, result):
+    """
+    Após o commit: registra o estágio commission_process da comissão inline.
+    Se ela falhou, despacha commission.process como antes (e o
+    commission.reconcile cobre o que ainda escapar).
+    """
+    if result is None:
+        try:
+            get_client().send_task(
+                "commission.process",
+                kwargs={"sell_operation_id": operation_id, "trace_id": trace_id},
+                queue="commission",
+            )
+            logger.info(f"PRICE_ENRICHER: Commission task dispatched for sell op {operation_id}")
+        except Exception as e:
+            logger.error(f"PRICE_ENRICHER: Failed to dispatch commission task for op {operation_id}: {e}")
+        return
+
+    if result["status"] == "skipped":
+        record_stage(trace_id, "commission_process", status="skipped",
+                     metadata={"reason": result["reason"], "inline": True})
+    else:
+        record_stage(trace_id, "commission_process", status="completed",
+                     metadata=dict({key: value for key, value in result.items() if key != "status"}, inline=True))
+
+
 @shared_task(name="price.fetch_execution_price", bind=True, max_retries=1)
 def fetch_execution_price_task(self, operation_id: int, symbol: str, executed_at: str, trace_id=None):
     """
@@ -171,7 +238,7 @@ def fetch_execution_price_task(self, operation_id: int, symbol: str, executed_at
     (consultando o oráculo de preços interno - TimescaleDB).
 
     OTIMIZAÇÕES PARA ALTA ESCALA (100+ ops/min):
-    - Usa ETA em vez de countdown (não bloqueia workers)
+    - Retries esperam em filas com TTL no broker (não ocupam memória do worker)
     - Cache em memória para symbol tracking (reduz DB hits)
     - Apenas 1 retry (2 tentativas totais, espera de 10s)
     - Falha rápida para símbolos não rastreados
@@ -233,9 +300,8 @@ def fetch_execution_price_task(self, operation_id: int, symbol: str, executed_at
             # Verifica se ainda temos tentativas restantes
             if current_retry < self.max_retries:
                 # Retry rápido: 10 segundos
-                # Usa ETA em vez de countdown para NÃO BLOQUEAR o worker
+                # Espera na fila pricing_retry_10s (TTL no broker), não na memória do worker
                 retry_delay_seconds = 10
-                eta_time = datetime.utcnow() + timedelta(seconds=retry_delay_seconds)
 
                 logger.warning(
                     f"PRICE_ENRICHER: Preço para op_id {operation_id} não encontrado. "
@@ -243,9 +309,9 @@ def fetch_execution_price_task(self, operation_id: int, symbol: str, executed_at
                     f"(Tentativa {current_retry + 1}/{self.max_retries + 1})"
                 )
 
-                # ETA libera o worker imediatamente, tarefa será re-executada no horário especificado
-                raise self.retry(
-                    eta=eta_time,
+                # A mensagem volta para 'pricing' por dead-letter quando o TTL expira
+                raise delayed_retry(
+                    self, retry_delay_seconds, "pricing",
                     exc=Exception(f"Preço ainda não encontrado no oráculo (tentativa {current_retry + 1})")
                 )
             else:
@@ -276,39 +342,29 @@ def fetch_execution_price_task(self, operation_id: int, symbol: str, executed_at
 
         query = load_query('update_operation_price.sql')
 
-        # Usa a conexão com o banco principal (PostgreSQL)
+        # Usa a conexão com o banco principal (PostgreSQL). Para vendas a
+        # comissão é calculada na mesma transação (sem reler a operação nem
+        # passar pelo broker)
+        commission = None
         with get_db_connection() as db_client:
             db_client.cursor.execute(query, (price, executed_at, operation_id))
+            row = db_client.cursor.fetchone()
+            is_sell = bool(row and row[0] and row[0].lower() == "sell")
+            if is_sell:
+                commission = _commission_inline(db_client, operation_id)
             db_client.conn.commit()
 
         logger.info(
             f"PRICE_ENRICHER: ✅ SUCESSO! Preço da op_id {operation_id} "
             f"atualizado para {price} (após {current_retry} retries)"
+            + (f" - user:{row[1]} api_key:{row[2]}" if row else "")
         )
 
         record_stage(trace_id, "price_enrichment", status="completed",
                      metadata={"price": float(price), "operation_id": operation_id})
 
-        # Dispatch commission calculation for sell operations
-        try:
-            with get_db_connection() as db_client:
-                db_client.cursor.execute(
-                    "SELECT side FROM operations WHERE id = %s", (operation_id,)
-                )
-                side_row = db_client.cursor.fetchone()
-
-            if side_row and side_row[0] and side_row[0].lower() == "sell":
-                get_client().send_task(
-                    "commission.process",
-                    kwargs={
-                        "sell_operation_id": operation_id,
-                        "trace_id": trace_id,
-                    },
-                    queue="commission",
-                )
-                logger.info(f"PRICE_ENRICHER: Commission task dispatched for sell op {operation_id}")
-        except Exception as e:
-            logger.error(f"PRICE_ENRICHER: Failed to dispatch commission task for op {operation_id}: {e}")
+        if is_sell:
+            _finish_commission(operation_id, trace_id, commission)
 
         return {
             "status": "success",
@@ -317,22 +373,24 @@ def fetch_execution_price_task(self, operation_id: int, symbol: str, executed_at
             "retries_needed": current_retry
         }
 
+    except Retry:
+        # Retry já agendado na fila de espera
+        raise
     except Exception as e:
         # Captura exceções inesperadas (ex: conexão com DB, query SQL inválida)
         # Só faz retry se ainda houver tentativas disponíveis
         current_retry = self.request.retries
 
         if current_retry < self.max_retries:
-            # Retry rápido com ETA (não bloqueia worker)
+            # Retry rápido pela fila de espera pricing_retry_15s (não ocupa o worker)
             retry_delay_seconds = 15
-            eta_time = datetime.utcnow() + timedelta(seconds=retry_delay_seconds)
 
             logger.error(
                 f"PRICE_ENRICHER: Erro inesperado ao processar op_id {operation_id}: {e}. "
                 f"Tentando novamente em {retry_delay_seconds}s... (Tentativa {current_retry + 1}/{self.max_retries + 1})",
                 exc_info=True
             )
-            raise self.retry(exc=e, eta=eta_time)
+            raise delayed_retry(self, retry_delay_seconds, "pricing", exc=e)
         else:
             # Já esgotamos as tentativas, marca como erro e desiste
             error_msg = f"Erro fatal após {self.max_retries + 1} tentativas: {str(e)}"
@@ -352,3 +410,166 @@ def fetch_execution_price_task(self, operation_id: int, symbol: str, executed_at
                 "message": error_msg,
                 "retries_attempted": current_retry + 1
             }
+
+
+# ============================================================================
+# BATCH ENRICHMENT (PRICE_BATCH_ENABLED=true)
+# ============================================================================
+# Em vez de uma task + uma conexão TimescaleDB por operação, a task agendada
+# pelo beat pega todas as operações pendentes e resolve os preços com UMA query
+# (LATERAL contra market_trades) e UMA escrita (UPDATE ... FROM (VALUES ...)).
+PRICE_BATCH_ENABLED = os.environ.get("PRICE_BATCH_ENABLED", "false").strip().lower() not in ("false", "0", "no")
+PRICE_BATCH_INTERVAL_SECONDS = float(os.environ.get("PRICE_BATCH_INTERVAL_SECONDS", "5"))
+PRICE_BATCH_SIZE = int(os.environ.get("PRICE_BATCH_SIZE", "500"))
+# 3 lotes de 5s ~ o mesmo prazo de lag do oráculo que o retry de 10s cobria
+PRICE_BATCH_MAX_ATTEMPTS = int(os.environ.get("PRICE_BATCH_MAX_ATTEMPTS", "3"))
+# O lote faz um LATERAL por operação: mais tempo que o lookup unitário
+PRICE_BATCH_STATEMENT_TIMEOUT_MS = int(os.environ.get("PRICE_BATCH_STATEMENT_TIMEOUT_MS", "10000"))
+
+
+def get_prices_from_timescale_batch(operations) -> dict:
+    """
+    Mesma regra de get_price_from_timescale (último trade até 5 minutos antes
+    da execução), para várias operações em uma única query.
+
+    Args:
+        operations: lista de (operation_id, symbol, executed_at)
+
+    Returns:
+        dict {operation_id: Decimal} apenas para as operações com preço
+    """
+    prices = {}
+    cache = get_price_cache()
+    if cache is not None:
+        for op_id, symbol, executed_at in operations:
+            price = cache.nearest_price(symbol, executed_at)
+            if price is not None:
+                prices[op_id] = price
+        operations = [op for op in operations if op[0] not in prices]
+        if not operations:
+            return prices
+
+    lookups = [
+        (op_id, symbol.replace("-", "").replace("/", "").upper(), executed_at)
+        for op_id, symbol, executed_at in operations
+    ]
+    prices.update(nearest_prices(lookups, PRICE_BATCH_STATEMENT_TIMEOUT_MS))
+    return prices
+
+
+@shared_task(name="price.enrich_pending", bind=True)
+def enrich_pending_prices_task(self):
+    """
+    Enriquece em lote as operações na fila de preço (price_enrichment_attempts
+    NOT NULL, sem preço e sem erro).
+
+    - Símbolo não rastreado: marca erro imediatamente (como a task unitária)
+    - Preço encontrado: gravado para todo o lote com um único UPDATE
+    - Sem preço: attempts + 1; ao atingir PRICE_BATCH_MAX_ATTEMPTS marca erro
+
+    FOR UPDATE SKIP LOCKED permite mais de um worker de pricing sem
+    processar a mesma operação duas vezes.
+    """
+    select_query = """
+        SELECT id, symbol, executed_at, side, signal_trace_id, price_enrichment_attempts
+        FROM operations
+        WHERE execution_price IS NULL
+          AND price_enrichment_error IS NULL
+          AND price_enrichment_attempts IS NOT NULL
+        ORDER BY id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED;
+    """
+
+    with get_db_connection() as db_client:
+        cur = db_client.cursor
+        cur.execute(select_query, (PRICE_BATCH_SIZE,))
+        pending = cur.fetchall()
+        if not pending:
+            return {"status": "success", "priced": 0, "pending": 0}
+
+        untracked, lookup = [], []
+        for op_id, symbol, executed_at, side, trace_id, attempts in pending:
+            if is_symbol_tracked(symbol):
+                lookup.append((op_id, symbol, executed_at))
+            else:
+                untracked.append(op_id)
+
+        prices = get_prices_from_timescale_batch(lookup) if lookup else {}
+
+        if prices:
+            values = ", ".join(["(%s::bigint, %s::numeric)"] * len(prices))
+            params = [item for op_id, price in prices.items() for item in (op_id, price)]
+            cur.execute(
+                f"""
+                UPDATE operations o
+                SET execution_price = v.price, updated_at = NOW()
+                FROM (VALUES {values}) AS v(id, price)
+                WHERE o.id = v.id;
+                """,
+                params,
+            )
+
+        missed = [op_id for op_id, _, _ in lookup if op_id not in prices]
+        exhausted = []
+        if missed:
+            cur.execute(
+                """
+                UPDATE operations
+                SET price_enrichment_attempts = price_enrichment_attempts + 1
+                WHERE id = ANY(%s)
+                RETURNING id, price_enrichment_attempts;
+                """,
+                (missed,),
+            )
+            exhausted = [op_id for op_id, attempts in cur.fetchall() if attempts >= PRICE_BATCH_MAX_ATTEMPTS]
+
+        failures = {op_id: "symbol_not_tracked" for op_id in untracked}
+        failures.update({op_id: "price_not_found_after_retries" for op_id in exhausted})
+        if failures:
+            cur.execute(
+                """
+                UPDATE operations
+                SET execution_price = NULL, price_enrichment_error = %s, updated_at = NOW()
+                WHERE id = ANY(%s);
+                """,
+                (
+                    f"Preço não encontrado em lote (símbolo não rastreado ou após "
+                    f"{PRICE_BATCH_MAX_ATTEMPTS} tentativas sem trades nos 5 minutos anteriores).",
+                    list(failures),
+                ),
+            )
+
+        # Comissão das vendas precificadas, na mesma transação
+        sides = {row[0]: row[3] for row in pending}
+        commissions = {
+            op_id: _commission_inline(db_client, op_id)
+            for op_id in prices
+            if sides[op_id] and sides[op_id].lower() == "sell"
+        }
+
+        db_client.conn.commit()
+
+    logger.info(
+        f"PRICE_ENRICHER: Lote processado - {len(pending)} pendentes, {len(prices)} precificadas, "
+        f"{len(missed) - len(exhausted)} aguardando, {len(failures)} com erro"
+    )
+
+    # Tracing após o commit (não segura o lote)
+    by_id = {row[0]: row for row in pending}
+    for op_id, price in prices.items():
+        trace_id = by_id[op_id][4]
+        record_stage(trace_id, "price_enrichment", status="completed",
+                     metadata={"price": float(price), "operation_id": op_id, "batched": True})
+        if op_id in commissions:
+            _finish_commission(op_id, trace_id, commissions[op_id])
+
+    for op_id, error in failures.items():
+        record_stage(by_id[op_id][4], "price_enrichment", status="failed", error=error)
+
+    return {
+        "status": "success",
+        "priced": len(prices),
+        "pending": len(missed) - len(exhausted),
+        "failed": len(failures),
+    }
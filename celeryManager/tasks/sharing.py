@@ -21,7 +21,7 @@ def process_sharing_operations(self, data):
                          error="Missing share_id or user_id")
             return {"status": "error", "message": "Missing share_id or user_id"}
 
-        result = execute_shared_operations(share_id, user_id, symbol, side)
+        result = execute_shared_operations(share_id, user_id, symbol, side, order_key=trace_id)
 
         if result.get("status") == "success":
             record_stage(trace_id, "sharing", status="completed",
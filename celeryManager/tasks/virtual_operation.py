@@ -12,20 +12,33 @@ metrics (% return, cycle count) need a record of every signal that *should*
 have been executed, regardless of whether the owner had funds, ran the bot,
 or whether the exchange was reachable. Virtuals provide that record.
 
-Pricing is enriched asynchronously by `virtual.enrich_price` using
+With VIRTUAL_RECORD_BATCH_ENABLED=true signals go to the `virtual_record`
+queue instead, drained by the batching recorder (celeryManager/virtual_recorder.py);
+both paths write through `record_virtual_batch`.
+
+Pricing is enriched asynchronously by `virtual.enrich_batch` (one task per
+recorded batch; `virtual.enrich_price` remains for single operations) using
 TimescaleDB market_trades. If the symbol isn't tracked yet, the enrich task
 auto-adds it to exchange_symbols so future signals get priced; the current
 op is left with execution_price=NULL and status='enrichment_failed'.
+
+Pricing also folds every closed position it completes into the per-instance
+summary virtual_strategy_performance (source/virtual_performance.py).
 """
 
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 
 from celery import shared_task
 from celery.exceptions import Retry
 
+from celeryManager.retry_queues import delayed_retry, retry_queue_name
 from celeryManager.tasks.base import logger
 from source.celery_client import get_client
-from source.context import get_db_connection, get_timescale_db_connection
+from source.context import get_db_connection
+from source.outbox import TaskDispatch
+from source.price_cache import get_price_cache
+from source.timescale import nearest_price, nearest_prices
+from source.virtual_performance import apply_closed_cycles
 
 
 # ============================================================================
@@ -75,98 +88,19 @@ def record_virtual_operation(self, signal):
     the bottom logs and returns rather than re-raising.
     """
     instance_id = signal.get("instance_id")
-    user_id = signal.get("user_id")
     symbol = signal.get("symbol")
     side = (signal.get("side") or "").lower()
-    trace_id = signal.get("trace_id")
 
     log_prefix = f"[VirtualOp][Instance: {instance_id}][{symbol}][{side}]"
 
-    if side not in ("buy", "sell"):
-        logger.warning(f"{log_prefix} Invalid side, skipping virtual record")
-        return {"status": "skipped", "reason": "invalid_side"}
-
-    if not (instance_id and user_id and symbol):
-        logger.warning(f"{log_prefix} Missing required signal fields, skipping")
-        return {"status": "skipped", "reason": "missing_fields"}
-
-    now = datetime.now(timezone.utc)
+    skip_reason = validate_signal(signal)
+    if skip_reason:
+        logger.warning(f"{log_prefix} Skipping virtual record: {skip_reason}")
+        return {"status": "skipped", "reason": skip_reason}
 
     try:
-        with get_db_connection() as db:
-            # 1) Insert the virtual operation row (price NULL — enriched async)
-            db.cursor.execute(
-                """
-                INSERT INTO virtual_operations
-                    (date, symbol, side, status, instance_id, user_id, signal_trace_id, created_at, updated_at)
-                VALUES
-                    (%s, %s, %s, 'pending', %s, %s, %s, %s, %s)
-                RETURNING id;
-                """,
-                (now, symbol, side, instance_id, user_id, trace_id, now, now),
-            )
-            virtual_op_id = db.cursor.fetchone()[0]
-
-            # 2) FIFO position pairing — simplest possible
-            if side == "buy":
-                db.cursor.execute(
-                    """
-                    INSERT INTO virtual_position_entries
-                        (operation_id, instance_id, user_id, symbol,
-                         base_currency, base_qty, status, created_at)
-                    VALUES
-                        (%s, %s, %s, %s, %s, 1, 'open', %s);
-                    """,
-                    (
-                        virtual_op_id,
-                        instance_id,
-                        user_id,
-                        symbol,
-                        _derive_base_currency(symbol),
-                        now,
-                    ),
-                )
-            else:  # sell — close the oldest open entry for this instance+symbol
-                db.cursor.execute(
-                    """
-                    UPDATE virtual_position_entries
-                    SET status = 'closed',
-                        sell_operation_id = %s,
-                        closed_at = %s
-                    WHERE id = (
-                        SELECT id FROM virtual_position_entries
-                        WHERE instance_id = %s
-                          AND symbol = %s
-                          AND status = 'open'
-                        ORDER BY created_at ASC
-                        LIMIT 1
-                        FOR UPDATE SKIP LOCKED
-                    );
-                    """,
-                    (virtual_op_id, now, instance_id, symbol),
-                )
-                if db.cursor.rowcount == 0:
-                    logger.info(
-                        f"{log_prefix} sell signal with no open virtual position to close"
-                    )
-
-            db.conn.commit()
-
-        # 3) Queue async price enrichment (non-blocking; failures here don't matter)
-        try:
-            get_client().send_task(
-                "virtual.enrich_price",
-                kwargs={
-                    "virtual_operation_id": virtual_op_id,
-                    "symbol": symbol,
-                    "executed_at": now.isoformat(),
-                    "trace_id": trace_id,
-                },
-                queue="virtual",
-            )
-        except Exception as e:
-            logger.warning(f"{log_prefix} Failed to dispatch enrich_price: {e}")
-
+        recorded = record_virtual_batch([dict(signal, recorded_at=datetime.now(timezone.utc))])
+        virtual_op_id = recorded[0]["virtual_operation_id"]
         logger.info(
             f"{log_prefix} Recorded virtual operation id={virtual_op_id}"
         )
@@ -181,28 +115,219 @@ def record_virtual_operation(self, signal):
         return {"status": "error", "error": str(e)}
 
 
+def validate_signal(signal):
+    """Reason to skip `signal`, or None if it can be recorded."""
+    if (signal.get("side") or "").lower() not in ("buy", "sell"):
+        return "invalid_side"
+    if not (signal.get("instance_id") and signal.get("user_id") and signal.get("symbol")):
+        return "missing_fields"
+    return None
+
+
+def record_virtual_batch(signals):
+    """
+    Record many virtual signals in one transaction + one enrichment task.
+
+    Signals are applied in list order, so FIFO pairing per instance+symbol is
+    the same as recording them one by one: a sell closes the oldest open entry
+    in the DB first, then buys earlier in the same batch (those are inserted
+    already closed). Every write is a single multi-row statement:
+
+      1. reserve the virtual_operations ids (nextval, in signal order)
+      2. lock the open entries the batch's sells can close (SKIP LOCKED)
+      3. INSERT all virtual_operations
+      4. INSERT the new virtual_position_entries (open or already closed)
+      5. UPDATE the existing entries closed by this batch
+      6. stage virtual.enrich_batch in the task outbox (source/outbox.py)
+
+    Args:
+        signals: validated signal dicts (see record_virtual_operation) with
+            `recorded_at`, the timestamp of the virtual trade
+
+    Returns:
+        list: {"virtual_operation_id", "instance_id", "side", "closes_operation_id"}
+            per signal; closes_operation_id is the buy a sell closed, if any
+    """
+    if not signals:
+        return []
+
+    sells_per_pair = {}
+    for signal in signals:
+        if signal["side"].lower() == "sell":
+            pair = (signal["instance_id"], signal["symbol"])
+            sells_per_pair[pair] = sells_per_pair.get(pair, 0) + 1
+
+    with get_db_connection() as db:
+        cur = db.cursor
+        cur.execute(
+            "SELECT nextval(pg_get_serial_sequence('virtual_operations', 'id')) "
+            "FROM generate_series(1, %s);",
+            (len(signals),),
+        )
+        op_ids = sorted(row[0] for row in cur.fetchall())
+
+        # Oldest open entries per instance+symbol, at most one per sell
+        open_entries = {}
+        if sells_per_pair:
+            pairs = list(sells_per_pair.items())
+            cur.execute(
+                """
+                SELECT e.id, e.operation_id, p.instance_id, p.symbol
+                FROM unnest(%s::int[], %s::text[], %s::int[]) AS p(instance_id, symbol, n)
+                CROSS JOIN LATERAL (
+                    SELECT id, operation_id, created_at FROM virtual_position_entries
+                    WHERE instance_id = p.instance_id
+                      AND symbol = p.symbol
+                      AND status = 'open'
+                    ORDER BY created_at ASC
+                    LIMIT p.n
+                    FOR UPDATE SKIP LOCKED
+                ) e
+                ORDER BY e.created_at ASC;
+                """,
+                (
+                    [instance_id for (instance_id, _), _ in pairs],
+                    [symbol for (_, symbol), _ in pairs],
+                    [n for _, n in pairs],
+                ),
+            )
+            for entry_id, buy_op_id, instance_id, symbol in cur.fetchall():
+                open_entries.setdefault((instance_id, symbol), []).append((entry_id, buy_op_id))
+
+        # FIFO in memory: existing open entries first, then this batch's buys
+        fifo = {pair: list(entries) for pair, entries in open_entries.items()}
+        new_entries = {}   # buy op id -> [signal, sell op id, closed_at]
+        closed_existing = []  # (entry id, sell op id, closed_at)
+        recorded = []
+        for op_id, signal in zip(op_ids, signals):
+            side = signal["side"].lower()
+            pair = (signal["instance_id"], signal["symbol"])
+            closes_operation_id = None
+            if side == "buy":
+                new_entries[op_id] = [signal, None, None]
+                fifo.setdefault(pair, []).append((None, op_id))  # no entry id yet
+            elif fifo.get(pair):
+                entry_id, closes_operation_id = fifo[pair].pop(0)
+                if entry_id is not None:
+                    closed_existing.append((entry_id, op_id, signal["recorded_at"]))
+                else:
+                    new_entries[closes_operation_id][1:] = [op_id, signal["recorded_at"]]
+            recorded.append({
+                "virtual_operation_id": op_id,
+                "instance_id": signal["instance_id"],
+                "side": side,
+                "closes_operation_id": closes_operation_id,
+            })
+
+        cur.execute(
+            """
+            INSERT INTO virtual_operations
+                (id, date, symbol, side, status, instance_id, user_id, signal_trace_id, created_at, updated_at)
+            SELECT id, recorded_at, symbol, side, 'pending', instance_id, user_id, trace_id, recorded_at, recorded_at
+            FROM unnest(%s::int[], %s::timestamptz[], %s::text[], %s::text[], %s::int[], %s::int[], %s::text[])
+                 AS v(id, recorded_at, symbol, side, instance_id, user_id, trace_id);
+            """,
+            (
+                op_ids,
+                [s["recorded_at"] for s in signals],
+                [s["symbol"] for s in signals],
+                [s["side"].lower() for s in signals],
+                [s["instance_id"] for s in signals],
+                [s["user_id"] for s in signals],
+                [s.get("trace_id") for s in signals],
+            ),
+        )
+
+        if new_entries:
+            rows = [(op_id, *entry) for op_id, entry in new_entries.items()]
+            cur.execute(
+                """
+                INSERT INTO virtual_position_entries
+                    (operation_id, instance_id, user_id, symbol, base_currency, base_qty,
+                     status, sell_operation_id, created_at, closed_at)
+                SELECT operation_id, instance_id, user_id, symbol, base_currency, 1,
+                       CASE WHEN sell_operation_id IS NULL THEN 'open' ELSE 'closed' END,
+                       sell_operation_id, created_at, closed_at
+                FROM unnest(%s::int[], %s::int[], %s::int[], %s::text[], %s::text[],
+                            %s::int[], %s::timestamptz[], %s::timestamptz[])
+                     AS n(operation_id, instance_id, user_id, symbol, base_currency,
+                          sell_operation_id, created_at, closed_at);
+                """,
+                (
+                    [op_id for op_id, _, _, _ in rows],
+                    [signal["instance_id"] for _, signal, _, _ in rows],
+                    [signal["user_id"] for _, signal, _, _ in rows],
+                    [signal["symbol"] for _, signal, _, _ in rows],
+                    [_derive_base_currency(signal["symbol"]) for _, signal, _, _ in rows],
+                    [sell_id for _, _, sell_id, _ in rows],
+                    [signal["recorded_at"] for _, signal, _, _ in rows],
+                    [closed_at for _, _, _, closed_at in rows],
+                ),
+            )
+
+        if closed_existing:
+            cur.execute(
+                """
+                UPDATE virtual_position_entries e
+                SET status = 'closed',
+                    sell_operation_id = c.sell_operation_id,
+                    closed_at = c.closed_at
+                FROM unnest(%s::int[], %s::int[], %s::timestamptz[])
+                     AS c(id, sell_operation_id, closed_at)
+                WHERE e.id = c.id;
+                """,
+                (
+                    [entry_id for entry_id, _, _ in closed_existing],
+                    [sell_id for _, sell_id, _ in closed_existing],
+                    [closed_at for _, _, closed_at in closed_existing],
+                ),
+            )
+
+        # One async price enrichment for the whole batch, committed with it
+        dispatch = TaskDispatch()
+        dispatch.add(
+            "virtual.enrich_batch",
+            {
+                "operations": [
+                    [op_id, signal["symbol"], signal["recorded_at"].isoformat(), signal.get("trace_id")]
+                    for op_id, signal in zip(op_ids, signals)
+                ],
+            },
+            queue="virtual",
+        )
+        dispatch.stage(db)
+
+        db.conn.commit()
+
+    dispatch.publish()
+
+    unpaired = sum(1 for r in recorded if r["side"] == "sell" and r["closes_operation_id"] is None)
+    if unpaired:
+        logger.info(f"[VirtualOp] {unpaired} sell signal(s) with no open virtual position to close")
+
+    return recorded
+
+
 # ============================================================================
 # Task: virtual.enrich_price
 # ============================================================================
 
 def _get_price_from_timescale(symbol: str, executed_at_str: str):
     """Look up the most-recent market_trades price for `symbol` at-or-before
-    the given timestamp, within a 5-minute safety window."""
+    the given timestamp, within a 5-minute safety window. Served from the
+    local last-price buffer when it covers the timestamp."""
     normalized = _normalize_symbol(symbol)
-    query = """
-        SELECT price
-        FROM market_trades
-        WHERE symbol = %s
-          AND timestamp <= %s::timestamptz
-          AND timestamp >= (%s::timestamptz - '5 minutes'::interval)
-        ORDER BY timestamp DESC
-        LIMIT 1;
-    """
+    cache = get_price_cache()
+    if cache is not None:
+        try:
+            price = cache.nearest_price(normalized, executed_at_str)
+            if price is not None:
+                return price
+        except Exception as e:
+            logger.warning(f"VIRTUAL_ENRICHER: Price cache lookup failed for {symbol}: {e}")
+
     try:
-        with get_timescale_db_connection() as ts_cursor:
-            ts_cursor.execute(query, (normalized, executed_at_str, executed_at_str))
-            row = ts_cursor.fetchone()
-            return row[0] if row else None
+        return nearest_price(normalized, executed_at_str)
     except Exception as e:
         logger.error(f"VIRTUAL_ENRICHER: TimescaleDB lookup failed for {symbol}: {e}")
         return None
@@ -252,6 +377,20 @@ def _mark_enrichment_failed(virtual_operation_id: int, error: str):
         )
 
 
+def _apply_performance(db, operation_ids):
+    """Fold the cycles these prices completed into virtual_strategy_performance.
+
+    Runs in a savepoint of the pricing transaction: a failure here never
+    loses the price; the cycles stay pending for virtual.apply_performance."""
+    try:
+        with db.conn.transaction():
+            applied = apply_closed_cycles(db, operation_ids)
+        if applied:
+            logger.info(f"VIRTUAL_PERFORMANCE: Folded {applied} closed cycle(s)")
+    except Exception as e:
+        logger.error(f"VIRTUAL_PERFORMANCE: Failed to fold cycles for ops {operation_ids}: {e}")
+
+
 @shared_task(name="virtual.enrich_price", bind=True, max_retries=1)
 def enrich_virtual_price(self, virtual_operation_id, symbol, executed_at, trace_id=None):
     """
@@ -270,12 +409,12 @@ def enrich_virtual_price(self, virtual_operation_id, symbol, executed_at, trace_
         if price is None:
             current_retry = self.request.retries
             if current_retry < self.max_retries:
-                eta = datetime.utcnow() + timedelta(seconds=10)
                 logger.warning(
                     f"{log_prefix} Price not in TimescaleDB yet, retrying in 10s "
                     f"(attempt {current_retry + 1}/{self.max_retries + 1})"
                 )
-                raise self.retry(eta=eta, exc=Exception("price_not_yet_ingested"))
+                # Parks in virtual_retry_10s, dead-lettered back to 'virtual'
+                raise delayed_retry(self, 10, "virtual", exc=Exception("price_not_yet_ingested"))
 
             # Final miss — auto-track for future, mark this one failed
             _ensure_symbol_tracked(symbol)
@@ -300,6 +439,7 @@ def enrich_virtual_price(self, virtual_operation_id, symbol, executed_at, trace_
                 """,
                 (price, virtual_operation_id),
             )
+            _apply_performance(db, [virtual_operation_id])
             db.conn.commit()
 
         logger.info(f"{log_prefix} ✅ Priced at {price}")
@@ -312,3 +452,108 @@ def enrich_virtual_price(self, virtual_operation_id, symbol, executed_at, trace_
         logger.error(f"{log_prefix} Unexpected error: {e}", exc_info=True)
         _mark_enrichment_failed(virtual_operation_id, f"unexpected: {e}")
         return {"status": "error", "error": str(e)}
+
+
+@shared_task(name="virtual.enrich_batch", bind=True)
+def enrich_virtual_prices_batch(self, operations, attempt=0):
+    """
+    Batched virtual.enrich_price for the operations of one recorded batch.
+
+    Args:
+        operations: list of [virtual_operation_id, symbol, executed_at, trace_id]
+        attempt: 0 on first run, 1 on the retry (same 10s/2 attempts policy)
+
+    Prices come from the local buffer or one batched TimescaleDB query and
+    are written with a single UPDATE. Misses are re-queued once through the
+    virtual 10s parking queue; final misses are auto-tracked and marked
+    failed together.
+    """
+    prices = {}
+    cache = get_price_cache()
+    if cache is not None:
+        try:
+            for op_id, symbol, executed_at, _ in operations:
+                price = cache.nearest_price(_normalize_symbol(symbol), executed_at)
+                if price is not None:
+                    prices[op_id] = price
+        except Exception as e:
+            logger.warning(f"VIRTUAL_ENRICHER: Price cache lookup failed: {e}")
+
+    lookups = [
+        (op_id, _normalize_symbol(symbol), executed_at)
+        for op_id, symbol, executed_at, _ in operations
+        if op_id not in prices
+    ]
+    try:
+        prices.update(nearest_prices(lookups))
+    except Exception as e:
+        logger.error(f"VIRTUAL_ENRICHER: Batched TimescaleDB lookup failed: {e}")
+
+    if prices:
+        with get_db_connection() as db:
+            db.cursor.execute(
+                """
+                UPDATE virtual_operations v
+                SET execution_price = p.price,
+                    status = 'priced',
+                    updated_at = NOW()
+                FROM unnest(%s::int[], %s::numeric[]) AS p(id, price)
+                WHERE v.id = p.id;
+                """,
+                (list(prices), list(prices.values())),
+            )
+            _apply_performance(db, list(prices))
+            db.conn.commit()
+
+    missing = [op for op in operations if op[0] not in prices]
+    if missing and attempt < 1:
+        # Parks in virtual_retry_10s, dead-lettered back to 'virtual'
+        get_client().send_task(
+            "virtual.enrich_batch",
+            kwargs={"operations": missing, "attempt": attempt + 1},
+            queue=retry_queue_name("virtual", 10),
+        )
+        logger.warning(f"VIRTUAL_ENRICHER: {len(missing)} prices not ingested yet, retrying in 10s")
+    elif missing:
+        for symbol in {symbol for _, symbol, _, _ in missing}:
+            _ensure_symbol_tracked(symbol)
+        error_msg = (
+            "Price not found in TimescaleDB after 2 attempts. Symbol auto-added "
+            "to exchange_symbols; future signals should be priced once the oracle picks it up."
+        )
+        try:
+            with get_db_connection() as db:
+                db.cursor.execute(
+                    """
+                    UPDATE virtual_operations
+                    SET status = 'enrichment_failed',
+                        price_enrichment_error = %s,
+                        updated_at = NOW()
+                    WHERE id = ANY(%s);
+                    """,
+                    (error_msg, [op[0] for op in missing]),
+                )
+                db.conn.commit()
+        except Exception as e:
+            logger.error(f"VIRTUAL_ENRICHER: Failed to mark {len(missing)} ops as failed: {e}")
+
+    logger.info(
+        f"VIRTUAL_ENRICHER: Batch of {len(operations)} ops — priced {len(prices)}, missing {len(missing)}"
+    )
+    return {"status": "success", "priced": len(prices), "missing": len(missing)}
+
+
+@shared_task(name="virtual.apply_performance")
+def apply_virtual_performance():
+    """
+    Fold every pending closed cycle into virtual_strategy_performance, oldest
+    first. Backfills history after the migration and, on the beat schedule
+    (virtual-performance-catchup), catches up cycles whose fold failed during
+    enrichment or whose buy and sell were priced concurrently.
+    """
+    with get_db_connection() as db:
+        applied = apply_closed_cycles(db)
+        db.conn.commit()
+    if applied:
+        logger.info(f"VIRTUAL_PERFORMANCE: Catch-up folded {applied} closed cycle(s)")
+    return {"status": "success", "applied": applied}
@@ -1,9 +1,40 @@
+import os
 from celery import shared_task
+from celery.signals import worker_process_init
+from celeryManager.retry_queues import delay_queue_name
 from celeryManager.tasks.base import logger
 from interface.instance import get_instance_status, execute_instance_operation
 from interface.webhook_auth import insert_data_to_db
+from source.idempotency import COMPLETED, get_idempotency_store
+from source.instance_state import get_state_engine
+from source.shard_router import get_shard_router
 from source.tracing import record_stage
 
+# Merge near-simultaneous indicator signals of multi-indicator strategies into
+# one evaluation per (instance, side). 0 disables coalescing.
+SIGNAL_COALESCE_WINDOW_MS = int(os.environ.get("SIGNAL_COALESCE_WINDOW_MS", "0"))
+
+# Set on shard workers (docker-compose): tasks of instances that moved to
+# another shard are handed over instead of processed here.
+LOGIC_SHARD_INDEX = os.environ.get("LOGIC_SHARD_INDEX", "").strip()
+
+
+def _moved_queue(instance_id, handed_over):
+    """Shard queue now owning the instance, if this shard worker no longer does."""
+    if not LOGIC_SHARD_INDEX or handed_over:
+        return None
+    return get_shard_router().moved_queue(instance_id, int(LOGIC_SHARD_INDEX))
+
+
+@worker_process_init.connect
+def _warm_instance_state(**kwargs):
+    """Rebuild the in-memory state engine from the DB when a worker process starts."""
+    try:
+        get_state_engine().warm()
+    except Exception as e:
+        # Not fatal: states are rebuilt lazily on first use.
+        logger.error(f"[StateEngine] Warm-up failed: {e}", exc_info=True)
+
 
 @shared_task(name="webhook.processor", bind=True, acks_late=True, reject_on_worker_lost=True)
 def process_webhook(self, signal_data, side, original_key):
@@ -19,6 +50,11 @@ def process_webhook(self, signal_data, side, original_key):
     The refactored architecture uses structured DTOs (OperationContext) internally
     to pass data cleanly through the execution pipeline, replacing scattered variables.
 
+    Redelivery (acks_late): progress is checkpointed per trace_id in the
+    idempotency store, so a re-run returns the stored result of a finished
+    run and never persists the same signal twice. The trade dispatch itself
+    is guarded by the webhook_data claim.
+
     Args:
         signal_data: Dict containing instance_id, user_id, symbol, indicator_id
         side: 'buy' or 'sell'
@@ -39,6 +75,18 @@ def process_webhook(self, signal_data, side, original_key):
         log_prefix = f"[TaskID: {task_id}] [TraceID: {trace_id}] [Instance: {instance_id}] [User: {user_id}] [Indicator: {indicator_id}]"
     logger.info(f"{log_prefix} Starting webhook processing for {side} signal on {symbol}")
 
+    # Handed over at most once, so shards with briefly different ring views
+    # can't bounce a signal between them
+    moved_queue = _moved_queue(instance_id, signal_data.get('shard_handover'))
+    if moved_queue:
+        logger.info(f"{log_prefix} Instance moved to {moved_queue}; handing the signal over.")
+        process_webhook.apply_async(
+            kwargs={"signal_data": {**signal_data, "shard_handover": True},
+                    "side": side, "original_key": original_key},
+            queue=moved_queue
+        )
+        return {"status": "rerouted", "queue": moved_queue}
+
     record_stage(trace_id, "webhook_processor", status="started", celery_task_id=task_id)
 
     try:
@@ -58,40 +106,131 @@ def process_webhook(self, signal_data, side, original_key):
                          is_terminal=True)
             return {"status": "ignored", "message": f"Instance not running (status={status})"}
 
-        # Persist webhook data to database
-        logger.info(f"{log_prefix} Instance active. Persisting webhook data to DB.")
-        db_data = {
-            "key": original_key,
-            "symbol": symbol,
-            "side": side,
-            "indicator_id": signal_data.get('indicator_id'),
-            "instance_id": instance_id
-        }
-        insert_data_to_db(db_data)
+        store = get_idempotency_store()
+        checkpoint = store.get(trace_id, "webhook_processor") if trace_id else None
+        if checkpoint and checkpoint["status"] == COMPLETED:
+            logger.info(f"{log_prefix} Redelivered after completion; returning stored result.")
+            return checkpoint["result"]
+
+        if checkpoint and (checkpoint["result"] or {}).get("webhook_id"):
+            # Redelivered after the signal was persisted: don't insert it again
+            webhook_id = checkpoint["result"]["webhook_id"]
+            logger.info(f"{log_prefix} Redelivered; webhook data {webhook_id} already persisted.")
+        else:
+            # Persist webhook data to database
+            logger.info(f"{log_prefix} Instance active. Persisting webhook data to DB.")
+            db_data = {
+                "key": original_key,
+                "symbol": symbol,
+                "side": side,
+                "indicator_id": signal_data.get('indicator_id'),
+                "instance_id": instance_id
+            }
+            webhook_id = insert_data_to_db(db_data)
+            if trace_id:
+                store.put(trace_id, "webhook_processor", "persisted", {"webhook_id": webhook_id})
+        get_state_engine().record_signal(instance_id, webhook_id, symbol, side, signal_data.get('indicator_id'))
 
         logger.info(f"{log_prefix} Webhook data persisted. Executing operation.")
-        result = execute_instance_operation(instance_id, user_id, side, trace_id=trace_id)
+        result = execute_instance_operation(
+            instance_id, user_id, side, trace_id=trace_id,
+            coalesce_window_ms=SIGNAL_COALESCE_WINDOW_MS
+        )
         logger.info(f"{log_prefix} Operation completed. Result: {result}")
 
-        # Record processor completion based on result
-        result_status = result.get("status", "")
-        if result_status in ("interval_not_met", "insufficient_condition"):
-            record_stage(trace_id, "webhook_processor", status="skipped",
-                         metadata={"result": result_status,
-                                   "reason": result.get("reason", result.get("message", ""))},
-                         is_terminal=True)
-        elif result_status == "success":
+        if result.get("status") == "coalesce_scheduled":
+            # First signal of the window: evaluate once every indicator of the
+            # bar had the chance to land in webhook_data. The evaluation waits
+            # in the broker (parking queue with the window as TTL), not as a
+            # countdown reserved in a worker.
+            target_queue = get_shard_router().route(instance_id) or "logic"
+            evaluate_coalesced_signals.apply_async(
+                kwargs={"instance_id": instance_id, "user_id": user_id,
+                        "side": side, "trace_id": trace_id},
+                queue=delay_queue_name(target_queue, SIGNAL_COALESCE_WINDOW_MS)
+            )
             record_stage(trace_id, "webhook_processor", status="completed",
-                         metadata={"operation_task_id": result.get("operation_task_id")})
-        else:
-            record_stage(trace_id, "webhook_processor", status="failed",
-                         error=result.get("error", result.get("message", "")),
-                         is_terminal=True)
-
+                         metadata={"result": "coalesce_scheduled",
+                                   "window_ms": SIGNAL_COALESCE_WINDOW_MS})
+            if trace_id:
+                store.put(trace_id, "webhook_processor", COMPLETED, result)
+            return result
+
+        _record_result(trace_id, "webhook_processor", result)
+        if trace_id:
+            store.put(trace_id, "webhook_processor", COMPLETED, result)
         return result
 
     except Exception as e:
         logger.error(f"{log_prefix} Exception during webhook processing: {e}", exc_info=True)
         record_stage(trace_id, "webhook_processor", status="failed",
                      error=str(e), is_terminal=True)
-        raise
\ No newline at end of file
+        raise
+
+
+@shared_task(name="webhook.evaluate_coalesced", bind=True, acks_late=True, reject_on_worker_lost=True)
+def evaluate_coalesced_signals(self, instance_id, user_id, side, trace_id=None, shard_handover=False):
+    """
+    Single condition evaluation at the end of a coalescing window.
+
+    Every signal of the window is already in webhook_data, so one interval +
+    condition check (and at most one dispatch) covers all of them.
+    """
+    log_prefix = f"[TaskID: {self.request.id}] [Instance: {instance_id}] [User: {user_id}]"
+
+    moved_queue = _moved_queue(instance_id, shard_handover)
+    if moved_queue:
+        logger.info(f"{log_prefix} Instance moved to {moved_queue}; handing the evaluation over.")
+        evaluate_coalesced_signals.apply_async(
+            kwargs={"instance_id": instance_id, "user_id": user_id, "side": side,
+                    "trace_id": trace_id, "shard_handover": True},
+            queue=moved_queue
+        )
+        return {"status": "rerouted", "queue": moved_queue}
+
+    logger.info(f"{log_prefix} Evaluating coalesced {side} signals.")
+
+    record_stage(trace_id, "coalesced_evaluation", status="started", celery_task_id=self.request.id)
+
+    store = get_idempotency_store()
+    checkpoint = store.get(trace_id, "coalesced_evaluation") if trace_id else None
+    if checkpoint and checkpoint["status"] == COMPLETED:
+        logger.info(f"{log_prefix} Redelivered after completion; returning stored result.")
+        return checkpoint["result"]
+
+    try:
+        if get_instance_status(instance_id, user_id) != 2:
+            logger.info(f"{log_prefix} Instance no longer running. Skipping evaluation.")
+            record_stage(trace_id, "coalesced_evaluation", status="skipped",
+                         metadata={"reason": "Instance not running"}, is_terminal=True)
+            return {"status": "ignored", "message": "Instance not running"}
+
+        result = execute_instance_operation(instance_id, user_id, side, trace_id=trace_id)
+        logger.info(f"{log_prefix} Coalesced evaluation completed. Result: {result}")
+        _record_result(trace_id, "coalesced_evaluation", result)
+        if trace_id:
+            store.put(trace_id, "coalesced_evaluation", COMPLETED, result)
+        return result
+
+    except Exception as e:
+        logger.error(f"{log_prefix} Exception during coalesced evaluation: {e}", exc_info=True)
+        record_stage(trace_id, "coalesced_evaluation", status="failed",
+                     error=str(e), is_terminal=True)
+        raise
+
+
+def _record_result(trace_id, stage, result):
+    """Record a stage outcome from an execute_instance_operation result."""
+    result_status = result.get("status", "")
+    if result_status in ("interval_not_met", "insufficient_condition", "coalesced"):
+        record_stage(trace_id, stage, status="skipped",
+                     metadata={"result": result_status,
+                               "reason": result.get("reason", result.get("message", ""))},
+                     is_terminal=True)
+    elif result_status == "success":
+        record_stage(trace_id, stage, status="completed",
+                     metadata={"operation_task_id": result.get("operation_task_id")})
+    else:
+        record_stage(trace_id, stage, status="failed",
+                     error=result.get("error", result.get("message", "")),
+                     is_terminal=True)
@@ -1,10 +1,17 @@
+import os
 from celery import shared_task
 from celeryManager.tasks.base import logger
 from interface.webhook_auth import authenticate_signal, authenticate_user_key
 from celeryManager.tasks.webhook_processor import process_webhook as process_webhook_task
 from celeryManager.tasks.panic_processor import process_panic_signal as process_panic_task
+from interface.deferred_signals import schedule_deferred_signal
+from source.shard_router import get_shard_router
 from source.tracing import create_trace, record_stage
 
+# Delayed signals go to the durable deferred scheduler instead of Celery
+# countdown tasks (held in worker memory against prefetch).
+DEFERRED_SCHEDULER_ENABLED = os.environ.get("DEFERRED_SCHEDULER_ENABLED", "false").strip().lower() not in ("false", "0", "no")
+
 
 @shared_task(name="webhook.receipt", bind=True)
 def process_webhook_receipt(self, data):
@@ -101,18 +108,31 @@ def _handle_instance_pattern(log_prefix, key, side, trace_id=None):
 
     delay_seconds = signal_data.get('delay_seconds')
 
-    if delay_seconds and delay_seconds > 0:
-        logger.info(f"{log_prefix} {signal_log} Signal authenticated. Scheduling deferred processing ({delay_seconds}s delay).")
+    # Same instance -> same shard queue, so its signals run one at a time.
+    # None keeps the task_routes default ('logic').
+    shard_queue = get_shard_router().route(signal_data['instance_id'])
+    target_queue = shard_queue or "logic"
+
+    if delay_seconds and delay_seconds > 0 and DEFERRED_SCHEDULER_ENABLED:
+        # Durable timer: released into the logic queue by the deferred scheduler
+        deferred_id = schedule_deferred_signal(
+            signal_data['instance_id'],
+            delay_seconds,
+            {"signal_data": signal_data, "side": side, "original_key": key}
+        )
+        logger.info(f"{log_prefix} {signal_log} Signal authenticated. Deferred signal {deferred_id} scheduled ({delay_seconds}s delay).")
+    elif delay_seconds and delay_seconds > 0:
+        logger.info(f"{log_prefix} {signal_log} Signal authenticated. Scheduling deferred processing ({delay_seconds}s delay) on {target_queue}.")
         process_webhook_task.apply_async(
             kwargs={"signal_data": signal_data, "side": side, "original_key": key},
-            countdown=delay_seconds
+            countdown=delay_seconds,
+            queue=shard_queue
         )
     else:
-        logger.info(f"{log_prefix} {signal_log} Signal authenticated. Delegating to logic queue.")
-        process_webhook_task.delay(
-            signal_data=signal_data,
-            side=side,
-            original_key=key
+        logger.info(f"{log_prefix} {signal_log} Signal authenticated. Delegating to {target_queue} queue.")
+        process_webhook_task.apply_async(
+            kwargs={"signal_data": signal_data, "side": side, "original_key": key},
+            queue=shard_queue
         )
 
     return {"status": "queued", "message": "Signal accepted and queued for processing."}
@@ -0,0 +1,121 @@
+"""
+Batching recorder for virtual operations.
+
+With VIRTUAL_RECORD_BATCH_ENABLED=true the manager publishes
+virtual.record_operation to the `virtual_record` queue instead of `virtual`.
+This process drains that queue and, instead of one transaction per signal,
+accumulates up to VIRTUAL_RECORD_BATCH_SIZE signals (or whatever arrived
+within VIRTUAL_RECORD_BATCH_MAX_WAIT_MS of the first one) and writes them
+with `record_virtual_batch`: a handful of multi-row statements and a single
+virtual.enrich_batch task per batch.
+
+A single consumer reads the queue in publish order and batches are applied in
+that order, so FIFO pairing per instance is the same as with the per-signal
+task. Messages are acked only after their batch committed; if the batch fails
+its signals are recorded one by one so a bad signal can't sink the others.
+Like the task, failures are logged and never retried (virtual recording must
+not hold up anything else).
+
+Run a single instance:
+    python -m celeryManager.virtual_recorder
+"""
+
+import os
+import signal
+import socket
+import time
+from datetime import datetime, timezone
+
+from celeryManager.celery_app import celery as celery_app
+from celeryManager.tasks.base import logger
+from celeryManager.tasks.virtual_operation import record_virtual_batch, validate_signal
+
+QUEUE = "virtual_record"
+BATCH_SIZE = int(os.environ.get("VIRTUAL_RECORD_BATCH_SIZE", "200"))
+MAX_WAIT_SECONDS = int(os.environ.get("VIRTUAL_RECORD_BATCH_MAX_WAIT_MS", "250")) / 1000.0
+
+
+class VirtualRecorder:
+    def __init__(self):
+        self.buffer = []  # (message, signal) in arrival order
+        self.deadline = None
+        self.running = True
+
+    def stop(self, *_):
+        self.running = False
+
+    def on_message(self, body, message):
+        # Celery protocol 2 body: [args, kwargs, embed]
+        try:
+            args, kwargs = body[0], body[1]
+            signal_data = kwargs.get("signal") or (args[0] if args else {})
+        except (TypeError, KeyError, IndexError):
+            logger.warning(f"[VirtualRecorder] Unexpected message body, dropping: {body!r}")
+            message.ack()
+            return
+
+        skip_reason = validate_signal(signal_data)
+        if skip_reason:
+            logger.warning(f"[VirtualRecorder] Skipping signal ({skip_reason}): {signal_data}")
+            message.ack()
+            return
+
+        if not self.buffer:
+            self.deadline = time.monotonic() + MAX_WAIT_SECONDS
+        self.buffer.append((message, dict(signal_data, recorded_at=datetime.now(timezone.utc))))
+
+    def flush(self):
+        batch, self.buffer = self.buffer, []
+        try:
+            record_virtual_batch([signal_data for _, signal_data in batch])
+            logger.info(f"[VirtualRecorder] Recorded batch of {len(batch)} signals")
+        except Exception as e:
+            logger.error(
+                f"[VirtualRecorder] Batch of {len(batch)} failed: {e}; recording one by one",
+                exc_info=True,
+            )
+            for _, signal_data in batch:
+                try:
+                    record_virtual_batch([signal_data])
+                except Exception as e:
+                    logger.error(f"[VirtualRecorder] Error recording virtual operation {signal_data}: {e}")
+        for message, _ in batch:
+            message.ack()
+
+    def consume(self, conn):
+        queue = celery_app.amqp.queues[QUEUE]
+        with conn.Consumer(queue, callbacks=[self.on_message], accept=["json"], prefetch_count=BATCH_SIZE * 2):
+            logger.info(
+                f"[VirtualRecorder] Consuming '{QUEUE}' (batch={BATCH_SIZE}, max_wait={MAX_WAIT_SECONDS * 1000:.0f}ms)"
+            )
+            while self.running:
+                timeout = MAX_WAIT_SECONDS
+                if self.buffer:
+                    timeout = max(self.deadline - time.monotonic(), 0.001)
+                try:
+                    conn.drain_events(timeout=timeout)
+                except socket.timeout:
+                    conn.heartbeat_check()
+                if self.buffer and (len(self.buffer) >= BATCH_SIZE or time.monotonic() >= self.deadline):
+                    self.flush()
+            if self.buffer:
+                self.flush()
+
+    def run(self):
+        while self.running:
+            try:
+                with celery_app.connection_for_read() as conn:
+                    self.consume(conn)
+            except Exception as e:
+                # Unacked messages are redelivered after reconnecting
+                logger.error(f"[VirtualRecorder] Consumer failed: {e}; reconnecting", exc_info=True)
+                self.buffer = []
+                time.sleep(1)
+        logger.info("[VirtualRecorder] Stopped")
+
+
+if __name__ == "__main__":
+    recorder = VirtualRecorder()
+    signal.signal(signal.SIGTERM, recorder.stop)
+    signal.signal(signal.SIGINT, recorder.stop)
+    recorder.run()
@@ -0,0 +1,38 @@
+import json
+
+from source.dbmanager import load_query
+from source.context import get_db_connection
+
+
+def schedule_deferred_signal(instance_id, delay_seconds, payload):
+    """
+    Persist a delayed signal; the deferred scheduler releases it when due.
+
+    Args:
+        instance_id: Instance the signal belongs to
+        delay_seconds: Delay configured on the indicator
+        payload: webhook.processor kwargs (signal_data, side, original_key)
+
+    Returns:
+        int: ID of the deferred_signals row
+    """
+    query = load_query("insert_deferred_signal.sql")
+
+    with get_db_connection() as db_client:
+        return db_client.insert_data_returning(
+            query, (instance_id, delay_seconds, json.dumps(payload))
+        )
+
+
+def load_due_deferred_signals(horizon_seconds, limit):
+    """
+    Pending deferred signals firing within `horizon_seconds`.
+
+    Returns:
+        list: (id, fire_at_ms) tuples, earliest first
+    """
+    query = load_query("select_due_deferred_signals.sql")
+
+    with get_db_connection() as db_client:
+        db_client.cursor.execute(query, (horizon_seconds, limit))
+        return db_client.cursor.fetchall()
@@ -24,7 +24,23 @@ def get_instance_status(instance_id, user_id):
         return result[0][0]
 
 
-def execute_instance_operation(instance_id, user_id, side, trace_id=None):
+def claim_coalesce_window(instance_id, side, window_ms):
+    """
+    Try to open the signal coalescing window for (instance, side).
+
+    Returns:
+        bool: True if this signal opened the window (and must schedule the
+        evaluation), False if a window is already running
+    """
+    query = load_query('claim_signal_coalesce_window.sql')
+
+    with get_db_connection() as db_client:
+        window_ends_at = db_client.insert_data_returning(query, (instance_id, side, window_ms))
+
+    return window_ends_at is not None
+
+
+def execute_instance_operation(instance_id, user_id, side, trace_id=None, coalesce_window_ms=0):
     """
     Execute a trading operation for a specific instance.
 
@@ -33,11 +49,17 @@ def execute_instance_operation(instance_id, user_id, side, trace_id=None):
     2. Builds structured DTOs (OperationContext) containing all necessary data
     3. Delegates to the operation handler for execution
 
+    With coalesce_window_ms > 0 and a multi-indicator strategy
+    (condition_limit > 1), signals of the same bar are merged: the first one
+    returns "coalesce_scheduled" (the caller evaluates once the window ends)
+    and the ones inside the window return "coalesced" without evaluating.
+
     Args:
         instance_id: The instance ID
         user_id: The user ID
         side: 'buy' or 'sell'
         trace_id: Optional trace ID for pipeline observability
+        coalesce_window_ms: Coalescing window in milliseconds (0 disables it)
 
     Returns:
         dict: Operation result with status and details
@@ -84,6 +106,18 @@ def execute_instance_operation(instance_id, user_id, side, trace_id=None):
             flat_value
         ) = strategy_result[0]
 
+        # Multi-indicator strategies: one evaluation per coalescing window
+        if coalesce_window_ms > 0 and int(condition_limit) > 1:
+            if claim_coalesce_window(instance_id, side, coalesce_window_ms):
+                return {
+                    "status": "coalesce_scheduled",
+                    "message": f"Evaluation scheduled in {coalesce_window_ms}ms"
+                }
+            return {
+                "status": "coalesced",
+                "message": "Signal recorded; evaluation already scheduled for this window"
+            }
+
         # For sell operations, always use 1 simultaneous operation
         if side == "sell":
             simultaneous_operations = 1
@@ -115,13 +149,14 @@ def execute_instance_operation(instance_id, user_id, side, trace_id=None):
         result = execute_operation(operation_context, trace_id=trace_id)
         return result
     
-def execute_shared_operations(share_id, user_id, symbol, side):
+def execute_shared_operations(share_id, user_id, symbol, side, order_key=None):
     try:
         builder = (
             OperationBuilder()
             .set_share_context(share_id, user_id)
             .set_symbol(symbol)
             .set_side(side)
+            .set_order_key(order_key)
         )
 
         all_builders = builder.fetch_sharing_info_all()
@@ -5,8 +5,10 @@ Handles panic stop (sell all positions, stop instances) and resume operations
 triggered via user-level webhook keys.
 """
 import json
+import time
 from source.dbmanager import load_query
 from source.context import get_db_connection
+from source.outbox import TaskDispatch
 from celeryManager.celery_app import celery as celery_app
 from log.log import general_logger
 
@@ -22,13 +24,24 @@ def execute_panic_stop(user_id, environment='live'):
     Scoped to a single environment — a live panic touches only live instances,
     a demo panic only demo instances.
 
+    Runs as one bulk unit instead of per-instance round trips: a single query
+    loads (and locks) every active instance with its trade details, one
+    set-based UPDATE stops them and the panic-mode record is written, in a
+    single DB transaction. The sell and sharing tasks go out only after that
+    commit, so a sell never leaves while the instances could still re-buy:
+    with OUTBOX_ENABLED they are staged in task_outbox in the same transaction
+    (both committed or neither), otherwise they are published right after the
+    commit over one broker connection.
+
     Args:
         user_id: The user ID
         environment: 'live' or 'demo'
 
     Returns:
-        dict: Result with status and details
+        dict: Result with status and details. On success includes
+              panic_to_last_order_ms (reported in the panic trace).
     """
+    started_at = time.monotonic()
     try:
         # 0. Skip if panic mode is already active
         panic_state = _get_panic_state(user_id, environment)
@@ -36,78 +49,58 @@ def execute_panic_stop(user_id, environment='live'):
             general_logger.info(f"[PanicStop] User {user_id} ({environment}) already in panic mode — skipping.")
             return {"status": "skipped", "message": "Panic mode already active"}
 
-        # 1. Get all active (running) instances for the user in this environment
-        active_instance_ids = _get_active_instance_ids(user_id, environment)
-
-        if not active_instance_ids:
-            general_logger.info(f"[PanicStop] User {user_id} has no active instances to stop.")
-            return {"status": "success", "message": "No active instances to stop", "instances_stopped": 0}
-
-        # 2. For each instance, send a sell order and stop the instance
-        sell_orders_sent = 0
-        instances_stopped = []
-
-        for instance_id in active_instance_ids:
-            # Get instance details for the sell operation
-            instance_details = _get_instance_details_for_operation(instance_id, user_id)
-
-            if instance_details:
-                # Send sell order via trade.execute_operation task
-                operation_data = {
-                    "user_id": user_id,
-                    "api_key": instance_details["api_key"],
-                    "exchange_id": instance_details["exchange_id"],
-                    "perc_balance_operation": 1,
-                    "symbol": instance_details["symbol"],
-                    "side": "sell",
-                    "instance_id": instance_id,
-                    "size_mode": "percentage",
-                    "flat_value": None
-                }
-
-                celery_app.send_task("trade.execute_operation", kwargs={"data": operation_data})
-                sell_orders_sent += 1
-                general_logger.info(f"[PanicStop] Sell order sent for user {user_id}, instance {instance_id}, symbol {instance_details['symbol']}")
-
-                # Dispatch sharing task if this instance has sharing enabled
-                if instance_details.get("share_id"):
-                    sharing_data = {
-                        "share_id": instance_details["share_id"],
-                        "user_id": user_id,
-                        "side": "sell",
-                        "symbol": instance_details["symbol"],
-                    }
-                    try:
-                        celery_app.send_task(
-                            "process_sharing_operations",
-                            kwargs={"data": sharing_data},
-                            queue="sharing"
-                        )
-                        general_logger.info(
-                            f"[PanicStop] Sharing task sent for share_id={instance_details['share_id']}, "
-                            f"instance {instance_id}"
-                        )
-                    except Exception as e:
-                        general_logger.error(
-                            f"[PanicStop] Failed to send sharing task for share_id={instance_details['share_id']}: {e}",
-                            exc_info=True
-                        )
-
-            # Stop the instance
-            _update_instance_status(instance_id, user_id, STATUS_STOPPED, starting=False)
-            instances_stopped.append(instance_id)
-            general_logger.info(f"[PanicStop] Instance {instance_id} stopped.")
-
-        # 3. Activate panic mode
-        _activate_panic_mode(user_id, environment, instances_stopped)
-
-        general_logger.info(f"[PanicStop] User {user_id} panic stop completed. {sell_orders_sent} sell orders sent, {len(instances_stopped)} instances stopped.")
+        with get_db_connection() as db_client:
+            # 1. All active (running) instances with their trade details, locked
+            instances = _get_active_instances_for_panic(db_client, user_id, environment)
+
+            if not instances:
+                db_client.conn.rollback()
+                general_logger.info(f"[PanicStop] User {user_id} has no active instances to stop.")
+                return {"status": "success", "message": "No active instances to stop", "instances_stopped": 0}
+
+            instance_ids = [instance["instance_id"] for instance in instances]
+
+            # 2. Stop every instance and activate panic mode (set-based)
+            db_client.cursor.execute(
+                load_query("update_stopping_instances.sql"),
+                (STATUS_STOPPED, instance_ids, user_id)
+            )
+            db_client.cursor.execute(
+                load_query("activate_panic_mode.sql"),
+                (user_id, environment, json.dumps(instance_ids))
+            )
+
+            # 3. Stage the sell + sharing tasks (outbox on), then commit
+            dispatch = TaskDispatch()
+            for task_name, kwargs, queue in _panic_tasks(user_id, instances):
+                dispatch.add(task_name, kwargs, queue)
+            dispatch.stage(db_client)
+
+            db_client.conn.commit()
+
+        # 4. Instances are stopped and panic mode is on: send the orders
+        if dispatch.staged:
+            sell_orders_sent = sum(1 for name, _, _ in dispatch.tasks if name == "trade.execute_operation")
+            sharing_tasks_sent = len(dispatch.tasks) - sell_orders_sent
+        else:
+            sell_orders_sent, sharing_tasks_sent = _dispatch_panic_orders(user_id, dispatch.tasks)
+        last_order_at = time.monotonic()
+
+        panic_to_last_order_ms = round((last_order_at - started_at) * 1000, 1)
+
+        general_logger.info(
+            f"[PanicStop] User {user_id} panic stop completed. {sell_orders_sent} sell orders sent, "
+            f"{sharing_tasks_sent} sharing tasks sent, {len(instance_ids)} instances stopped "
+            f"({panic_to_last_order_ms}ms panic-to-last-order)."
+        )
 
         return {
             "status": "success",
             "message": "Panic stop executed",
             "sell_orders_sent": sell_orders_sent,
-            "instances_stopped": len(instances_stopped)
+            "sharing_tasks_sent": sharing_tasks_sent,
+            "instances_stopped": len(instance_ids),
+            "panic_to_last_order_ms": panic_to_last_order_ms
         }
 
     except Exception as e:
@@ -169,32 +162,91 @@ def execute_resume(user_id, environment, restart_instances):
 
 # === Helper Functions ===
 
-def _get_active_instance_ids(user_id, environment='live'):
-    """Get list of active (running) instance IDs for a user in one environment."""
+def _get_active_instances_for_panic(db_client, user_id, environment='live'):
+    """
+    Load every active (running) instance of a user in one environment together
+    with the details needed to sell it. Rows are locked FOR UPDATE, so this must
+    run inside the caller's transaction.
+    """
     query = load_query("select_active_instances_by_user.sql")
+    db_client.cursor.execute(query, (user_id, environment))
+    return [
+        {
+            "instance_id": row[0],
+            "api_key": row[1],
+            "exchange_id": row[2],
+            "symbol": row[3],
+            "share_id": row[4]
+        }
+        for row in db_client.cursor.fetchall()
+    ]
+
+
+def _panic_tasks(user_id, instances):
+    """(task_name, kwargs, queue) of one sell (and, if shared, one sharing task) per instance."""
+    tasks = []
+    for instance in instances:
+        operation_data = {
+            "user_id": user_id,
+            "api_key": instance["api_key"],
+            "exchange_id": instance["exchange_id"],
+            "perc_balance_operation": 1,
+            "symbol": instance["symbol"],
+            "side": "sell",
+            "instance_id": instance["instance_id"],
+            "size_mode": "percentage",
+            "flat_value": None
+        }
+        tasks.append(("trade.execute_operation", {"data": operation_data}, "ops"))
+
+        # Sharing task if this instance has sharing enabled
+        if instance["share_id"]:
+            sharing_data = {
+                "share_id": instance["share_id"],
+                "user_id": user_id,
+                "side": "sell",
+                "symbol": instance["symbol"],
+            }
+            tasks.append(("process_sharing_operations", {"data": sharing_data}, "sharing"))
+    return tasks
 
-    with get_db_connection() as db_client:
-        result = db_client.fetch_data(query, (user_id, environment))
-        if result:
-            return [row[0] for row in result]
-        return []
 
+def _dispatch_panic_orders(user_id, tasks):
+    """
+    Publish the panic tasks after the commit.
 
-def _get_instance_details_for_operation(instance_id, user_id):
-    """Get instance details needed for executing a sell operation."""
-    query = load_query("select_instance_details_for_operation.sql")
+    All messages go out over a single acquired producer instead of one broker
+    connection per send. A failing publish is logged and does not block the
+    remaining ones.
 
-    with get_db_connection() as db_client:
-        result = db_client.fetch_data(query, (user_id, instance_id))
-        if result:
-            row = result[0]
-            return {
-                "api_key": row[0],
-                "exchange_id": row[1],
-                "symbol": row[2],
-                "share_id": row[3]
-            }
-        return None
+    Returns:
+        tuple: (sell_orders_sent, sharing_tasks_sent)
+    """
+    sell_orders_sent = 0
+    sharing_tasks_sent = 0
+
+    with celery_app.producer_or_acquire() as producer:
+        for task_name, kwargs, queue in tasks:
+            data = kwargs["data"]
+            try:
+                celery_app.send_task(task_name, kwargs=kwargs, queue=queue, producer=producer)
+            except Exception as e:
+                general_logger.error(
+                    f"[PanicStop] Failed to send {task_name} for user {user_id}, symbol {data['symbol']}: {e}",
+                    exc_info=True
+                )
+                continue
+            if task_name == "trade.execute_operation":
+                sell_orders_sent += 1
+                general_logger.info(
+                    f"[PanicStop] Sell order sent for user {user_id}, instance {data['instance_id']}, "
+                    f"symbol {data['symbol']}"
+                )
+            else:
+                sharing_tasks_sent += 1
+                general_logger.info(f"[PanicStop] Sharing task sent for share_id={data['share_id']}")
+
+    return sell_orders_sent, sharing_tasks_sent
 
 
 def _update_instance_status(instance_id, user_id, status, starting=False):
@@ -225,15 +277,6 @@ def _get_panic_state(user_id, environment='live'):
         return None
 
 
-def _activate_panic_mode(user_id, environment, instance_ids):
-    """Activate panic mode for an environment and record stopped instances."""
-    query = load_query("activate_panic_mode.sql")
-    instances_json = json.dumps(instance_ids)
-
-    with get_db_connection() as db_client:
-        db_client.insert_data(query, (user_id, environment, instances_json))
-
-
 def _deactivate_panic_mode(user_id, environment):
     """Deactivate panic mode for an environment."""
     query = load_query("deactivate_panic_mode.sql")
@@ -80,6 +80,9 @@ def insert_data_to_db(data):
             - side (str)
             - indicator_id (int)
             - instance_id (int)
+
+    Returns:
+        int: ID da linha criada em webhook_data.
     """
     query = load_query("insert_webhook_data.sql")  # Você precisará criar este arquivo
     
@@ -93,8 +96,9 @@ def insert_data_to_db(data):
                 data['indicator_id'],
                 data['instance_id']
             )
-            db_client.insert_data(query, params)
+            webhook_id = db_client.insert_data_returning(query, params)
             general_logger.info(f"Webhook data successfully processed and inserted for key ending with: ...{data['key'][-4:] if len(data['key']) > 4 else data['key']}. Instance ID: {data.get('instance_id')}")
+            return webhook_id
     except KeyError as e:
         error_msg = f"Campo faltando no dicionário de dados: {str(e)}"
         general_logger.error(error_msg)
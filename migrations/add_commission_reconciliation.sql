@@ -0,0 +1,44 @@
+-- Migration: Bulk commission reconciliation
+-- Date: 2026-10-19
+-- Description:
+--   commission.reconcile (beat-scheduled) charges closed spot_position_entries
+--   that never got a ledger row because a price arrived late or the chained
+--   commission.process dispatch failed.
+--     - spot_position_entries.commission_checked_at: set once an entry with
+--       both prices known was evaluated (profitable or not), by
+--       commission.process / the inline calculation or by the reconciler, so
+--       each pass only scans entries not evaluated yet. Entries already
+--       closed when this migration runs are backfilled as evaluated.
+--     - commission_ledger.position_entry_id becomes unique: at most one
+--       commission per entry, shared by commission.process and the
+--       reconciler (both insert with ON CONFLICT DO NOTHING).
+--
+--   Check for existing duplicates before creating the unique index:
+--     SELECT position_entry_id, COUNT(*) FROM commission_ledger
+--     GROUP BY 1 HAVING COUNT(*) > 1;
+--
+--   CONCURRENTLY cannot run inside a transaction block: execute this file on
+--   its own (e.g. psql -f), not wrapped in BEGIN/COMMIT.
+
+ALTER TABLE spot_position_entries
+    ADD COLUMN IF NOT EXISTS commission_checked_at TIMESTAMPTZ;
+
+-- Entries closed before this migration were already handled (or predate the
+-- commission ledger): never charge them retroactively at today's rate
+UPDATE spot_position_entries
+SET commission_checked_at = NOW()
+WHERE status = 'closed'
+  AND commission_checked_at IS NULL;
+
+-- Reconciler scan: closed entries not evaluated yet
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_spe_commission_pending
+ON spot_position_entries (id)
+WHERE status = 'closed' AND commission_checked_at IS NULL;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_commission_ledger_position_entry
+ON commission_ledger (position_entry_id);
+
+-- ROLLBACK (if needed)
+-- DROP INDEX CONCURRENTLY IF EXISTS uq_commission_ledger_position_entry;
+-- DROP INDEX CONCURRENTLY IF EXISTS idx_spe_commission_pending;
+-- ALTER TABLE spot_position_entries DROP COLUMN IF EXISTS commission_checked_at;
@@ -0,0 +1,38 @@
+-- Migration: NOTIFY on exchange_symbols changes
+-- Date: 2026-10-19
+-- Description:
+--   Pricing workers keep a shared in-memory index of tracked symbols
+--   (source/symbol_index.py) and update it from these notifications instead
+--   of expiring a per-process cache. Payload: '<SYMBOL>:<t|f>'; a deleted
+--   symbol is reported as untracked.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION notify_exchange_symbols_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('exchange_symbols_changed', OLD.symbol || ':f');
+        RETURN OLD;
+    END IF;
+    IF TG_OP = 'UPDATE' AND NEW.symbol = OLD.symbol AND NEW.is_tracked IS NOT DISTINCT FROM OLD.is_tracked THEN
+        RETURN NEW;
+    END IF;
+    IF TG_OP = 'UPDATE' AND NEW.symbol <> OLD.symbol THEN
+        PERFORM pg_notify('exchange_symbols_changed', OLD.symbol || ':f');
+    END IF;
+    PERFORM pg_notify('exchange_symbols_changed',
+                      NEW.symbol || ':' || CASE WHEN NEW.is_tracked THEN 't' ELSE 'f' END);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_exchange_symbols_notify ON public.exchange_symbols;
+CREATE TRIGGER trg_exchange_symbols_notify
+AFTER INSERT OR UPDATE OR DELETE ON public.exchange_symbols
+FOR EACH ROW EXECUTE FUNCTION notify_exchange_symbols_changed();
+
+COMMIT;
+
+-- ROLLBACK (if needed)
+-- DROP TRIGGER IF EXISTS trg_exchange_symbols_notify ON public.exchange_symbols;
+-- DROP FUNCTION IF EXISTS notify_exchange_symbols_changed();
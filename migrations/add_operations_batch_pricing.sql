@@ -0,0 +1,28 @@
+-- Migration: Batched price enrichment for operations
+-- Date: 2026-10-19
+-- Description:
+--   With PRICE_BATCH_ENABLED=true, trade.save_operation no longer dispatches
+--   one price.fetch_execution_price task per operation. It stores the row with
+--   price_enrichment_attempts = 0 and the beat-scheduled price.enrich_pending
+--   task prices every queued row in one TimescaleDB query.
+--     - price_enrichment_attempts: NULL = not queued for batch pricing,
+--       otherwise the number of batches that failed to find a price.
+--     - signal_trace_id: ties the operation back to signal_traces so the
+--       batch can record the price_enrichment stage.
+
+ALTER TABLE public.operations
+    ADD COLUMN IF NOT EXISTS price_enrichment_attempts INTEGER,
+    ADD COLUMN IF NOT EXISTS signal_trace_id VARCHAR(32);
+
+-- Batch scan: rows still waiting for a price
+CREATE INDEX IF NOT EXISTS idx_operations_price_pending
+ON public.operations (id)
+WHERE execution_price IS NULL
+  AND price_enrichment_error IS NULL
+  AND price_enrichment_attempts IS NOT NULL;
+
+-- ROLLBACK (if needed)
+-- DROP INDEX IF EXISTS idx_operations_price_pending;
+-- ALTER TABLE public.operations
+--     DROP COLUMN IF EXISTS price_enrichment_attempts,
+--     DROP COLUMN IF EXISTS signal_trace_id;
@@ -0,0 +1,31 @@
+-- Migration: NOTIFY on platform_config changes
+-- Date: 2026-10-19
+-- Description:
+--   Every process keeps platform_config in memory (source/platform_config.py)
+--   and reloads it when notified instead of querying the table on each read.
+--   Payload: the changed config_key; listeners reload the whole table (a
+--   handful of rows).
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION notify_platform_config_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('platform_config_changed', OLD.config_key);
+        RETURN OLD;
+    END IF;
+    PERFORM pg_notify('platform_config_changed', NEW.config_key);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_platform_config_notify ON public.platform_config;
+CREATE TRIGGER trg_platform_config_notify
+AFTER INSERT OR UPDATE OR DELETE ON public.platform_config
+FOR EACH ROW EXECUTE FUNCTION notify_platform_config_changed();
+
+COMMIT;
+
+-- ROLLBACK (if needed)
+-- DROP TRIGGER IF EXISTS trg_platform_config_notify ON public.platform_config;
+-- DROP FUNCTION IF EXISTS notify_platform_config_changed();
@@ -0,0 +1,15 @@
+-- Partial index for condition evaluation
+-- select_pending_condition.sql (and the state engine warm-up) only read
+-- webhook_data rows that have not been consumed by a trade yet. Indexing just
+-- those rows keeps the lookup proportional to the pending signals instead of
+-- the whole webhook history.
+--
+-- CONCURRENTLY cannot run inside a transaction block: execute this file on its
+-- own (e.g. psql -f), not wrapped in BEGIN/COMMIT.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_webhook_data_pending
+ON webhook_data (instance_id, symbol, side, created_at)
+WHERE operation_task_id IS NULL;
+
+-- ROLLBACK (if needed)
+-- DROP INDEX CONCURRENTLY IF EXISTS idx_webhook_data_pending;
@@ -0,0 +1,34 @@
+-- Migration: Account balance cache
+-- Date: 2026-10-19
+-- Description:
+--   Last full balance fetched by account.get_balance per (exchange, api key),
+--   shared by every worker process. user_id is part of the key so a request
+--   is only answered with a balance fetched for the key's owner. Requests within
+--   ACCOUNT_BALANCE_TTL_SECONDS of the fetch are answered from here, and
+--   concurrent misses of the same key wait for a single exchange call
+--   (source/account_balance.py).
+--
+--   account_balance_cache_stats: hit/coalesced/miss/direct counters summed
+--   over every worker process (task account.balance_stats).
+--
+--   UNLOGGED: a cache; after a crash of the database server it comes back
+--   empty and the next request refetches.
+
+CREATE UNLOGGED TABLE IF NOT EXISTS account_balance_cache (
+    exchange_id  INTEGER NOT NULL,
+    api_key_id   INTEGER NOT NULL,
+    user_id      INTEGER NOT NULL,
+    balance      JSONB NOT NULL,
+    fetched_at   TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (exchange_id, api_key_id, user_id)
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS account_balance_cache_stats (
+    outcome     TEXT PRIMARY KEY,
+    requests    BIGINT NOT NULL DEFAULT 0,
+    updated_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- ROLLBACK (if needed)
+-- DROP TABLE IF EXISTS account_balance_cache_stats;
+-- DROP TABLE IF EXISTS account_balance_cache;
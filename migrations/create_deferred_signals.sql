@@ -0,0 +1,28 @@
+-- Migration: Deferred signals
+-- Date: 2026-10-19
+-- Description:
+--   Durable store for signals of indicators with delay_seconds. The webhook
+--   receipt writes one row per delayed signal instead of a Celery countdown
+--   task (which lives in worker memory and counts against prefetch). The
+--   deferred scheduler (celeryManager/deferred_scheduler.py) loads rows that
+--   come due within its horizon into a timer wheel and releases them into
+--   the logic queue; pending rows survive restarts.
+
+CREATE TABLE IF NOT EXISTS deferred_signals (
+    id           BIGSERIAL PRIMARY KEY,
+    instance_id  INTEGER NOT NULL,
+    fire_at      TIMESTAMPTZ NOT NULL,
+    payload      JSONB NOT NULL,              -- webhook.processor kwargs
+    status       VARCHAR(10) NOT NULL DEFAULT 'pending',
+    created_at   TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    released_at  TIMESTAMPTZ,
+    CONSTRAINT chk_deferred_signal_status CHECK (status IN ('pending', 'released'))
+);
+
+-- Scheduler scan: pending rows ordered by fire time
+CREATE INDEX IF NOT EXISTS idx_deferred_signals_pending
+ON deferred_signals (fire_at)
+WHERE status = 'pending';
+
+-- ROLLBACK (if needed)
+-- DROP TABLE IF EXISTS deferred_signals;
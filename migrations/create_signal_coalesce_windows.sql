@@ -0,0 +1,19 @@
+-- Migration: Signal coalescing windows
+-- Date: 2026-10-19
+-- Description:
+--   One row per (instance, side) holding the end of the current coalescing
+--   window. The first signal of a bar claims the window and schedules a single
+--   condition evaluation at its end; signals arriving inside the window are
+--   only recorded in webhook_data. Rows are tiny and rewritten in place.
+--   UNLOGGED: losing open windows on a crash only means the next signal opens
+--   a fresh one.
+
+CREATE UNLOGGED TABLE IF NOT EXISTS signal_coalesce_windows (
+    instance_id     INTEGER NOT NULL,
+    side            VARCHAR(10) NOT NULL,
+    window_ends_at  TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (instance_id, side)
+);
+
+-- ROLLBACK (if needed)
+-- DROP TABLE IF EXISTS signal_coalesce_windows;
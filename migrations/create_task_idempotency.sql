@@ -0,0 +1,29 @@
+-- Migration: Task idempotency store
+-- Date: 2026-10-19
+-- Description:
+--   Side-effect checkpoints of tasks that can run more than once
+--   (acks_late redelivery of webhook.processor, save retries, duplicate
+--   publishes from the task outbox). Keyed by (idem_key, stage): the trace id
+--   or the deterministic client order id, and the pipeline stage. Tasks read
+--   it before a side effect and skip the ones already done
+--   (source/idempotency.py).
+--
+--   UNLOGGED: no WAL on the hot path. After a crash of the database server
+--   the table comes back empty, which only reopens the dedup window for
+--   tasks redelivered across that crash. Rows older than
+--   IDEMPOTENCY_TTL_SECONDS are purged by the writers.
+
+CREATE UNLOGGED TABLE IF NOT EXISTS task_idempotency (
+    idem_key    TEXT NOT NULL,
+    stage       TEXT NOT NULL,
+    status      VARCHAR(20) NOT NULL,          -- started / persisted / completed
+    result      JSONB,
+    updated_at  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (idem_key, stage)
+);
+
+CREATE INDEX IF NOT EXISTS idx_task_idempotency_updated
+ON task_idempotency (updated_at);
+
+-- ROLLBACK (if needed)
+-- DROP TABLE IF EXISTS task_idempotency;
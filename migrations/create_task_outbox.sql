@@ -0,0 +1,21 @@
+-- Migration: Task outbox
+-- Date: 2026-10-19
+-- Description:
+--   Celery tasks dispatched by stages that write to the database are stored
+--   here in the same transaction as the rows they follow up on (source/outbox.py)
+--   instead of being published after the commit, where a broker failure lost
+--   them. The outbox relay (celeryManager/outbox_relay.py) publishes pending
+--   rows in batches and deletes them in the publishing transaction.
+--   Committing a row sends NOTIFY task_outbox to wake the relay.
+
+CREATE TABLE IF NOT EXISTS task_outbox (
+    id          BIGSERIAL PRIMARY KEY,
+    task_name   TEXT NOT NULL,
+    kwargs      JSONB NOT NULL,
+    queue       TEXT NOT NULL,
+    task_id     TEXT NOT NULL,               -- Celery task id, stable across re-publishes
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- ROLLBACK (if needed)
+-- DROP TABLE IF EXISTS task_outbox;
@@ -0,0 +1,49 @@
+-- Migration: Incremental strategy performance for virtual operations
+-- Date: 2026-10-19
+-- Description:
+--   One row per instance with running strategy metrics, folded in by the
+--   virtual price enrichment every time a closed virtual position has both
+--   its buy and sell priced (source/virtual_performance.py). Dashboards read
+--   this table instead of rescanning virtual_operations history.
+--     - cycle_return = sell_price / buy_price - 1 (base_qty cancels out)
+--     - realized_return: compounded, equity - 1
+--     - max_drawdown: largest fall of equity from its running peak (0..1),
+--       along the cycles in close order (replayed when a cycle is priced late)
+--   virtual_position_entries.performance_applied_at marks the cycles already
+--   folded in, so each closed position counts exactly once.
+--
+--   Backfill existing history (all pending cycles, oldest first):
+--     celery call virtual.apply_performance
+
+CREATE TABLE IF NOT EXISTS virtual_strategy_performance (
+    instance_id        INTEGER PRIMARY KEY,
+    user_id            INTEGER NOT NULL,            -- instance owner
+    cycle_count        INTEGER NOT NULL DEFAULT 0,
+    win_count          INTEGER NOT NULL DEFAULT 0,
+    win_rate           NUMERIC(10, 6) GENERATED ALWAYS AS (
+                           CASE WHEN cycle_count > 0 THEN win_count::numeric / cycle_count END
+                       ) STORED,
+    sum_cycle_return   NUMERIC(30, 12) NOT NULL DEFAULT 0,
+    equity             NUMERIC(30, 12) NOT NULL DEFAULT 1,
+    peak_equity        NUMERIC(30, 12) NOT NULL DEFAULT 1,
+    realized_return    NUMERIC(30, 12) GENERATED ALWAYS AS (equity - 1) STORED,
+    max_drawdown       NUMERIC(30, 12) NOT NULL DEFAULT 0,
+    last_cycle_at      TIMESTAMPTZ,
+    updated_at         TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_vsp_user
+    ON virtual_strategy_performance (user_id);
+
+ALTER TABLE virtual_position_entries
+    ADD COLUMN IF NOT EXISTS performance_applied_at TIMESTAMPTZ;
+
+-- Closed positions not yet folded into the summary
+CREATE INDEX IF NOT EXISTS idx_vpe_performance_pending
+    ON virtual_position_entries (closed_at)
+    WHERE status = 'closed' AND performance_applied_at IS NULL;
+
+-- ROLLBACK (if needed)
+-- DROP INDEX IF EXISTS idx_vpe_performance_pending;
+-- ALTER TABLE virtual_position_entries DROP COLUMN IF EXISTS performance_applied_at;
+-- DROP TABLE IF EXISTS virtual_strategy_performance;
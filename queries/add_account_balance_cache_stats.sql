@@ -0,0 +1,7 @@
+-- Add one process's account balance cache counters to the shared totals.
+-- Params: (outcomes text[], counts bigint[])
+INSERT INTO account_balance_cache_stats (outcome, requests)
+SELECT outcome, requests FROM unnest(%s::text[], %s::bigint[]) AS t(outcome, requests)
+ON CONFLICT (outcome) DO UPDATE
+SET requests = account_balance_cache_stats.requests + EXCLUDED.requests,
+    updated_at = NOW()
@@ -0,0 +1,9 @@
+-- Open a coalescing window for (instance, side) unless one is still running.
+-- Returns a row only for the signal that opened the window.
+-- Params: (instance_id, side, window_ms)
+INSERT INTO signal_coalesce_windows (instance_id, side, window_ends_at)
+VALUES (%s, %s, NOW() + make_interval(secs => %s / 1000.0))
+ON CONFLICT (instance_id, side) DO UPDATE
+SET window_ends_at = EXCLUDED.window_ends_at
+WHERE signal_coalesce_windows.window_ends_at <= NOW()
+RETURNING window_ends_at
@@ -0,0 +1,7 @@
+-- Claim a stage: returns a row only for the first caller. A concurrent
+-- claimer waits for the first transaction and then gets nothing.
+-- Params: (idem_key, stage, status, result_json)
+INSERT INTO task_idempotency (idem_key, stage, status, result)
+VALUES (%s, %s, %s, %s::jsonb)
+ON CONFLICT (idem_key, stage) DO NOTHING
+RETURNING idem_key
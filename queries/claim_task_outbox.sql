@@ -0,0 +1,11 @@
+-- Take the oldest outbox rows for publishing; concurrent relays skip them.
+-- The rows are gone only if the relay commits after publishing.
+-- Params: (limit,)
+DELETE FROM task_outbox
+WHERE id IN (
+    SELECT id FROM task_outbox
+    ORDER BY id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id, task_name, kwargs, queue, task_id
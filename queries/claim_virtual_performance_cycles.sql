@@ -0,0 +1,32 @@
+-- Claims closed virtual positions whose buy and sell are both priced and that
+-- were not folded into virtual_strategy_performance yet. Restricted to the
+-- given operation ids (buy or sell side); a NULL array claims every pending
+-- cycle (backfill / catch-up). Entries are locked in id order, so concurrent
+-- claims never deadlock, and the row locks make each cycle count exactly once.
+-- Cycles with a zero buy price can't be folded and are left unclaimed.
+-- Params: (operation_ids int[], operation_ids int[], operation_ids int[]).
+WITH pending AS (
+    SELECT e.id
+    FROM virtual_position_entries e
+    JOIN virtual_operations b ON b.id = e.operation_id
+    JOIN virtual_operations s ON s.id = e.sell_operation_id
+    WHERE e.status = 'closed'
+      AND e.performance_applied_at IS NULL
+      AND b.execution_price > 0
+      AND s.execution_price IS NOT NULL
+      AND (%s::int[] IS NULL OR e.operation_id = ANY(%s::int[]) OR e.sell_operation_id = ANY(%s::int[]))
+    ORDER BY e.id
+    FOR UPDATE OF e
+),
+claimed AS (
+    UPDATE virtual_position_entries e
+    SET performance_applied_at = NOW()
+    FROM pending p, virtual_operations b, virtual_operations s
+    WHERE e.id = p.id
+      AND b.id = e.operation_id
+      AND s.id = e.sell_operation_id
+    RETURNING e.instance_id, e.user_id, e.closed_at, b.execution_price AS buy_price, s.execution_price AS sell_price
+)
+SELECT instance_id, user_id, closed_at, buy_price, sell_price
+FROM claimed
+ORDER BY instance_id, closed_at;
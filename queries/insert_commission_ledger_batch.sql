@@ -0,0 +1,12 @@
+-- Pending commission ledger rows for every profitable entry of one sell.
+-- Params: sell_operation_id, commission_rate, commission_token, environment
+-- (shared by the whole batch), then parallel arrays of user_id,
+-- position_entry_id, profit and commission_amount.
+INSERT INTO commission_ledger
+    (user_id, position_entry_id, sell_operation_id,
+     profit, commission_rate, commission_amount, commission_token, environment)
+SELECT e.user_id, e.entry_id, %s, e.profit, %s, e.commission_amount, %s, %s
+FROM unnest(%s::int[], %s::int[], %s::numeric[], %s::numeric[])
+     AS e(user_id, entry_id, profit, commission_amount)
+ON CONFLICT (position_entry_id) DO NOTHING  -- already charged by commission.reconcile
+RETURNING id, position_entry_id;
@@ -0,0 +1,5 @@
+-- Persist a delayed signal for the deferred scheduler.
+-- Params: (instance_id, delay_seconds, payload_json)
+INSERT INTO deferred_signals (instance_id, fire_at, payload)
+VALUES (%s, NOW() + make_interval(secs => %s), %s::jsonb)
+RETURNING id
@@ -1,3 +1,3 @@
-INSERT INTO public.operations (user_id, api_key, symbol, side, size, order_response, instance_id, status, "date",executed_at)
-VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW(),%s)
-RETURNING id;
\ No newline at end of file
+INSERT INTO public.operations (user_id, api_key, symbol, side, size, order_response, instance_id, status, "date",executed_at, signal_trace_id, price_enrichment_attempts, execution_price)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW(),%s, %s, %s, %s)
+RETURNING id;
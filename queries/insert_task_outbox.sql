@@ -0,0 +1,10 @@
+-- Stage tasks in the outbox (caller's transaction) and wake the relay on commit.
+-- Params: (task_names[], kwargs_json[], queues[], task_ids[])
+WITH staged AS (
+    INSERT INTO task_outbox (task_name, kwargs, queue, task_id)
+    SELECT task_name, kwargs::jsonb, queue, task_id
+    FROM unnest(%s::text[], %s::text[], %s::text[], %s::text[])
+         AS t(task_name, kwargs, queue, task_id)
+    RETURNING id
+)
+SELECT count(*), pg_notify('task_outbox', '') FROM staged
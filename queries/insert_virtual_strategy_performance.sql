@@ -0,0 +1,5 @@
+-- Creates the summary rows of instances without one yet (zero cycles).
+-- Params: (instance_ids int[], user_ids int[]).
+INSERT INTO virtual_strategy_performance (instance_id, user_id)
+SELECT * FROM unnest(%s::int[], %s::int[])
+ON CONFLICT (instance_id) DO NOTHING;
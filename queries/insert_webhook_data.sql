@@ -5,4 +5,5 @@ INSERT INTO public.webhook_data (
     indicator_id,
     instance_id
 )
-VALUES (%s, %s, %s, %s, %s);
+VALUES (%s, %s, %s, %s, %s)
+RETURNING id;
@@ -0,0 +1,7 @@
+-- Mark position entries whose commission was evaluated (profitable or not),
+-- so commission.reconcile does not scan them again.
+-- Params: (entry_ids int[])
+UPDATE spot_position_entries
+SET commission_checked_at = NOW()
+WHERE id = ANY(%s)
+  AND commission_checked_at IS NULL
@@ -0,0 +1,4 @@
+-- Drop checkpoints past the dedup window.
+-- Params: (ttl_seconds,)
+DELETE FROM task_idempotency
+WHERE updated_at < NOW() - make_interval(secs => %s)
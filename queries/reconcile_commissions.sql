@@ -0,0 +1,49 @@
+-- One set-based commission reconciliation pass (commission.reconcile).
+-- Takes up to %(limit)s closed entries not evaluated yet whose buy and sell
+-- are both priced (and that closed more than %(grace_seconds)s ago, leaving
+-- the regular commission.process the first chance), marks them evaluated and
+-- inserts a pending ledger row for every profitable one. Entries already
+-- charged are skipped by the unique position_entry_id index.
+-- Returns (entries checked, commissions created, total commission).
+WITH candidates AS (
+    SELECT
+        spe.id AS entry_id,
+        spe.user_id,
+        spe.sell_operation_id,
+        (sell_op.execution_price - buy_op.execution_price) * spe.base_qty AS profit,
+        COALESCE(nak.environment, 'live') AS environment
+    FROM spot_position_entries spe
+    JOIN operations buy_op ON buy_op.id = spe.operation_id
+    JOIN operations sell_op ON sell_op.id = spe.sell_operation_id
+    LEFT JOIN neouser_apikeys nak ON nak.id = sell_op.api_key
+    WHERE spe.status = 'closed'
+      AND spe.commission_checked_at IS NULL
+      AND spe.closed_at < NOW() - make_interval(secs => %(grace_seconds)s)
+      AND buy_op.execution_price IS NOT NULL
+      AND sell_op.execution_price IS NOT NULL
+    ORDER BY spe.id
+    LIMIT %(limit)s
+    FOR UPDATE OF spe SKIP LOCKED
+),
+marked AS (
+    UPDATE spot_position_entries spe
+    SET commission_checked_at = NOW()
+    FROM candidates c
+    WHERE spe.id = c.entry_id
+),
+inserted AS (
+    INSERT INTO commission_ledger
+        (user_id, position_entry_id, sell_operation_id,
+         profit, commission_rate, commission_amount, commission_token, environment)
+    SELECT user_id, entry_id, sell_operation_id,
+           profit, %(commission_rate)s, profit * %(commission_rate)s, %(commission_token)s, environment
+    FROM candidates
+    WHERE profit > 0
+    ON CONFLICT (position_entry_id) DO NOTHING
+    RETURNING commission_amount
+)
+SELECT
+    (SELECT COUNT(*) FROM candidates),
+    COUNT(*),
+    COALESCE(SUM(commission_amount), 0)
+FROM inserted;
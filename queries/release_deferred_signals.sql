@@ -0,0 +1,7 @@
+-- Mark due deferred signals as released; only still-pending rows are returned.
+-- Params: (ids[],)
+UPDATE deferred_signals
+SET status = 'released', released_at = NOW()
+WHERE id = ANY(%s)
+AND status = 'pending'
+RETURNING id, instance_id, payload
@@ -0,0 +1,8 @@
+-- Cached balance of an api key, if fetched within the TTL.
+-- Params: (exchange_id, api_key_id, user_id, ttl_seconds)
+SELECT balance
+FROM account_balance_cache
+WHERE exchange_id = %s
+  AND api_key_id = %s
+  AND user_id = %s
+  AND fetched_at > NOW() - make_interval(secs => %s)
@@ -0,0 +1,3 @@
+-- Shared account balance cache counters (hit, coalesced, miss, direct).
+SELECT outcome, requests
+FROM account_balance_cache_stats
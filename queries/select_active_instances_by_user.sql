@@ -1,12 +1,26 @@
 -- select_active_instances_by_user.sql
--- Active PSL instances for a user within one environment. Panic is now
--- environment-scoped: a live panic touches only live instances, a demo panic
--- only demo instances. Params: (user_id, environment)
+-- Active PSL instances for a user within one environment, with everything the
+-- panic stop needs to dispatch a sell (api key, exchange, symbol, sharing id).
+-- Panic is environment-scoped: a live panic touches only live instances, a
+-- demo panic only demo instances. Rows are locked so a concurrent start/stop
+-- cannot interleave with the bulk status update. Params: (user_id, environment)
 SELECT
-    i.id
+    i.id,
+    i.api_key,
+    nak.exchange_id,
+    i.symbol,
+    (
+        SELECT is2.id
+        FROM instance_sharing is2
+        WHERE is2.instance_id = i.id
+        ORDER BY is2.id
+        LIMIT 1
+    ) AS share_id
 FROM instances i
 JOIN neouser_apikeys nak ON i.api_key = nak.id
 WHERE i.user_id = %s
   AND i.status = 2
   AND i.participate_psl = TRUE
-  AND nak.environment = %s;
+  AND nak.environment = %s
+ORDER BY i.id
+FOR UPDATE OF i;
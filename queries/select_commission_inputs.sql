@@ -0,0 +1,19 @@
+-- Everything commission.process needs from the database for one sell, in one
+-- round trip: the sell's live/demo environment and its closed position
+-- entries with the enriched buy/sell prices. Returns one row with NULL entry
+-- columns when the sell closed no entries (none if the sell doesn't exist).
+-- Commission settings come from the platform_config cache.
+-- Params: (sell_operation_id).
+SELECT
+    spe.id AS entry_id,
+    spe.user_id,
+    buy_op.execution_price AS buy_price,
+    sell_op.execution_price AS sell_price,
+    spe.base_qty,
+    COALESCE(nak.environment, 'live') AS environment
+FROM operations sell_op
+LEFT JOIN neouser_apikeys nak ON nak.id = sell_op.api_key
+LEFT JOIN spot_position_entries spe ON spe.sell_operation_id = sell_op.id
+LEFT JOIN operations buy_op ON buy_op.id = spe.operation_id
+WHERE sell_op.id = %s
+ORDER BY spe.id;
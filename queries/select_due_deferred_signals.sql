@@ -0,0 +1,9 @@
+-- Pending deferred signals firing within the scheduler horizon (overdue ones
+-- included, e.g. after a restart). Fire time as epoch milliseconds.
+-- Params: (horizon_seconds, limit)
+SELECT id, (EXTRACT(EPOCH FROM fire_at) * 1000)::BIGINT AS fire_at_ms
+FROM deferred_signals
+WHERE status = 'pending'
+AND fire_at <= NOW() + make_interval(secs => %s)
+ORDER BY fire_at
+LIMIT %s
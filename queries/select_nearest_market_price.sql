@@ -0,0 +1,11 @@
+-- Nearest market price at or before an execution timestamp (TimescaleDB).
+-- The 5 minute window is a safety guard: if the oracle was down we never
+-- price an operation with a trade from long before it executed.
+-- Params: (normalized_symbol, executed_at, executed_at).
+SELECT price
+FROM market_trades
+WHERE symbol = %s
+  AND timestamp <= %s::timestamptz
+  AND timestamp >= (%s::timestamptz - '5 minutes'::interval)
+ORDER BY timestamp DESC
+LIMIT 1;
@@ -0,0 +1,17 @@
+-- Batched form of select_nearest_market_price.sql: nearest price at or before
+-- each execution timestamp (5 minute window), one LATERAL lookup per row.
+-- Params: (ids bigint[], normalized_symbols text[], executed_at timestamptz[]).
+-- Rows without a price are omitted.
+SELECT p.id, t.price
+FROM unnest(%s::bigint[], %s::text[], %s::timestamptz[])
+     AS p(id, symbol, executed_at)
+CROSS JOIN LATERAL (
+    SELECT price
+    FROM market_trades
+    WHERE
+        symbol = p.symbol
+        AND timestamp <= p.executed_at
+        AND timestamp >= (p.executed_at - '5 minutes'::interval)
+    ORDER BY timestamp DESC
+    LIMIT 1
+) t;
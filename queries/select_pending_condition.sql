@@ -0,0 +1,12 @@
+-- Condition evaluation for one (instance, symbol, side): the distinct indicator
+-- count plus the pending webhook_data ids that a trade would consume.
+-- Same filter as select_market_objects.sql, without serializing the rows.
+-- Params: (instance_id, symbol, side, start_date)
+SELECT COUNT(DISTINCT indicator_id) AS indicator_count,
+       array_agg(id ORDER BY id) AS webhook_ids
+FROM webhook_data
+WHERE instance_id = %s
+AND symbol = %s
+AND side = %s
+AND created_at >= %s
+AND operation_task_id IS NULL
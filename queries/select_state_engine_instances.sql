@@ -0,0 +1,5 @@
+-- Running instances and their start_date, used to warm the in-memory state
+-- engine on worker startup. Shard ownership is filtered in Python.
+SELECT id, start_date
+FROM instances
+WHERE status = 2;
@@ -0,0 +1,14 @@
+-- Last N operations per instance (newest first) for the in-memory state engine.
+-- Params: (instance_ids[], history_size)
+SELECT instance_id, date, side
+FROM (
+    SELECT
+        instance_id,
+        date,
+        side,
+        ROW_NUMBER() OVER (PARTITION BY instance_id ORDER BY date DESC) AS rn
+    FROM operations
+    WHERE instance_id = ANY(%s)
+) recent
+WHERE rn <= %s
+ORDER BY instance_id, date DESC;
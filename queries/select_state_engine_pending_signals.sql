@@ -0,0 +1,9 @@
+-- Pending (not yet consumed) webhook signals since each instance's start_date,
+-- for the in-memory state engine. Same filter as select_market_objects.sql.
+-- Params: (instance_ids[],)
+SELECT w.instance_id, w.id, w.symbol, w.side, w.indicator_id
+FROM webhook_data w
+JOIN instances i ON i.id = w.instance_id
+WHERE w.instance_id = ANY(%s)
+  AND w.created_at >= i.start_date
+  AND w.operation_task_id IS NULL;
@@ -0,0 +1,4 @@
+-- Params: (idem_key, stage)
+SELECT status, result
+FROM task_idempotency
+WHERE idem_key = %s AND stage = %s
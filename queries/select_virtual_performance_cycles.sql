@@ -0,0 +1,12 @@
+-- Every cycle of the given instances already folded into
+-- virtual_strategy_performance (including those claimed in this transaction),
+-- in close order, to replay the equity path when a late cycle arrives.
+-- Params: (instance_ids int[]).
+SELECT e.instance_id, e.closed_at, b.execution_price AS buy_price, s.execution_price AS sell_price
+FROM virtual_position_entries e
+JOIN virtual_operations b ON b.id = e.operation_id
+JOIN virtual_operations s ON s.id = e.sell_operation_id
+WHERE e.instance_id = ANY(%s::int[])
+  AND e.status = 'closed'
+  AND e.performance_applied_at IS NOT NULL
+ORDER BY e.instance_id, e.closed_at, e.id;
@@ -0,0 +1,9 @@
+-- Locks the summary rows of the given instances so concurrent enrichments
+-- fold their cycles one after the other. Rows are locked in instance order so
+-- two folds over overlapping instances can't deadlock. Params: (instance_ids int[]).
+SELECT instance_id, cycle_count, win_count, sum_cycle_return,
+       equity, peak_equity, max_drawdown, last_cycle_at
+FROM virtual_strategy_performance
+WHERE instance_id = ANY(%s::int[])
+ORDER BY instance_id
+FOR UPDATE;
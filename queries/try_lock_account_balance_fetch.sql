@@ -0,0 +1,4 @@
+-- Claim the balance fetch of an api key across processes, without waiting:
+-- true when this transaction holds the lock (released at its end).
+-- Params: (exchange_id, api_key_id)
+SELECT pg_try_advisory_xact_lock(hashtextextended('account_balance:' || %s::text || ':' || %s::text, 0))
@@ -2,4 +2,5 @@ UPDATE operations
 SET 
     execution_price = %s,
     executed_at = %s::timestamptz
-WHERE id = %s;
\ No newline at end of file
+WHERE id = %s
+RETURNING side, user_id, api_key;
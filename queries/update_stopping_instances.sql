@@ -0,0 +1,5 @@
+-- Stop a set of instances of one user in a single statement (panic stop).
+-- Params: (status, instance_ids[], user_id)
+UPDATE instances
+SET status = %s, start_date = NULL
+WHERE id = ANY(%s) AND user_id = %s;
@@ -0,0 +1,18 @@
+-- Writes the folded per-instance metrics (rows locked beforehand by
+-- select_virtual_strategy_performance_for_update.sql).
+-- Params: parallel arrays of instance_id, cycle_count, win_count,
+-- sum_cycle_return, equity, peak_equity, max_drawdown, last_cycle_at.
+UPDATE virtual_strategy_performance v
+SET cycle_count      = p.cycle_count,
+    win_count        = p.win_count,
+    sum_cycle_return = p.sum_cycle_return,
+    equity           = p.equity,
+    peak_equity      = p.peak_equity,
+    max_drawdown     = p.max_drawdown,
+    last_cycle_at    = p.last_cycle_at,
+    updated_at       = NOW()
+FROM unnest(%s::int[], %s::int[], %s::int[], %s::numeric[],
+            %s::numeric[], %s::numeric[], %s::numeric[], %s::timestamptz[])
+     AS p(instance_id, cycle_count, win_count, sum_cycle_return,
+          equity, peak_equity, max_drawdown, last_cycle_at)
+WHERE v.instance_id = p.instance_id;
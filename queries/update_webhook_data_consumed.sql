@@ -0,0 +1,9 @@
+-- Consume pending signals for a dispatched trade in one statement.
+-- Rows already taken by another operation are left alone, so the caller can
+-- compare the returned ids with what it expected to claim.
+-- Params: (operation_task_id, webhook_ids[])
+UPDATE webhook_data
+SET operation_task_id = %s
+WHERE id = ANY(%s)
+AND operation_task_id IS NULL
+RETURNING id
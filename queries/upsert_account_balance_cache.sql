@@ -0,0 +1,7 @@
+-- Store the balance just fetched for an api key.
+-- Params: (exchange_id, api_key_id, user_id, balance_json)
+INSERT INTO account_balance_cache (exchange_id, api_key_id, user_id, balance)
+VALUES (%s, %s, %s, %s::jsonb)
+ON CONFLICT (exchange_id, api_key_id, user_id) DO UPDATE
+SET balance = EXCLUDED.balance,
+    fetched_at = NOW()
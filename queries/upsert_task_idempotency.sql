@@ -0,0 +1,8 @@
+-- Record the progress of a stage (overwrites the previous checkpoint).
+-- Params: (idem_key, stage, status, result_json)
+INSERT INTO task_idempotency (idem_key, stage, status, result)
+VALUES (%s, %s, %s, %s::jsonb)
+ON CONFLICT (idem_key, stage) DO UPDATE
+SET status = EXCLUDED.status,
+    result = EXCLUDED.result,
+    updated_at = NOW()
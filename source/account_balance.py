@@ -0,0 +1,199 @@
+"""
+Single-flight, short-TTL cache for the account.get_balance task.
+
+The frontend asks for the full balance of the same key many times within
+seconds (every dashboard refresh, every open tab). Each request used to build
+the interface, load credentials and hit the exchange, spending rate limit that
+trading needs.
+
+`fetch_account_balance` answers from `account_balance_cache`
+(migrations/create_account_balance_cache.sql) while the last fetch of the
+(exchange, api key) is younger than ACCOUNT_BALANCE_TTL_SECONDS. On a miss
+one request claims the key with `pg_try_advisory_xact_lock` and calls the
+exchange; concurrent misses, in any worker process, do not queue on the lock:
+they release their pooled connection and poll the cache row every
+ACCOUNT_BALANCE_POLL_MS until that fetch lands. Failed or empty fetches are
+not cached.
+
+If the cache is unavailable (database error) or no result shows up within
+ACCOUNT_BALANCE_WAIT_MS, the balance is fetched directly, as before. With
+ACCOUNT_BALANCE_TTL_SECONDS=0 every request goes to the exchange.
+
+Each process counts hits (fresh row), coalesced (answered by a concurrent
+fetch), misses (exchange calls) and direct fetches. Every
+ACCOUNT_BALANCE_STATS_EVERY requests it logs its hit ratio and adds its
+counters to `account_balance_cache_stats`, which `shared_stats` (task
+account.balance_stats) reports for all processes.
+"""
+
+import json
+import os
+import threading
+import time
+
+from log.log import general_logger
+from source.context import db_transaction
+from source.dbmanager import load_query
+from source.exchange_interface import get_exchange_interface
+
+HIT = "hit"
+COALESCED = "coalesced"
+MISS = "miss"
+DIRECT = "direct"
+OUTCOMES = (HIT, COALESCED, MISS, DIRECT)
+
+
+def _with_ratio(counts):
+    total = sum(counts.get(outcome, 0) for outcome in OUTCOMES)
+    served = counts.get(HIT, 0) + counts.get(COALESCED, 0)
+    counts["requests"] = total
+    counts["hit_ratio"] = round(served / total, 3) if total else None
+    return counts
+
+
+class AccountBalanceCache:
+    def __init__(self, ttl_seconds, wait_ms, poll_ms, stats_every):
+        self.ttl_seconds = ttl_seconds
+        self.wait_seconds = wait_ms / 1000.0
+        self.poll_seconds = poll_ms / 1000.0
+        self.stats_every = stats_every
+        self._counts = dict.fromkeys(OUTCOMES, 0)
+        self._unflushed = dict.fromkeys(OUTCOMES, 0)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _fetch(exchange_id, user_id, api_key_id):
+        interface = get_exchange_interface(exchange_id=exchange_id, user_id=user_id, api_key=api_key_id)
+        return interface.get_balance()
+
+    def _read(self, db_client, exchange_id, user_id, api_key_id):
+        db_client.cursor.execute(
+            load_query("select_account_balance_cache.sql"),
+            (exchange_id, api_key_id, user_id, self.ttl_seconds),
+        )
+        row = db_client.cursor.fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _store(db_client, exchange_id, user_id, api_key_id, balance):
+        try:
+            with db_client.conn.transaction():
+                db_client.cursor.execute(
+                    load_query("upsert_account_balance_cache.sql"),
+                    (exchange_id, api_key_id, user_id, json.dumps(balance, default=str)),
+                )
+        except Exception as e:
+            general_logger.warning(f"[AccountBalance] Failed to cache balance of api_key={api_key_id}: {e}")
+
+    def get(self, exchange_id, user_id, api_key_id):
+        """Full balance of the key, as returned by ExchangeInterface.get_balance()."""
+        if self.ttl_seconds <= 0:
+            self._count(DIRECT)
+            return self._fetch(exchange_id, user_id, api_key_id)
+
+        deadline = time.monotonic() + self.wait_seconds
+        waited = False
+        fetched = False
+        try:
+            while True:
+                with db_transaction() as db_client:
+                    balance = self._read(db_client, exchange_id, user_id, api_key_id)
+                    if balance is None:
+                        db_client.cursor.execute(
+                            load_query("try_lock_account_balance_fetch.sql"), (exchange_id, api_key_id)
+                        )
+                        if db_client.cursor.fetchone()[0]:
+                            # Lock held until this transaction ends; other misses poll the row
+                            fetched = True
+                            balance = self._fetch(exchange_id, user_id, api_key_id)
+                            if balance:
+                                self._store(db_client, exchange_id, user_id, api_key_id, balance)
+                if fetched:
+                    self._count(MISS)
+                    return balance
+                if balance is not None:
+                    self._count(COALESCED if waited else HIT)
+                    return balance
+                if time.monotonic() >= deadline:
+                    break
+                waited = True
+                time.sleep(self.poll_seconds)
+        except Exception as e:
+            if fetched:
+                raise
+            general_logger.warning(
+                f"[AccountBalance] Cache unavailable for exchange={exchange_id} api_key={api_key_id}, "
+                f"fetching directly: {e}"
+            )
+            self._count(DIRECT)
+            return self._fetch(exchange_id, user_id, api_key_id)
+
+        general_logger.warning(
+            f"[AccountBalance] Concurrent fetch of exchange={exchange_id} api_key={api_key_id} "
+            f"not done within {self.wait_seconds}s, fetching directly"
+        )
+        self._count(DIRECT)
+        return self._fetch(exchange_id, user_id, api_key_id)
+
+    def _count(self, outcome):
+        with self._lock:
+            self._counts[outcome] += 1
+            self._unflushed[outcome] += 1
+            total = sum(self._counts.values())
+            due = self.stats_every and total % self.stats_every == 0
+            if due:
+                pending = self._unflushed
+                self._unflushed = dict.fromkeys(OUTCOMES, 0)
+        if due:
+            general_logger.info(f"[AccountBalance] {self.stats()}")
+            self._flush(pending)
+
+    def _flush(self, pending):
+        """Add this process's counters since the last flush to the shared totals."""
+        outcomes = [outcome for outcome in OUTCOMES if pending[outcome]]
+        try:
+            with db_transaction() as db_client:
+                db_client.cursor.execute(
+                    load_query("add_account_balance_cache_stats.sql"),
+                    (outcomes, [pending[outcome] for outcome in outcomes]),
+                )
+        except Exception as e:
+            general_logger.warning(f"[AccountBalance] Failed to record cache stats: {e}")
+            with self._lock:
+                for outcome in outcomes:
+                    self._unflushed[outcome] += pending[outcome]
+
+    def stats(self):
+        """Counters of this process."""
+        with self._lock:
+            counts = dict(self._counts)
+        return _with_ratio(counts)
+
+
+_cache = None
+
+
+def get_account_balance_cache():
+    """Process-wide account balance cache."""
+    global _cache
+    if _cache is None:
+        _cache = AccountBalanceCache(
+            ttl_seconds=float(os.environ.get("ACCOUNT_BALANCE_TTL_SECONDS", "5")),
+            wait_ms=int(os.environ.get("ACCOUNT_BALANCE_WAIT_MS", "3000")),
+            poll_ms=int(os.environ.get("ACCOUNT_BALANCE_POLL_MS", "100")),
+            stats_every=int(os.environ.get("ACCOUNT_BALANCE_STATS_EVERY", "100")),
+        )
+    return _cache
+
+
+def fetch_account_balance(exchange_id, user_id, api_key_id):
+    return get_account_balance_cache().get(exchange_id, user_id, api_key_id)
+
+
+def shared_stats():
+    """Counters summed over every worker process, as recorded by their last flush."""
+    with db_transaction() as db_client:
+        db_client.cursor.execute(load_query("select_account_balance_cache_stats.sql"))
+        counts = dict.fromkeys(OUTCOMES, 0)
+        counts.update({outcome: int(requests) for outcome, requests in db_client.cursor.fetchall()})
+    return _with_ratio(counts)
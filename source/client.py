@@ -6,6 +6,7 @@ import requests
 import json
 from datetime import datetime, timezone
 from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 from urllib3.util.retry import Retry
 from datetime import datetime
 from types import SimpleNamespace
@@ -25,6 +26,49 @@ from eth_abi import encode
 import math
 
 
+class OrderSubmitError(Exception):
+    """
+    Falha ao enviar uma ordem. `response` traz o corpo devolvido pela
+    exchange, quando houver.
+    """
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+
+class OrderNotSent(OrderSubmitError):
+    """A requisição nunca chegou à exchange (falha de conexão): pode ser reenviada."""
+
+
+class OrderRejected(OrderSubmitError):
+    """A exchange recusou a ordem explicitamente: nada foi executado."""
+
+
+class OrderOutcomeUnknown(OrderSubmitError):
+    """
+    A requisição pode ter chegado à exchange (timeout de leitura, 5xx, resposta
+    ilegível): a ordem pode existir e não deve ser reenviada às cegas.
+    """
+
+
+def _order_submit_error(exchange, error):
+    """Classifica uma exceção do requests levantada ao enviar uma ordem."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return OrderNotSent(f"[{exchange}] Sem conexão com a exchange: {error}")
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        if isinstance(reason, NewConnectionError):
+            return OrderNotSent(f"[{exchange}] Sem conexão com a exchange: {error}")
+    response = getattr(error, 'response', None)
+    if response is not None and 400 <= response.status_code < 500 and response.status_code != 408:
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+        return OrderRejected(f"[{exchange}] Ordem recusada ({response.status_code}): {body}", body)
+    return OrderOutcomeUnknown(f"[{exchange}] Resultado do envio desconhecido: {error}")
+
+
 class BaseClient:
     def __init__(self):
         self.session = self.create_session_with_retries()
@@ -37,6 +81,9 @@ class BaseClient:
         session.mount('http://', adapter)
         return session
 
+OKX_UNKNOWN_ORDER_CODES = {"50001", "50004", "50013", "50026"}
+
+
 class OKXClient(BaseClient):
     def __init__(self, credentials, url='https://www.okx.com'):
         super().__init__()
@@ -53,7 +100,7 @@ class OKXClient(BaseClient):
         d = mac.digest()
         return base64.b64encode(d).decode()
 
-    def send_request(self, method, request_path, body=None):
+    def send_request(self, method, request_path, body=None, raise_errors=False):
         timestamp = datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
         body_str = json.dumps(body) if body else ''
         headers = {
@@ -72,6 +119,8 @@ class OKXClient(BaseClient):
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"[OKX] Error: {e}")
+            if raise_errors:
+                raise
             return None
         
 
@@ -105,7 +154,7 @@ class OKXClient(BaseClient):
 
 
 
-    def place_order(self, symbol, side, order_type, size, currency, price=None):
+    def place_order(self, symbol, side, order_type, size, currency, price=None, client_order_id=None):
         tgtCcy = "quote_ccy" if side == "buy" else "base_ccy"
         
         print(f'\nSending Order: {symbol},{side},{order_type},{size} in {tgtCcy}')
@@ -119,10 +168,34 @@ class OKXClient(BaseClient):
             "px": price,
             "tgtCcy": tgtCcy,
         }
-        response = self.send_request('POST', '/api/v5/trade/order', body)
-        if response and "data" in response:
+        if client_order_id:
+            body["clOrdId"] = client_order_id
+        try:
+            response = self.send_request('POST', '/api/v5/trade/order', body, raise_errors=True)
+        except requests.exceptions.RequestException as e:
+            raise _order_submit_error("OKX", e) from e
+        if response.get("code") != "0":
+            # 50001/50004/50013/50026: serviço indisponível ou ocupado, a ordem pode ter entrado
+            if response.get("code") in OKX_UNKNOWN_ORDER_CODES:
+                raise OrderOutcomeUnknown(f"[OKX] Resultado do envio desconhecido: {response}", response)
+            raise OrderRejected(f"[OKX] Ordem recusada: {response}", response)
+        return response["data"]
+
+    def get_order_by_client_id(self, symbol, client_order_id):
+        """
+        Busca uma ordem pelo clOrdId. Retorna a lista 'data' (mesmo formato de
+        place_order), None se a OKX informar que a ordem não existe, e levanta
+        exceção se a consulta falhar (resultado desconhecido).
+        """
+        request_path = f'/api/v5/trade/order?instId={symbol}&clOrdId={client_order_id}'
+        response = self.send_request('GET', request_path)
+        if response is None:
+            raise RuntimeError(f"[OKX] Order lookup failed for clOrdId={client_order_id}")
+        if response.get("code") == "0" and response.get("data"):
             return response["data"]
-        return None
+        if response.get("code") == "51603":  # Order does not exist
+            return None
+        raise RuntimeError(f"[OKX] Order lookup error for clOrdId={client_order_id}: {response}")
    
     def wait_for_fill_price(self, order_id, check_interval=1, timeout=90):
         """
@@ -216,6 +289,26 @@ class OKXClient(BaseClient):
         print(f"[OKX] Não foi possível obter o saldo para a moeda: {ccy}. Resposta da API: {response}")
         return 0.0
 
+    def get_balances(self, ccys):
+        """
+        Saldo disponível de várias moedas numa única requisição
+        (a OKX aceita até 20 moedas separadas por vírgula).
+
+        Returns:
+            dict: {MOEDA: float}; moedas sem saldo ficam de fora.
+        """
+        request_path = f'/api/v5/account/balance?ccy={",".join(ccys)}'
+        response = self.send_request('GET', request_path)
+        if not response or response.get('code') != '0':
+            raise RuntimeError(f"[OKX] Falha ao obter saldos de {ccys}: {response}")
+        balances = {}
+        for account in response.get('data') or []:
+            for detail in account.get('details') or []:
+                avail = detail.get('availBal')
+                if detail.get('ccy') and avail not in (None, ''):
+                    balances[detail['ccy'].upper()] = float(avail)
+        return balances
+
     def get_last_trade(self, symbol):
         body = {"instId": symbol, "limit": "100"}
         response = self.send_request('GET', '/api/v5/trade/fills', body)
@@ -327,7 +420,7 @@ class BinanceClient(BaseClient):
         params['signature'] = signature
         return params
 
-    def send_signed_request(self, method, endpoint, params=None):
+    def send_signed_request(self, method, endpoint, params=None, raise_errors=False):
         params = params or {}
         params['timestamp'] = int(time.time() * 1000)
         params['recvWindow'] = 10000
@@ -360,6 +453,8 @@ class BinanceClient(BaseClient):
             # so `if e.response:` silently skipped logging the server body on errors.
             if e.response is not None:
                 general_logger.error(f"[Binance] Server response ({e.response.status_code}): {e.response.text}")
+            if raise_errors:
+                raise
             return None
 
     def get_symbol_info(self, symbol):
@@ -401,19 +496,27 @@ class BinanceClient(BaseClient):
         factor = 10 ** decimals
         return math.floor(quantity * factor) / factor
 
-    def place_order(self, symbol, side, order_type, size, currency, price=None):
+    def place_order(self, symbol, side, order_type, size, currency, price=None, client_order_id=None):
         """
         Place an order on Binance.
 
         For MARKET orders:
         - BUY: uses quoteOrderQty (size = amount of quote currency to spend)
         - SELL: uses quantity (size = amount of base currency to sell)
+
+        client_order_id is sent as newClientOrderId: Binance rejects a second
+        open order with the same id.
+
+        Raises OrderNotSent, OrderRejected or OrderOutcomeUnknown when the
+        submission fails.
         """
         params = {
             "symbol": symbol,
             "side": side.upper(),
             "type": order_type.upper(),
         }
+        if client_order_id:
+            params["newClientOrderId"] = client_order_id
 
         if order_type.upper() == "MARKET":
             if side.upper() == "BUY":
@@ -444,8 +547,32 @@ class BinanceClient(BaseClient):
             params["price"] = price
             params["timeInForce"] = "GTC"
 
-        response = self.send_signed_request("POST", "/api/v3/order", params)
-        return response
+        try:
+            return self.send_signed_request("POST", "/api/v3/order", params, raise_errors=True)
+        except requests.exceptions.RequestException as e:
+            raise _order_submit_error("Binance", e) from e
+
+    def get_order_by_client_id(self, symbol, client_order_id):
+        """
+        Query an order by its client order id (origClientOrderId).
+
+        Returns the order dict, None when Binance reports it does not exist
+        (-2013), and raises when the query itself fails (outcome unknown).
+        """
+        try:
+            return self.send_signed_request(
+                "GET", "/api/v3/order",
+                {"symbol": symbol, "origClientOrderId": client_order_id},
+                raise_errors=True,
+            )
+        except requests.exceptions.HTTPError as e:
+            try:
+                code = e.response.json().get("code")
+            except ValueError:
+                code = None
+            if code == -2013:
+                return None
+            raise
 
     def get_balance(self, asset=None):
         general_logger.info(f"[Binance] Fetching balance for asset: {asset}")
@@ -500,11 +627,12 @@ class BingXClient:
             hashlib.sha256
         ).hexdigest()
 
-    def _send_request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None, params_in_body: bool = False) -> Optional[Dict[str, Any]]:
+    def _send_request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None, params_in_body: bool = False, raise_errors: bool = False) -> Optional[Dict[str, Any]]:
         """
         Envia uma requisição assinada para a API da BingX.
         O parâmetro 'params_in_body' foi ajustado para ter 'False' como padrão,
         que é o caso mais comum para endpoints de trade.
+        Com raise_errors=True, erros HTTP são relançados em vez de retornar None.
         """
         if params is None:
             params = {}
@@ -552,6 +680,8 @@ class BingXClient:
             print(f"[BingX] Erro na requisição: {e}")
             if e.response:
                 print(f"[BingX] Resposta do Servidor: {e.response.text}")
+            if raise_errors:
+                raise
             return None
 
     def get_balance(self) -> Optional[Dict[str, Any]]:
@@ -560,10 +690,11 @@ class BingXClient:
         # Este endpoint específico requer os parâmetros no corpo.
         return self._send_request('POST', path, params_in_body=True)
     
-    def place_order(self, symbol: str, side: str, order_type: str, quantity: Optional[float] = None, quoteOrderQty: Optional[float] = None, price: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    def place_order(self, symbol: str, side: str, order_type: str, quantity: Optional[float] = None, quoteOrderQty: Optional[float] = None, price: Optional[float] = None, client_order_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Envia uma nova ordem para a exchange.
         Aceita 'quantity' (para moeda base) ou 'quoteOrderQty' (para moeda de cotação).
+        Levanta OrderNotSent, OrderRejected ou OrderOutcomeUnknown se o envio falhar.
         """
         path = '/openApi/spot/v1/trade/order'
         
@@ -591,8 +722,37 @@ class BingXClient:
                 raise ValueError("O preço é obrigatório para ordens do tipo LIMIT.")
             order_params['price'] = price
 
+        if client_order_id:
+            order_params['newClientOrderId'] = client_order_id
+
         # Este endpoint requer os parâmetros na URL, então params_in_body=False.
-        return self._send_request('POST', path, params=order_params, params_in_body=False)
+        try:
+            response = self._send_request('POST', path, params=order_params, params_in_body=False, raise_errors=True)
+        except requests.exceptions.RequestException as e:
+            raise _order_submit_error("BingX", e) from e
+        if response.get('code') != 0:
+            # 100500/100503: erro interno ou serviço indisponível, a ordem pode ter entrado
+            if response.get('code') in (100500, 100503):
+                raise OrderOutcomeUnknown(f"[BingX] Resultado do envio desconhecido: {response}", response)
+            raise OrderRejected(f"[BingX] Ordem recusada: {response}", response)
+        return response
+
+    def get_order_by_client_id(self, symbol: str, client_order_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca uma ordem pelo clientOrderID. Retorna a resposta completa
+        ({"code": 0, "data": {...}}, mesmo formato de place_order), None se a
+        BingX informar que a ordem não existe, e levanta exceção se a consulta
+        falhar (resultado desconhecido).
+        """
+        path = '/openApi/spot/v1/trade/query'
+        response = self._send_request('GET', path, params={"symbol": symbol, "clientOrderID": client_order_id})
+        if response is None:
+            raise RuntimeError(f"[BingX] Order lookup failed for clientOrderID={client_order_id}")
+        if response.get('code') == 0 and response.get('data'):
+            return response
+        if 'not exist' in str(response.get('msg', '')).lower():
+            return None
+        raise RuntimeError(f"[BingX] Order lookup error for clientOrderID={client_order_id}: {response}")
 
 class HyperliquidClient(BaseClient):
     """
@@ -762,9 +922,10 @@ class AsterClient(BaseClient):
         ).hexdigest()
         return signature
 
-    def _send_request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    def _send_request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None, raise_errors: bool = False) -> Optional[Dict[str, Any]]:
         """
         Prepara e envia uma requisição assinada para a API da AsterDex.
+        Com raise_errors=True, erros HTTP são relançados em vez de retornar None.
         """
         params = params or {}
         
@@ -800,6 +961,8 @@ class AsterClient(BaseClient):
             print(f"[AsterDex] Erro na requisição: {e}")
             if e.response:
                 print(f"[AsterDex] Resposta do Servidor ({e.response.status_code}): {e.response.text}")
+            if raise_errors:
+                raise
             return None
 
     def get_balance(self) -> Optional[Dict[str, Any]]:
@@ -810,7 +973,7 @@ class AsterClient(BaseClient):
         # Não são necessários parâmetros além de timestamp e signature, que são adicionados por _send_request
         return self._send_request('GET', '/api/v1/account')
 
-    def place_order(self, symbol: str, side: str, size: float) -> Optional[Dict[str, Any]]:
+    def place_order(self, symbol: str, side: str, size: float, client_order_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Envia uma nova ordem a mercado (MARKET).
 
@@ -819,6 +982,9 @@ class AsterClient(BaseClient):
             side (str): O lado da ordem ('BUY' ou 'SELL').
             size (float): A quantidade. Para 'BUY', é o valor a ser gasto (ex: 10 USDT).
                           Para 'SELL', é a quantidade a ser vendida (ex: 0.1 BTC).
+            client_order_id (str): ID determinístico da ordem (newClientOrderId).
+
+        Levanta OrderNotSent, OrderRejected ou OrderOutcomeUnknown se o envio falhar.
         """        
         params = {
             "symbol": symbol,
@@ -835,7 +1001,34 @@ class AsterClient(BaseClient):
         else:
             raise ValueError("O parâmetro 'side' deve ser 'BUY' ou 'SELL'.")
 
-        return self._send_request('POST', '/api/v1/order', params=params)
+        if client_order_id:
+            params['newClientOrderId'] = client_order_id
+
+        try:
+            return self._send_request('POST', '/api/v1/order', params=params, raise_errors=True)
+        except requests.exceptions.RequestException as e:
+            raise _order_submit_error("AsterDex", e) from e
+
+    def get_order_by_client_id(self, symbol: str, client_order_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca uma ordem pelo origClientOrderId. Retorna o dict da ordem, None
+        se a AsterDex informar que ela não existe (-2013), e levanta exceção se
+        a consulta falhar (resultado desconhecido).
+        """
+        try:
+            return self._send_request(
+                'GET', '/api/v1/order',
+                params={"symbol": symbol, "origClientOrderId": client_order_id},
+                raise_errors=True,
+            )
+        except requests.exceptions.HTTPError as e:
+            try:
+                code = e.response.json().get("code")
+            except ValueError:
+                code = None
+            if code == -2013:
+                return None
+            raise
 
 class PhemexClient(BaseClient):
     """
@@ -888,9 +1081,11 @@ class PhemexClient(BaseClient):
         return signature
 
     def _send_request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None,
-                     body: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+                     body: Optional[Dict[str, Any]] = None, raise_errors: bool = False) -> Optional[Dict[str, Any]]:
         """
         Prepara e envia uma requisição assinada para a API da Phemex.
+        Com raise_errors=True, erros HTTP são relançados e uma resposta com
+        código de erro levanta OrderRejected, em vez de retornar None.
         """
         # Expiry: timestamp Unix em SEGUNDOS (não milissegundos) + 60 segundos
         expiry = int(time.time()) + 60
@@ -945,6 +1140,8 @@ class PhemexClient(BaseClient):
                 # Phemex retorna código 0 para sucesso
                 if response_data.get('code') != 0:
                     print(f"[Phemex] Erro na API: {response_data.get('msg', 'Erro desconhecido')}")
+                    if raise_errors:
+                        raise OrderRejected(f"[Phemex] Requisição recusada: {response_data}", response_data)
                     return None
                 return response_data.get('data')
 
@@ -952,6 +1149,8 @@ class PhemexClient(BaseClient):
             print(f"[Phemex] Erro na requisição: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 print(f"[Phemex] Resposta do Servidor ({e.response.status_code}): {e.response.text}")
+            if raise_errors:
+                raise
             return None
 
     def get_balance(self, currency: Optional[str] = None) -> float:
@@ -993,8 +1192,30 @@ class PhemexClient(BaseClient):
         print(f"[Phemex] Moeda '{currency}' não encontrada na carteira spot.")
         return 0.0
 
+    def get_balances(self) -> Dict[str, float]:
+        """
+        Saldo disponível de todas as moedas da carteira spot numa única
+        requisição. Levanta exceção se a consulta falhar.
+
+        Returns:
+            dict: {MOEDA: float}
+        """
+        response = self._send_request('GET', '/spot/wallets')
+        if not isinstance(response, list):
+            raise RuntimeError(f"[Phemex] Falha ao obter os saldos: {response}")
+        balances = {}
+        for wallet in response:
+            available_ev = (
+                wallet.get('balanceEv', 0)
+                - wallet.get('lockedTradingBalanceEv', 0)
+                - wallet.get('lockedWithdrawEv', 0)
+            )
+            balances[wallet.get('currency', '').upper()] = self._from_scaled_value(available_ev)
+        return balances
+
     def place_order(self, symbol: str, side: str, order_type: str, size: float,
-                   currency: str, price: Optional[float] = None) -> Optional[Dict[str, Any]]:
+                   currency: str, price: Optional[float] = None,
+                   client_order_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Envia uma nova ordem para a exchange.
 
@@ -1005,9 +1226,12 @@ class PhemexClient(BaseClient):
             size (float): Tamanho da ordem.
             currency (str): Moeda usada (base ou quote).
             price (float): Preço da ordem (obrigatório para LIMIT).
+            client_order_id (str): ID determinístico da ordem (clOrdID); sem ele,
+                um UUID aleatório.
 
         Returns:
-            dict or None: A resposta da API da exchange.
+            dict or None: A resposta da API da exchange. Levanta OrderNotSent,
+            OrderRejected ou OrderOutcomeUnknown se o envio falhar.
         """
         path = '/spot/orders'
 
@@ -1049,10 +1273,30 @@ class PhemexClient(BaseClient):
 
         # Campos opcionais
         order_body['stopPxEp'] = '0'
-        order_body['clOrdID'] = str(uuid.uuid4())  # Client Order ID único
+        order_body['clOrdID'] = client_order_id or str(uuid.uuid4())  # Client Order ID
 
-        response = self._send_request('POST', path, body=order_body)
-        return response
+        try:
+            return self._send_request('POST', path, body=order_body, raise_errors=True)
+        except requests.exceptions.RequestException as e:
+            raise _order_submit_error("Phemex", e) from e
+
+    def get_order_by_client_id(self, symbol: str, client_order_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca uma ordem (aberta ou encerrada) pelo clOrdID.
+
+        Returns:
+            dict or None: A ordem, ou None se a Phemex não a conhecer. Levanta
+            exceção se a consulta falhar (resultado desconhecido).
+        """
+        path = '/exchange/spot/order'
+        response = self._send_request('GET', path, params={'symbol': symbol, 'clOrdID': client_order_id})
+        if response is None:
+            raise RuntimeError(f"[Phemex] Order lookup failed for clOrdID={client_order_id}")
+        orders = response if isinstance(response, list) else response.get('rows', [])
+        for order in orders:
+            if order.get('clOrdID') == client_order_id:
+                return order
+        return None
 
     def get_order_status(self, symbol: str, order_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -1,8 +1,13 @@
 from contextlib import contextmanager
+import os
+import threading
 from .pp import ConfigLoader
 from .dbmanager import DatabaseClient
-import psycopg2
-import os
+from .timescale import timescale_cursor
+
+_db_pool = None
+_db_pool_pid = None
+_db_pool_lock = threading.Lock()
 
 @contextmanager
 def get_db_connection():
@@ -21,30 +26,60 @@ def get_db_connection():
         db_client.close()
 
 
+def get_db_pool():
+    """
+    Pool de conexões do banco principal deste processo (aberto no primeiro uso,
+    e de novo após um fork: o pool herdado do processo pai não é usado).
+    Tamanho: DB_POOL_MIN / DB_POOL_MAX.
+    """
+    global _db_pool, _db_pool_pid
+    if _db_pool is not None and _db_pool_pid == os.getpid():
+        return _db_pool
+    with _db_pool_lock:
+        if _db_pool is None or _db_pool_pid != os.getpid():
+            from psycopg_pool import ConnectionPool
+
+            config = ConfigLoader()
+            _db_pool = ConnectionPool(
+                kwargs={
+                    "dbname": config.get('database', 'dbname'),
+                    "user": config.get('database', 'user'),
+                    "password": config.get('database', 'password'),
+                    "host": config.get('database', 'host'),
+                    "port": int(config.get('database', 'port')),
+                },
+                min_size=int(os.getenv("DB_POOL_MIN", "1")),
+                max_size=int(os.getenv("DB_POOL_MAX", "4")),
+                timeout=float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10")),
+                check=ConnectionPool.check_connection,
+                name=f"main-{os.getpid()}",
+                open=True,
+            )
+            _db_pool_pid = os.getpid()
+    return _db_pool
+
+
 @contextmanager
-def get_timescale_db_connection():
+def db_transaction():
+    """
+    Uma conexão do pool e uma transação: commit ao sair do bloco, rollback se
+    ele levantar exceção. Fornece um DatabaseClient (use .cursor / .conn);
+    funções que aceitam db_client= escrevem nessa mesma transação.
+    """
+    with get_db_pool().connection() as conn:
+        db_client = DatabaseClient.from_connection(conn)
+        try:
+            yield db_client
+        finally:
+            db_client.cursor.close()
+
+
+@contextmanager
+def get_timescale_db_connection(statement_timeout_ms=None):
     """
     Context manager para conexões com o banco de dados TimescaleDB (leitura de preços).
-    Lê as variáveis de ambiente TIMESCALE_*.
+    Fornece um cursor de uma conexão do pool do processo (source/timescale.py);
+    lê as variáveis de ambiente TIMESCALE_*.
     """
-    try:
-        # Pega as credenciais do .env.prd (que o Docker injeta)
-        # O host 'db_timescale' é o nome do serviço no docker-compose
-        conn = psycopg2.connect(
-            dbname=os.getenv("TIMESCALE_DB"),
-            user=os.getenv("TIMESCALE_USER"),
-            password=os.getenv("TIMESCALE_PASSWORD"),
-            host=os.getenv("TIMESCALE_HOST", "db_timescale"), 
-            port="5432" # Porta interna do Docker
-        )
-        cursor = conn.cursor()
-        yield cursor  # Fornece o cursor para o bloco 'with'
-    except Exception as e:
-        # Em um cenário real, logger.error(f"Erro de conexão com TimescaleDB: {e}")
-        print(f"Erro de conexão com TimescaleDB: {e}")
-        raise
-    finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
-        if 'conn' in locals() and conn:
-            conn.close()
\ No newline at end of file
+    with timescale_cursor(statement_timeout_ms) as cursor:
+        yield cursor
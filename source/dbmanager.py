@@ -31,6 +31,19 @@ class DatabaseClient:
         self.conn = None
         self.cursor = None
 
+    @classmethod
+    def from_connection(cls, conn):
+        """
+        Cliente sobre uma conexão já aberta (ex.: do pool em context.db_transaction).
+        Quem abriu a conexão cuida do commit e da devolução; não use os métodos
+        que reconectam (fetch_data, insert_data, ...).
+        """
+        client = cls.__new__(cls)
+        client.connection_params = None
+        client.conn = conn
+        client.cursor = conn.cursor()
+        return client
+
     def connect(self):
         """
         Conecta ao banco de dados usando os parâmetros fornecidos.
@@ -1,5 +1,5 @@
 from log.log import general_logger
-from .client import OKXClient, OKXDemoClient, BinanceClient, BinanceDemoClient, BingXClient, AsterClient, PhemexClient, PhemexTestnetClient
+from .client import OKXClient, OKXDemoClient, BinanceClient, BinanceDemoClient, BingXClient, AsterClient, PhemexClient, PhemexTestnetClient, OrderSubmitError
 from .context import get_db_connection
 from .dbmanager import load_query
 from typing import Dict, Any, Optional
@@ -26,7 +26,24 @@ class ExchangeInterface:
     def create_client(self):
         raise NotImplementedError
 
-    def place_order(self, symbol, side, order_type, size, currency, price=None):
+    def place_order(self, symbol, side, order_type, size, currency, price=None, client_order_id=None):
+        """
+        client_order_id: deterministic id of the order intent
+        (source/idempotency.client_order_id), sent as the exchange's client
+        order id so a repeated submission is recognized as the same order.
+
+        Raises OrderNotSent (never reached the exchange), OrderRejected
+        (explicit rejection, body in `.response`) or OrderOutcomeUnknown
+        (the order may exist) from source.client when the submission fails.
+        """
+        raise NotImplementedError
+
+    def get_order_by_client_id(self, symbol, client_order_id):
+        """
+        Order placed with `client_order_id`, in the same shape place_order
+        returns; None when the exchange reports no such order. Raises when
+        the lookup fails: the order may or may not exist.
+        """
         raise NotImplementedError
 
     def get_fill_price(self, order_id):
@@ -50,6 +67,14 @@ class ExchangeInterface:
     def get_balance(self, ccy=None):
         raise NotImplementedError
 
+    def get_balances(self, ccys):
+        """
+        Saldo disponível de várias moedas de uma vez: {MOEDA: float}, 0.0 para
+        moedas sem saldo. As exchanges que retornam a conta inteira numa
+        requisição sobrescrevem este método; o padrão consulta moeda a moeda.
+        """
+        return {ccy.upper(): float(self.get_balance(ccy) or 0.0) for ccy in ccys}
+
     def get_order_execution_price(self, symbol, order_id):
         raise NotImplementedError
 
@@ -61,8 +86,11 @@ class OKXRealInterface(ExchangeInterface):
     def create_client(self):
         return OKXClient(self.credentials)
 
-    def place_order(self, symbol, side, order_type, size, currency, price=None):
-        return self.okx_client.place_order(symbol, side, order_type, size, currency, price)
+    def place_order(self, symbol, side, order_type, size, currency, price=None, client_order_id=None):
+        return self.okx_client.place_order(symbol, side, order_type, size, currency, price, client_order_id)
+
+    def get_order_by_client_id(self, symbol, client_order_id):
+        return self.okx_client.get_order_by_client_id(symbol, client_order_id)
 
     def get_fill_price(self, order_id):
         return self.okx_client.wait_for_fill_price(order_id)
@@ -85,6 +113,10 @@ class OKXRealInterface(ExchangeInterface):
     def get_balance(self, ccy=None):
         return self.okx_client.get_balance(ccy)
 
+    def get_balances(self, ccys):
+        balances = self.okx_client.get_balances([ccy.upper() for ccy in ccys])
+        return {ccy.upper(): balances.get(ccy.upper(), 0.0) for ccy in ccys}
+
     def get_order_execution_price(self, symbol, order_id):
         return self.okx_client.get_order_execution_price(symbol, order_id)
 
@@ -108,9 +140,12 @@ class BinanceRealInterface(ExchangeInterface):
         """
         return symbol.replace('-', '')
 
-    def place_order(self, symbol, side, order_type, size, currency, price=None):
+    def place_order(self, symbol, side, order_type, size, currency, price=None, client_order_id=None):
         normalized_symbol = self.normalize_symbol(symbol)
-        return self.binance_client.place_order(normalized_symbol, side, order_type, size, currency, price)
+        return self.binance_client.place_order(normalized_symbol, side, order_type, size, currency, price, client_order_id)
+
+    def get_order_by_client_id(self, symbol, client_order_id):
+        return self.binance_client.get_order_by_client_id(self.normalize_symbol(symbol), client_order_id)
 
     def get_balance(self, ccy: Optional[str] = None) -> float:
         """
@@ -137,6 +172,14 @@ class BinanceRealInterface(ExchangeInterface):
         general_logger.info(f"[BinanceInterface] Balance for {ccy}: {balance_value}")
         return balance_value
 
+    def get_balances(self, ccys):
+        """Saldos 'free' de várias moedas com uma única chamada a /api/v3/account."""
+        balances_data = self.binance_client.get_balance()
+        if not balances_data:
+            raise RuntimeError(f"[BinanceInterface] Failed to fetch account balances for {ccys}")
+        free = {b.get("asset", "").upper(): float(b.get("free", 0.0)) for b in balances_data}
+        return {ccy.upper(): free.get(ccy.upper(), 0.0) for ccy in ccys}
+
 class BinanceDemoInterface(BinanceRealInterface):
     def create_client(self):
         return BinanceDemoClient(self.credentials)
@@ -164,6 +207,26 @@ class BingXInterface(ExchangeInterface):
                    moeda não for encontrada ou em caso de erro na comunicação
                    com a API.
         """
+        balances = self._fetch_spot_balances(ccy)
+
+        for asset in balances:
+            if asset.get('asset', '').upper() == ccy.upper():
+                return float(asset.get('free', 0.0))
+
+        general_logger.info(
+            f"[BingXInterface] Coin '{ccy}' not held in spot wallet for "
+            f"user_id={self.user_id} (zero balance)"
+        )
+        return 0.0
+
+    def get_balances(self, ccys):
+        """Saldos livres de várias moedas com uma única consulta à conta spot."""
+        balances = self._fetch_spot_balances(",".join(ccys))
+        free = {asset.get('asset', '').upper(): float(asset.get('free', 0.0)) for asset in balances}
+        return {ccy.upper(): free.get(ccy.upper(), 0.0) for ccy in ccys}
+
+    def _fetch_spot_balances(self, ccy):
+        """Lista de ativos da conta spot; levanta RuntimeError se a consulta falhar."""
         balance_data = self.bingx_client.get_balance()
 
         # Network/HTTP failure — client returned None
@@ -191,19 +254,9 @@ class BingXInterface(ExchangeInterface):
                 f"(user_id={self.user_id}, ccy={ccy})"
             )
 
-        balances = balance_data.get("data", {}).get("balances", [])
-
-        for asset in balances:
-            if asset.get('asset', '').upper() == ccy.upper():
-                return float(asset.get('free', 0.0))
-
-        general_logger.info(
-            f"[BingXInterface] Coin '{ccy}' not held in spot wallet for "
-            f"user_id={self.user_id} (zero balance)"
-        )
-        return 0.0
+        return balance_data.get("data", {}).get("balances", [])
     
-    def place_order(self, symbol: str, side: str, order_type: str, size: float, price: float=None, **kwargs) -> Optional[Dict[str, Any]]:
+    def place_order(self, symbol: str, side: str, order_type: str, size: float, price: float=None, client_order_id: Optional[str] = None, **kwargs) -> Optional[Dict[str, Any]]:
         """
         Abstrai a criação de uma ordem, chamando o método correspondente do cliente
         e utilizando o parâmetro de quantidade correto ('quantity' ou 'quoteOrderQty')
@@ -216,6 +269,7 @@ class BingXInterface(ExchangeInterface):
             size (float): Tamanho da ordem. Para 'BUY', é o valor em moeda de cotação (USDT).
                           Para 'SELL', é o valor em moeda base (BTC).
             price (float): Preço da ordem (usado para ordens LIMIT).
+            client_order_id (str): ID determinístico da ordem (newClientOrderId).
             kwargs: Argumentos adicionais para compatibilidade.
 
         Returns:
@@ -228,7 +282,8 @@ class BingXInterface(ExchangeInterface):
                 "symbol": symbol,
                 "side": side,
                 "order_type": order_type,
-                "price": price
+                "price": price,
+                "client_order_id": client_order_id
             }
 
             # Lógica principal: decide qual parâmetro de quantidade usar
@@ -250,6 +305,9 @@ class BingXInterface(ExchangeInterface):
             print(f"[BingXInterface] Erro ao criar ordem: {e}")
             return None
 
+    def get_order_by_client_id(self, symbol: str, client_order_id: str) -> Optional[Dict[str, Any]]:
+        return self.bingx_client.get_order_by_client_id(symbol, client_order_id)
+
 class AsterInterface(ExchangeInterface):
     def __init__(self, exchange_id, user_id, api_key):
         super().__init__(exchange_id, user_id, api_key)
@@ -290,8 +348,16 @@ class AsterInterface(ExchangeInterface):
         # 5. Se não encontrar a moeda, retorna 0.0
         general_logger.info(f"[AsterInterface] Moeda '{ccy}' não encontrada na conta.")
         return 0.0
+
+    def get_balances(self, ccys):
+        """Saldos 'free' de várias moedas com uma única consulta a /api/v1/account."""
+        account_data = self.aster_client.get_balance()
+        if not account_data or 'balances' not in account_data:
+            raise RuntimeError(f"[AsterInterface] Não foi possível obter os saldos: {account_data}")
+        free = {b.get('asset', '').upper(): float(b.get('free', 0.0)) for b in account_data['balances']}
+        return {ccy.upper(): free.get(ccy.upper(), 0.0) for ccy in ccys}
     
-    def place_order(self, symbol: str, side: str, order_type: str, size: float, **kwargs) -> Optional[Dict[str, Any]]:
+    def place_order(self, symbol: str, side: str, order_type: str, size: float, client_order_id: Optional[str] = None, **kwargs) -> Optional[Dict[str, Any]]:
         """
         Abstrai a criação de uma ordem a mercado, chamando o cliente e formatando a resposta.
         Como o cliente já está focado em ordens a mercado, o parâmetro 'order_type' é ignorado.
@@ -302,6 +368,7 @@ class AsterInterface(ExchangeInterface):
             order_type (str): Tipo da ordem (ignorado, sempre será 'MARKET').
             size (float): Tamanho da ordem. Para 'BUY', é o valor em moeda de cotação (USDT).
                           Para 'SELL', é o valor em moeda base (BTC).
+            client_order_id (str): ID determinístico da ordem (newClientOrderId).
             kwargs: Argumentos adicionais para compatibilidade com a classe base.
 
         Returns:
@@ -312,7 +379,8 @@ class AsterInterface(ExchangeInterface):
             raw_order_response = self.aster_client.place_order(
                 symbol=symbol,
                 side=side,
-                size=size
+                size=size,
+                client_order_id=client_order_id
             )
 
             # 2. Verifica se a criação da ordem foi bem-sucedida
@@ -334,11 +402,30 @@ class AsterInterface(ExchangeInterface):
             
             general_logger.info(f"[AsterInterface] Ordem criada com sucesso: {formatted_order}")
             return formatted_order
-            
+
+        except OrderSubmitError:
+            # O chamador decide se pode reenviar a partir do tipo da falha
+            raise
         except Exception as e:
             general_logger.error(f"[AsterInterface] Exceção ao criar ordem: {e}")
             return None
 
+    def get_order_by_client_id(self, symbol: str, client_order_id: str) -> Optional[Dict[str, Any]]:
+        """Busca a ordem pelo client order id, no mesmo formato de place_order."""
+        raw_order = self.aster_client.get_order_by_client_id(symbol, client_order_id)
+        if not raw_order:
+            return None
+        return {
+            'order_id': raw_order.get('orderId'),
+            'symbol': raw_order.get('symbol'),
+            'side': raw_order.get('side'),
+            'type': raw_order.get('type'),
+            'status': raw_order.get('status'),
+            'client_order_id': raw_order.get('clientOrderId'),
+            'update_time': raw_order.get('updateTime'),
+            'raw_response': raw_order
+        }
+
 class PhemexRealInterface(ExchangeInterface):
     def __init__(self, exchange_id, user_id, api_key):
         super().__init__(exchange_id, user_id, api_key)
@@ -359,9 +446,12 @@ class PhemexRealInterface(ExchangeInterface):
             clean_symbol = 's' + clean_symbol
         return clean_symbol
 
-    def place_order(self, symbol, side, order_type, size, currency, price=None):
+    def place_order(self, symbol, side, order_type, size, currency, price=None, client_order_id=None):
         normalized_symbol = self.normalize_symbol(symbol)
-        return self.phemex_client.place_order(normalized_symbol, side, order_type, size, currency, price)
+        return self.phemex_client.place_order(normalized_symbol, side, order_type, size, currency, price, client_order_id)
+
+    def get_order_by_client_id(self, symbol, client_order_id):
+        return self.phemex_client.get_order_by_client_id(self.normalize_symbol(symbol), client_order_id)
 
     def get_fill_price(self, order_id, symbol):
         normalized_symbol = self.normalize_symbol(symbol)
@@ -408,6 +498,10 @@ class PhemexRealInterface(ExchangeInterface):
         balance_value = self.phemex_client.get_balance(currency=ccy)
         return balance_value
 
+    def get_balances(self, ccys):
+        balances = self.phemex_client.get_balances()
+        return {ccy.upper(): balances.get(ccy.upper(), 0.0) for ccy in ccys}
+
     def get_order_execution_price(self, symbol, order_id):
         normalized_symbol = self.normalize_symbol(symbol)
         return self.phemex_client.wait_for_fill_price(order_id, normalized_symbol)
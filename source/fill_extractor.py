@@ -59,3 +59,84 @@ def extract_filled_base_qty(order_response):
 
     general_logger.info(f"[FillExtractor] Could not extract filled qty from response, returning 0")
     return Decimal('0')
+
+
+def _ratio(quote, base):
+    """quote / base as Decimal, or None if either side is missing or zero."""
+    if quote in (None, "") or base in (None, ""):
+        return None
+    quote, base = Decimal(str(quote)), Decimal(str(base))
+    if quote <= 0 or base <= 0:
+        return None
+    return quote / base
+
+
+def _vwap(fills):
+    """Volume-weighted price of a Binance-style fills list [{price, qty}, ...]."""
+    if not isinstance(fills, list) or not fills:
+        return None
+    notional = sum(Decimal(str(f["price"])) * Decimal(str(f["qty"])) for f in fills)
+    qty = sum(Decimal(str(f["qty"])) for f in fills)
+    return notional / qty if qty > 0 else None
+
+
+def extract_fill_price(order_response):
+    """
+    Extract the volume-weighted execution price from an exchange order response.
+
+    Same format detection as extract_filled_base_qty. The price is derived as
+    filled quote / filled base where the exchange reports both, falling back
+    to its average/fill price fields.
+
+    Returns:
+        Decimal: The execution price, or None if the response carries no fill price
+        (the operation then goes through TimescaleDB price enrichment).
+    """
+    if not order_response or not isinstance(order_response, dict):
+        return None
+
+    try:
+        # Binance: {"executedQty": ..., "cummulativeQuoteQty": ..., "fills": [...]}
+        if "executedQty" in order_response:
+            price = _ratio(order_response.get("cummulativeQuoteQty"), order_response["executedQty"])
+            price = price or _vwap(order_response.get("fills"))
+            if price:
+                general_logger.info(f"[FillExtractor] Binance format: fill price={price}")
+                return price
+
+        # BingX / paper engine: {"code": 0, "data": {"executedQty", "cummulativeQuoteQty", "price"}}
+        if "data" in order_response and isinstance(order_response["data"], dict):
+            data = order_response["data"]
+            price = _ratio(data.get("cummulativeQuoteQty"), data.get("executedQty"))
+            if not price and data.get("price") not in (None, "") and Decimal(str(data["price"])) > 0:
+                price = Decimal(str(data["price"]))
+            if price:
+                general_logger.info(f"[FillExtractor] BingX format: fill price={price}")
+                return price
+
+        # Aster: {"raw_response": {"executedQty", "cummulativeQuoteQty", "avgPrice"}}
+        if "raw_response" in order_response and isinstance(order_response["raw_response"], dict):
+            raw = order_response["raw_response"]
+            price = _ratio(raw.get("cummulativeQuoteQty"), raw.get("executedQty"))
+            if not price and raw.get("avgPrice") not in (None, "") and Decimal(str(raw["avgPrice"])) > 0:
+                price = Decimal(str(raw["avgPrice"]))
+            if price:
+                general_logger.info(f"[FillExtractor] Aster format: fill price={price}")
+                return price
+
+        # Phemex: cumQuoteQtyEv / cumBaseQtyEv (same 10^8 scale), else avgPriceEp / 10^8
+        if "cumBaseQtyEv" in order_response:
+            price = _ratio(order_response.get("cumQuoteQtyEv"), order_response["cumBaseQtyEv"])
+            if not price and order_response.get("avgPriceEp"):
+                avg = Decimal(int(order_response["avgPriceEp"])) / Decimal('100000000')
+                price = avg if avg > 0 else None
+            if price:
+                general_logger.info(f"[FillExtractor] Phemex format: fill price={price}")
+                return price
+
+        # OKX: returns list [{"ordId": "...", "sCode": "0"}] — no fill data
+
+    except Exception as e:
+        general_logger.warning(f"[FillExtractor] Error extracting fill price: {e}")
+
+    return None
@@ -0,0 +1,155 @@
+"""
+Idempotency store for tasks that may run more than once.
+
+webhook.processor is acks_late (a worker crash redelivers it), the save task
+retries and the task outbox publishes at least once, so a task can run again
+after its side effect (a persisted signal, a placed order, an inserted
+operation) already happened. Tasks record checkpoints here, keyed by
+(key, stage), and consult them before each side effect.
+
+Storage is the UNLOGGED table task_idempotency
+(migrations/create_task_idempotency.sql). Completed checkpoints written or
+read by this process are also kept in an in-memory LRU, so a redelivery that
+lands on the same process costs no round trip; unfinished ones are always read
+from the table (another process may have moved them on).
+
+Settings (env):
+- IDEMPOTENCY_LRU_SIZE: completed checkpoints kept in memory per process
+- IDEMPOTENCY_TTL_SECONDS: dedup window; older rows are purged
+- IDEMPOTENCY_PURGE_EVERY: purge after every N writes of a process (0 disables)
+
+Order placement uses `client_order_id`, sent to the exchange with each order:
+the same order intent always gets the same id.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from log.log import general_logger
+from source.context import get_db_connection
+from source.dbmanager import load_query
+
+COMPLETED = "completed"
+
+
+def client_order_id(*parts):
+    """
+    Deterministic client order id for an order intent (e.g. trace id, user,
+    api key, side). 32 alphanumeric chars: within the limits of every
+    supported exchange (OKX clOrdId is the strictest).
+    """
+    digest = hashlib.sha256(":".join(str(part) for part in parts).encode()).hexdigest()
+    return "dx" + digest[:30]
+
+
+class IdempotencyStore:
+    def __init__(self, lru_size, ttl_seconds, purge_every):
+        self.lru_size = lru_size
+        self.ttl_seconds = ttl_seconds
+        self.purge_every = purge_every
+        self._completed = OrderedDict()  # (key, stage) -> result
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _remember(self, key, stage, result):
+        with self._lock:
+            self._completed[(key, stage)] = result
+            self._completed.move_to_end((key, stage))
+            while len(self._completed) > self.lru_size:
+                self._completed.popitem(last=False)
+
+    def get(self, key, stage):
+        """
+        Last checkpoint of (key, stage) as {"status", "result"}, or None.
+        Lookup errors are logged and read as None: the task then behaves as
+        it did without the store.
+        """
+        with self._lock:
+            if (key, stage) in self._completed:
+                self._completed.move_to_end((key, stage))
+                return {"status": COMPLETED, "result": self._completed[(key, stage)]}
+
+        try:
+            with get_db_connection() as db_client:
+                db_client.cursor.execute(load_query("select_task_idempotency.sql"), (key, stage))
+                row = db_client.cursor.fetchone()
+        except Exception as e:
+            general_logger.warning(f"[Idempotency] Lookup of {key}/{stage} failed: {e}")
+            return None
+        if row is None:
+            return None
+        status, result = row
+        if status == COMPLETED:
+            self._remember(key, stage, result)
+        return {"status": status, "result": result}
+
+    def put(self, key, stage, status, result=None):
+        """Record a checkpoint (own transaction; errors are logged, not raised)."""
+        try:
+            with get_db_connection() as db_client:
+                db_client.cursor.execute(
+                    load_query("upsert_task_idempotency.sql"),
+                    (key, stage, status, json.dumps(result, default=str)),
+                )
+                db_client.conn.commit()
+        except Exception as e:
+            general_logger.warning(f"[Idempotency] Failed to record {key}/{stage}={status}: {e}")
+            return
+        if status == COMPLETED:
+            self._remember(key, stage, result)
+        self._after_write()
+
+    def claim(self, key, stage, db_client, status=COMPLETED, result=None):
+        """
+        Insert the checkpoint of (key, stage) on the caller's transaction,
+        which must already be open (the claim runs in a savepoint). Returns
+        False when it already exists: the stage ran, or ran concurrently in a
+        transaction that has since committed. Errors are logged and count as
+        claimed.
+        """
+        try:
+            with db_client.conn.transaction():
+                db_client.cursor.execute(
+                    load_query("claim_task_idempotency.sql"),
+                    (key, stage, status, json.dumps(result, default=str)),
+                )
+                claimed = db_client.cursor.fetchone() is not None
+        except Exception as e:
+            general_logger.warning(f"[Idempotency] Claim of {key}/{stage} failed: {e}")
+            return True
+        if claimed:
+            self._after_write()
+        return claimed
+
+    def _after_write(self):
+        with self._lock:
+            self._writes += 1
+            due = self.purge_every and self._writes % self.purge_every == 0
+        if due:
+            try:
+                with get_db_connection() as db_client:
+                    db_client.cursor.execute(load_query("purge_task_idempotency.sql"), (self.ttl_seconds,))
+                    purged = db_client.cursor.rowcount
+                    db_client.conn.commit()
+                if purged:
+                    general_logger.info(f"[Idempotency] Purged {purged} expired checkpoints")
+            except Exception as e:
+                general_logger.warning(f"[Idempotency] Purge failed: {e}")
+
+
+_store = None
+
+
+def get_idempotency_store():
+    """Process-wide idempotency store."""
+    global _store
+    if _store is None:
+        _store = IdempotencyStore(
+            lru_size=int(os.environ.get("IDEMPOTENCY_LRU_SIZE", "10000")),
+            ttl_seconds=int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400")),
+            purge_every=int(os.environ.get("IDEMPOTENCY_PURGE_EVERY", "1000")),
+        )
+    return _store
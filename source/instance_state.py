@@ -0,0 +1,281 @@
+"""
+In-memory interval/condition state engine, one entry per instance.
+
+Every signal used to pay two DB reads before a trade decision: the last N
+operations (`IntervalHandler.check_interval`) and every pending webhook_data
+row for the (symbol, side) (`OperationHandler.execute_condition`). This module
+keeps both incrementally in memory so the decision is answered in O(1):
+
+- the last N operations (newest first) plus the length of the newest same-side
+  run, which is all `check_interval` needs;
+- the pending indicator signals per (symbol, side), as
+  {indicator_id: {webhook_id, ...}}, so "distinct indicators" is a len().
+
+State is authoritative only inside the process that owns the instance. Owner-
+ship follows the shard router (source/shard_router.py): the worker consuming
+`logic_shard_<LOGIC_SHARD_INDEX>` (--concurrency=1) owns the instances the hash
+ring maps to that shard. Without sharding every instance is owned, which is
+only correct for a single logic process. A state is (re)built from the DB on
+first use, at startup (`warm`), after the ring rebalances, when the instance
+was restarted (start_date changed) and after INSTANCE_STATE_MAX_AGE_SECONDS.
+
+A dispatched trade only counts for the interval once `trade.save_operation`
+wrote its `operations` row, as in the DB path: after a dispatch the state is
+rebuilt from the DB on every use until that row shows up (or for at most
+INSTANCE_STATE_MAX_AGE_SECONDS, for orders that failed and are never saved).
+
+Disabled by default (INSTANCE_STATE_ENGINE_ENABLED=false): callers get None
+and fall back to the DB queries.
+"""
+
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from log.log import general_logger
+from source.context import get_db_connection
+from source.dbmanager import load_query
+from source.shard_router import get_shard_router
+
+
+def _env_flag(name, default="false"):
+    return os.environ.get(name, default).strip().lower() not in ("false", "0", "no", "")
+
+
+def _minutes_since(moment):
+    """Minutes elapsed since `moment`, matching its naive/aware flavour."""
+    now = datetime.now(timezone.utc) if moment.tzinfo else datetime.now()
+    return (now - moment).total_seconds() / 60
+
+
+class InstanceState:
+    """Decision state for one instance: recent operations + pending signals."""
+
+    def __init__(self, instance_id, start_date, history_size):
+        self.instance_id = instance_id
+        self.start_date = start_date
+        self.history_size = history_size
+        self.operations = deque(maxlen=history_size)  # (side, date), newest first
+        self.side_run = 0  # consecutive newest operations sharing operations[0] side
+        self.pending = {}  # (symbol, side) -> {indicator_id: set(webhook_ids)}
+        self.loaded_at = time.monotonic()
+
+    # --- operations --------------------------------------------------------
+    def load_operations(self, rows):
+        """Seed from DB rows of (side, date), newest first."""
+        self.operations.clear()
+        self.side_run = 0
+        for side, date in rows[: self.history_size]:
+            self.operations.append((side, date))
+        if self.operations:
+            newest_side = self.operations[0][0]
+            for side, _ in self.operations:
+                if side != newest_side:
+                    break
+                self.side_run += 1
+
+    def has_operation_since(self, moment):
+        """True if the newest saved operation is not older than `moment` (aware, UTC)."""
+        if not self.operations:
+            return False
+        newest_date = self.operations[0][1]
+        if newest_date.tzinfo is None:
+            # operations.date was timestamp without time zone, holding UTC
+            moment = moment.replace(tzinfo=None)
+        return newest_date >= moment
+
+    def covers(self, limit):
+        """True if `limit` recent operations fit in the kept history."""
+        return int(limit) <= self.history_size
+
+    def interval_allows(self, side, limit, interval_minutes):
+        """
+        Same decision as IntervalHandler.check_interval, without a DB read.
+
+        Blocks when the last `limit` operations are all on `side`; allows when
+        the newest operation is on the opposite side; otherwise requires
+        `interval_minutes` to have elapsed since the newest operation.
+        """
+        available = min(len(self.operations), int(limit))
+        if available == 0:
+            return True
+
+        newest_side, newest_date = self.operations[0]
+        if newest_side == side and self.side_run >= available:
+            return False
+
+        if newest_side != side:
+            return True
+
+        if float(interval_minutes) == 0:
+            return True
+
+        return _minutes_since(newest_date) >= float(interval_minutes)
+
+    # --- pending signals ---------------------------------------------------
+    def record_signal(self, webhook_id, symbol, side, indicator_id):
+        """Add a persisted, not-yet-consumed webhook_data row."""
+        indicators = self.pending.setdefault((symbol, side), {})
+        indicators.setdefault(indicator_id, set()).add(webhook_id)
+
+    def indicator_count(self, symbol, side):
+        """
+        Distinct indicators that signalled (symbol, side) since the last trade.
+        Rows without an indicator_id are pending but, like COUNT(DISTINCT), not counted.
+        """
+        return sum(1 for indicator_id in self.pending.get((symbol, side), ()) if indicator_id is not None)
+
+    def pending_ids(self, symbol, side):
+        """Webhook ids pending for (symbol, side), without consuming them."""
+        indicators = self.pending.get((symbol, side), {})
+        return [webhook_id for ids in indicators.values() for webhook_id in ids]
+
+
+class InstanceStateEngine:
+    """Process-local registry of InstanceState for the instances this shard owns."""
+
+    def __init__(self, enabled, history_size, max_age_seconds, shard_index=None, router=None):
+        self.enabled = enabled
+        self.history_size = history_size
+        self.max_age_seconds = max_age_seconds
+        self.shard_index = shard_index
+        self.router = router
+        self._ring_version = router.version if router is not None else 0
+        self._states = {}
+        self._unsaved = {}  # instance_id -> (dispatched_at UTC, monotonic) of a trade not saved yet
+
+    # --- ownership ---------------------------------------------------------
+    def owns(self, instance_id):
+        if self.shard_index is None or self.router is None or not self.router.enabled:
+            return True
+        return self.router.shard_for(instance_id) == self.shard_index
+
+    def _sync_ownership(self):
+        """
+        Drop every state after a ring rebalance.
+
+        An instance may have moved away and back between two checks while
+        another shard traded it, so even still-owned states can be stale;
+        they are rebuilt lazily on first use.
+        """
+        if self.router is None or self.router.version == self._ring_version:
+            return
+        self._ring_version = self.router.version
+        dropped = len(self._states)
+        self._states.clear()
+        general_logger.info(
+            f"[StateEngine] Ring rebalanced (shard {self.shard_index}); "
+            f"dropped {dropped} states"
+        )
+
+    # --- access ------------------------------------------------------------
+    def get(self, instance_id, start_date):
+        """
+        State for an owned instance, rebuilding it when missing or stale.
+
+        Returns None when the engine is disabled or the instance belongs to
+        another shard — callers then use the DB path.
+        """
+        if not self.enabled or not self.owns(instance_id):
+            return None
+        self._sync_ownership()
+
+        state = self._states.get(instance_id)
+        unsaved = self._unsaved.get(instance_id)
+        if (
+            state is None
+            or unsaved is not None
+            or state.start_date != start_date
+            or time.monotonic() - state.loaded_at > self.max_age_seconds
+        ):
+            state = self.rebuild(instance_id, start_date)
+        if unsaved is not None and (
+            state.has_operation_since(unsaved[0])
+            or time.monotonic() - unsaved[1] > self.max_age_seconds
+        ):
+            del self._unsaved[instance_id]
+        return state
+
+    def peek(self, instance_id):
+        """Loaded state for an instance, or None (never touches the DB)."""
+        return self._states.get(instance_id)
+
+    def record_signal(self, instance_id, webhook_id, symbol, side, indicator_id):
+        """Feed a freshly inserted webhook_data row into a loaded state."""
+        state = self.peek(instance_id)
+        if state is not None and webhook_id is not None:
+            state.record_signal(webhook_id, symbol, side, indicator_id)
+
+    def invalidate(self, instance_id):
+        self._states.pop(instance_id, None)
+
+    def expect_operation(self, instance_id):
+        """
+        A trade was dispatched for the instance: its signals are consumed in
+        the DB and the operation is saved later by trade.save_operation, so
+        rebuild the state on every use until that row is there.
+        """
+        self._states.pop(instance_id, None)
+        self._unsaved[instance_id] = (datetime.now(timezone.utc), time.monotonic())
+
+    # --- loading -----------------------------------------------------------
+    def rebuild(self, instance_id, start_date):
+        """Reload one instance from the DB."""
+        states = self._load({instance_id: start_date})
+        return states[instance_id]
+
+    def warm(self):
+        """Load every running instance owned by this shard (startup)."""
+        if not self.enabled:
+            return 0
+        with get_db_connection() as db_client:
+            db_client.cursor.execute(load_query("select_state_engine_instances.sql"))
+            rows = db_client.cursor.fetchall()
+        start_dates = {iid: start_date for iid, start_date in rows if self.owns(iid)}
+        if start_dates:
+            self._load(start_dates)
+        general_logger.info(f"[StateEngine] Warmed {len(start_dates)} instances (shard {self.shard_index})")
+        return len(start_dates)
+
+    def _load(self, start_dates):
+        """Bulk-load operations and pending signals for {instance_id: start_date}."""
+        instance_ids = list(start_dates)
+        states = {
+            iid: InstanceState(iid, start_dates[iid], self.history_size)
+            for iid in instance_ids
+        }
+        operations = {iid: [] for iid in instance_ids}
+
+        with get_db_connection() as db_client:
+            cur = db_client.cursor
+            cur.execute(load_query("select_state_engine_operations.sql"), (instance_ids, self.history_size))
+            for instance_id, date, side in cur.fetchall():
+                operations[instance_id].append((side, date))
+
+            cur.execute(load_query("select_state_engine_pending_signals.sql"), (instance_ids,))
+            for instance_id, webhook_id, symbol, side, indicator_id in cur.fetchall():
+                states[instance_id].record_signal(webhook_id, symbol, side, indicator_id)
+
+        for instance_id, state in states.items():
+            state.load_operations(operations[instance_id])
+            self._states[instance_id] = state
+        return states
+
+
+_engine = None
+
+
+def get_state_engine():
+    """Process-wide engine, configured from the environment on first use."""
+    global _engine
+    if _engine is None:
+        shard_index = os.environ.get("LOGIC_SHARD_INDEX", "").strip()
+        _engine = InstanceStateEngine(
+            enabled=_env_flag("INSTANCE_STATE_ENGINE_ENABLED"),
+            history_size=int(os.environ.get("INSTANCE_STATE_HISTORY_SIZE", "10")),
+            max_age_seconds=float(os.environ.get("INSTANCE_STATE_MAX_AGE_SECONDS", "300")),
+            shard_index=int(shard_index) if shard_index else None,
+            router=get_shard_router(),
+        )
+    return _engine
@@ -6,9 +6,11 @@ from .models import OperationContext
 from datetime import datetime
 import re
 from .context import get_db_connection
+from .dbmanager import load_query
 from .exchange_interface import get_exchange_interface
 from decimal import Decimal
 from .celery_client import get_client
+from .instance_state import get_state_engine
 import uuid
 
 
@@ -22,6 +24,9 @@ def execute_operation(context: OperationContext, trace_id=None):
     3. Executes the operation if conditions are met
     4. Handles copy trading distribution if applicable
 
+    When the in-memory state engine owns the instance, the interval and
+    condition decisions are answered from its state instead of the DB.
+
     Args:
         context: OperationContext containing all necessary data
         trace_id: Optional trace ID for pipeline observability
@@ -29,8 +34,10 @@ def execute_operation(context: OperationContext, trace_id=None):
     Returns:
         dict: Operation result with status and details
     """
+    state = get_state_engine().get(context.instance_id, context.start_date)
+
     # Check interval constraints
-    interval_handler = IntervalHandler(context)
+    interval_handler = IntervalHandler(context, state=state)
 
     if not interval_handler.check_interval():
         general_logger.info(f'[Instance: {context.instance_id}] Interval check failed')
@@ -45,7 +52,7 @@ def execute_operation(context: OperationContext, trace_id=None):
     market = Market(symbol=context.symbol, side=context.side)
 
     # Execute operation with condition checking
-    operation_handler = OperationHandler(context, market, trace_id=trace_id)
+    operation_handler = OperationHandler(context, market, trace_id=trace_id, state=state)
     result = operation_handler.execute_condition()
 
     return result
@@ -59,22 +66,27 @@ class IntervalHandler:
     simultaneous operation limits.
     """
 
-    def __init__(self, context: OperationContext):
+    def __init__(self, context: OperationContext, state=None):
         """
         Initialize interval handler with operation context.
 
         Args:
             context: OperationContext containing strategy and instance details
+            state: Optional InstanceState; when it covers the required history
+                   the check runs in memory and no operations manager is built
         """
         self.interval = float(context.strategy.interval)
         self.symbol = context.symbol
         self.side = context.side
         self.instance_id = context.instance_id
         self.simultaneous_operations = context.strategy.simultaneous_operations
+        self.state = state if state is not None and state.covers(self.simultaneous_operations) else None
 
         # Initialize operations manager
-        with get_db_connection() as db_client:
-            self.operations = Operations(db_client)
+        self.operations = None
+        if self.state is None:
+            with get_db_connection() as db_client:
+                self.operations = Operations(db_client)
 
     def get_last_operations(self, limit):
         """Fetch last N operations from database."""
@@ -87,6 +99,9 @@ class IntervalHandler:
         Returns:
             bool: True if operation can proceed, False otherwise
         """
+        if self.state is not None:
+            return self.state.interval_allows(self.side, self.simultaneous_operations, self.interval)
+
         last_operations = self.get_last_operations(limit=self.simultaneous_operations)
 
         if not last_operations:
@@ -135,7 +150,7 @@ class OperationHandler:
     and copy trading distribution.
     """
 
-    def __init__(self, context: OperationContext, market_manager: Market, trace_id=None):
+    def __init__(self, context: OperationContext, market_manager: Market, trace_id=None, state=None):
         """
         Initialize operation handler with context and market manager.
 
@@ -143,10 +158,12 @@ class OperationHandler:
             context: OperationContext containing all operation details
             market_manager: Market instance for symbol/side management
             trace_id: Optional trace ID for pipeline observability
+            state: Optional InstanceState answering the condition check in memory
         """
         self.context = context
         self.market_manager = market_manager
         self.trace_id = trace_id
+        self.state = state
         self.condition_handler = ConditionHandler(context.strategy.condition_limit)
 
         # Initialize exchange interface
@@ -168,11 +185,11 @@ class OperationHandler:
         Execute condition checking and trade execution.
 
         This method:
-        1. Fetches webhook data for the instance
+        1. Counts distinct pending indicator signals for the instance
         2. Checks if trading conditions are met
-        3. Sends trade execution task to ops queue
+        3. Marks the webhook records with the operation task ID and sends
+           the trade execution task to the ops queue, in one transaction
         4. Sends copy trading task to sharing queue (if applicable)
-        5. Updates webhook records with operation task ID
 
         Returns:
             dict: Operation result with status and details
@@ -182,17 +199,25 @@ class OperationHandler:
         log_prefix = f"[ExecID: {execution_id}] [Instance: {self.context.instance_id}] [Symbol: {self.context.symbol}]"
 
         try:
-            # Fetch webhook data for condition checking
-            data = self.webhook_data_manager.get_market_objects_as_models(
-                self.context.instance_id,
-                self.context.symbol,
-                self.context.side,
-                self.context.start_date
-            )
+            if self.state is not None:
+                # In-memory state: distinct indicator count is O(1)
+                indicator_count = self.state.indicator_count(self.context.symbol, self.context.side)
+                pending_count = indicator_count
+                webhook_ids = None
+            else:
+                # Evaluate the condition in the DB: distinct indicator count
+                # and the pending ids, without shipping the rows themselves
+                indicator_count, webhook_ids = self.webhook_data_manager.get_pending_condition(
+                    self.context.instance_id,
+                    self.context.symbol,
+                    self.context.side,
+                    self.context.start_date
+                )
+                pending_count = len(webhook_ids)
 
             # Check if conditions are met
-            conditions_met = self.check_conditions(data)
-            data_is_sufficient = len(data) >= 1
+            conditions_met = self.condition_handler.check_indicator_count(indicator_count)
+            data_is_sufficient = pending_count >= 1
 
             if conditions_met and data_is_sufficient:
                 # Conditions satisfied - execute trade
@@ -202,21 +227,52 @@ class OperationHandler:
                 if self.trace_id:
                     trade_data['trace_id'] = self.trace_id
 
-                # Send trade execution task to ops queue
-                async_result = get_client().send_task(
-                    "trade.execute_operation",
-                    kwargs={"data": trade_data},
-                    queue="ops"
-                )
+                if self.state is not None:
+                    webhook_ids = self.state.pending_ids(self.context.symbol, self.context.side)
+
+                # Claim the signals and dispatch the trade in one transaction:
+                # a concurrent signal that already consumed any of these rows
+                # makes the claim come up short and nothing is dispatched.
+                operation_task_id = str(uuid.uuid4())
+                with get_db_connection() as db_client:
+                    claimed = self.consume_webhook_data(db_client, webhook_ids, operation_task_id)
+                    if len(claimed) != len(webhook_ids):
+                        db_client.conn.rollback()
+                        if self.state is not None:
+                            get_state_engine().invalidate(self.context.instance_id)
+                        general_logger.warning(
+                            f"{log_prefix} Claimed {len(claimed)}/{len(webhook_ids)} signals; "
+                            f"already consumed by a concurrent operation."
+                        )
+                        return {
+                            "status": "insufficient_condition",
+                            "reason": "Signals already consumed by a concurrent operation."
+                        }
+
+                    # Send trade execution task to ops queue
+                    get_client().send_task(
+                        "trade.execute_operation",
+                        kwargs={"data": trade_data},
+                        queue="ops",
+                        task_id=operation_task_id
+                    )
+                    db_client.conn.commit()
 
-                operation_task_id = async_result.id
+                general_logger.info(
+                    f"{log_prefix} Marked {len(claimed)} webhooks with operation task ID {operation_task_id}"
+                )
 
                 # Fire-and-forget: record a virtual operation in parallel.
                 # Strategy-level signal log used to compute % return independent
                 # of whether the real trade succeeds. Failures here MUST NOT
                 # impact the real execution flow above.
                 # Kill switch: VIRTUAL_OPERATIONS_ENABLED=false disables dispatch.
+                # VIRTUAL_RECORD_BATCH_ENABLED=true hands it to the batching
+                # recorder (celeryManager/virtual_recorder.py) instead.
                 if os.environ.get("VIRTUAL_OPERATIONS_ENABLED", "true").strip().lower() not in ("false", "0", "no"):
+                    virtual_queue = "virtual"
+                    if os.environ.get("VIRTUAL_RECORD_BATCH_ENABLED", "false").strip().lower() not in ("false", "0", "no"):
+                        virtual_queue = "virtual_record"
                     try:
                         get_client().send_task(
                             "virtual.record_operation",
@@ -229,7 +285,7 @@ class OperationHandler:
                                     "trace_id": self.trace_id,
                                 }
                             },
-                            queue="virtual",
+                            queue=virtual_queue,
                         )
                     except Exception as e:
                         general_logger.warning(
@@ -258,8 +314,10 @@ class OperationHandler:
                             exc_info=True
                         )
 
-                # Update webhook records with operation task ID
-                self.update_webhook_operation(data, operation_task_id)
+                # The trade counts for the interval once its operation is saved,
+                # as in the DB path; until then the state is rebuilt from the DB
+                if self.state is not None:
+                    get_state_engine().expect_operation(self.context.instance_id)
 
                 return {
                     "status": "success",
@@ -272,7 +330,7 @@ class OperationHandler:
                 if not conditions_met:
                     reason += "Condition check failed. "
                 if not data_is_sufficient:
-                    reason += f"Insufficient data (got {len(data)}, need >= 1). "
+                    reason += f"Insufficient data (got {pending_count}, need >= 1). "
 
                 return {
                     "status": "insufficient_condition",
@@ -291,28 +349,26 @@ class OperationHandler:
         finally:
             general_logger.info(f"{log_prefix} Condition execution finished.")
 
-    def update_webhook_operation(self, filtered_data, operation_task_id):
+    def consume_webhook_data(self, db_client, webhook_ids, operation_task_id):
         """
-        Update webhook records with the operation task ID.
+        Mark webhook records with the operation task ID in one statement.
+
+        Runs on the caller's transaction; only rows that are still unconsumed
+        are updated.
 
         Args:
-            filtered_data: List of webhook market objects
+            db_client: Open DatabaseClient whose transaction dispatches the trade
+            webhook_ids: Pending webhook_data ids to consume
             operation_task_id: The Celery task ID for the operation
+
+        Returns:
+            list: Ids actually claimed by this call
         """
-        for market_object in filtered_data:
-            webhook_id = market_object["id"]
-            try:
-                self.webhook_data_manager.update_market_object_at_index(
-                    webhook_id,
-                    str(operation_task_id)
-                )
-                general_logger.info(
-                    f"Updated webhook {webhook_id} with operation task ID {operation_task_id}"
-                )
-            except Exception as e:
-                general_logger.error(
-                    f"Error updating webhook {webhook_id}: {e}"
-                )
+        db_client.cursor.execute(
+            load_query("update_webhook_data_consumed.sql"),
+            (operation_task_id, list(webhook_ids))
+        )
+        return [row[0] for row in db_client.cursor.fetchall()]
 
     def check_conditions(self, data):
         """Delegate condition checking to condition handler."""
@@ -349,18 +405,12 @@ class ConditionHandler:
         Returns:
             bool: True if conditions are met, False otherwise
         """
-        # Group indicators by (symbol, side)
+        # Group distinct indicators by (symbol, side)
         symbol_side_indicators = {}
 
         for market in market_list:
             key = (market["symbol"], market["side"])
-
-            if key not in symbol_side_indicators:
-                symbol_side_indicators[key] = []
-
-            # Add indicator if not already in the list
-            if market["indicator"] not in symbol_side_indicators[key]:
-                symbol_side_indicators[key].append(market["indicator"])
+            symbol_side_indicators.setdefault(key, set()).add(market["indicator"])
 
         # Verify each symbol/side combination has enough different indicators
         for key, indicators in symbol_side_indicators.items():
@@ -368,3 +418,16 @@ class ConditionHandler:
                 return False
 
         return True
+
+    def check_indicator_count(self, indicator_count):
+        """
+        Check the condition from an already-computed distinct indicator count
+        for a single (symbol, side).
+
+        Args:
+            indicator_count: Number of distinct indicators that have signalled
+
+        Returns:
+            bool: True if conditions are met, False otherwise
+        """
+        return indicator_count >= int(self.condition_limit)
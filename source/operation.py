@@ -1,15 +1,27 @@
+import os
 import re
 import time
 from decimal import Decimal, ROUND_DOWN
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from source.client import OrderNotSent, OrderRejected
 from source.exchange_interface import get_exchange_interface
 from log.log import general_logger
-from source.celery_client import get_client
+from source.outbox import enqueue_task
+from source.idempotency import COMPLETED, client_order_id, get_idempotency_store
 from source.position import get_open_position
 from source.fill_extractor import extract_filled_base_qty
 from source.sizing import SizingSpec
 from datetime import datetime, timezone
 
+# Orders with a client order id: only a submit that never reached the exchange
+# is retried (ms backoff, doubled per attempt); an ambiguous one is resolved by
+# polling the order up for ORDER_LOOKUP_WINDOW_SECONDS
+ORDER_SUBMIT_ATTEMPTS = int(os.environ.get("ORDER_SUBMIT_ATTEMPTS", "3"))
+ORDER_RETRY_BACKOFF_MS = int(os.environ.get("ORDER_RETRY_BACKOFF_MS", "100"))
+ORDER_LOOKUP_WINDOW_SECONDS = float(os.environ.get("ORDER_LOOKUP_WINDOW_SECONDS", "10"))
+ORDER_LOOKUP_MAX_INTERVAL_MS = int(os.environ.get("ORDER_LOOKUP_MAX_INTERVAL_MS", "2000"))
+
+
 def parse_symbol(symbol: str):
     quote_currencies = [
         "USDT", "USDC", "TUSD", "BUSD", "FDUSD",
@@ -32,31 +44,179 @@ def parse_symbol(symbol: str):
         return (base_currency,quote_currency)
 
 
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=2, min=2, max=10),
-    retry=retry_if_exception_type(Exception),
-    reraise=True
-)
-def call_place_order(exchange_interface, symbol, side, size, currency):
+def _submit_order(exchange_interface, symbol, side, size, currency, client_order_id=None):
     return exchange_interface.place_order(
         symbol=symbol,
         side=side,
         order_type='market',
         size=size,
-        currency=currency
+        currency=currency,
+        client_order_id=client_order_id
     )
 
+
+# Orders without a client order id: retried only when the submit never reached the exchange
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=2, min=2, max=10),
+    retry=retry_if_exception_type(OrderNotSent),
+    reraise=True
+)
+def call_place_order(exchange_interface, symbol, side, size, currency):
+    return _submit_order(exchange_interface, symbol, side, size, currency)
+
+
+def _lookup_order(exchange_interface, symbol, client_order_id):
+    """(found, order): found is None when the lookup failed (outcome unknown)."""
+    try:
+        order = exchange_interface.get_order_by_client_id(symbol, client_order_id)
+        return order is not None, order
+    except Exception as e:
+        general_logger.error(f"  Lookup of order {client_order_id} failed: {e}")
+        return None, None
+
+
+def _await_order(exchange_interface, symbol, client_order_id):
+    """
+    Poll the order up for ORDER_LOOKUP_WINDOW_SECONDS (the submit may still be
+    in flight at the exchange). The order, or None if it never showed up.
+    """
+    deadline = time.monotonic() + ORDER_LOOKUP_WINDOW_SECONDS
+    interval = ORDER_RETRY_BACKOFF_MS / 1000.0
+    while True:
+        time.sleep(interval)
+        found, order = _lookup_order(exchange_interface, symbol, client_order_id)
+        if found:
+            return order
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        interval = min(interval * 2, ORDER_LOOKUP_MAX_INTERVAL_MS / 1000.0, remaining)
+
+
+def _order_failure(error, message, response=None):
+    return {"error": error, "message": message, "exchange_response": response}
+
+
+def place_order_once(exchange_interface, symbol, side, size, currency, client_order_id):
+    """
+    Submit an order identified by `client_order_id` without ever placing it twice.
+
+    Returns (order_response, failure); failure is None on success, otherwise
+    an error dict.
+
+    The order is submitted again, after ORDER_RETRY_BACKOFF_MS (doubling),
+    only when the request provably never reached the exchange (OrderNotSent).
+    An explicit rejection (OrderRejected) fails with the exchange's body. Any
+    other failure (read timeout, 5xx, empty response) is ambiguous: the order
+    may still be in flight, and a filled market order is no longer "open", so
+    the exchange would accept the same client id again. The order is polled
+    up for ORDER_LOOKUP_WINDOW_SECONDS instead, and if it never shows up the
+    outcome is reported as unknown, without submitting again.
+    """
+    backoff = ORDER_RETRY_BACKOFF_MS / 1000.0
+    for attempt in range(1, ORDER_SUBMIT_ATTEMPTS + 1):
+        try:
+            response = _submit_order(exchange_interface, symbol, side, size, currency, client_order_id)
+            if response is not None:
+                return response, None
+            general_logger.warning(f"  Attempt {attempt}: no response for order {client_order_id}")
+        except OrderNotSent as e:
+            general_logger.warning(f"  Attempt {attempt}: order {client_order_id} not sent: {e}")
+            time.sleep(backoff)
+            backoff *= 2
+            continue
+        except OrderRejected as e:
+            general_logger.error(f"  Order {client_order_id} rejected: {e}")
+            return None, _order_failure("order_rejected", str(e), e.response)
+        except Exception as e:
+            general_logger.warning(f"  Attempt {attempt}: order {client_order_id} failed: {e}")
+
+        order = _await_order(exchange_interface, symbol, client_order_id)
+        if order is not None:
+            general_logger.info(f"  Order {client_order_id} found on the exchange after attempt {attempt}")
+            return order, None
+        general_logger.error(
+            f"  Order {client_order_id} not found within {ORDER_LOOKUP_WINDOW_SECONDS}s: outcome unknown, not re-submitting"
+        )
+        return None, _order_failure(
+            "order_outcome_unknown",
+            "The order may have reached the exchange but could not be confirmed. Not re-submitted.",
+        )
+
+    general_logger.error(f"  Order {client_order_id} could not be sent after {ORDER_SUBMIT_ATTEMPTS} attempts")
+    return None, _order_failure("order_not_sent", f"The exchange could not be reached after {ORDER_SUBMIT_ATTEMPTS} attempts.")
+
+
+def submit_order(exchange_interface, symbol, side, size, currency, client_order_id=None):
+    """(order_response, failure) for a market order, with or without a client order id."""
+    if client_order_id:
+        return place_order_once(exchange_interface, symbol, side, size, currency, client_order_id)
+    try:
+        response = call_place_order(exchange_interface, symbol, side, size, currency)
+    except OrderNotSent as e:
+        return None, _order_failure("order_not_sent", str(e))
+    except OrderRejected as e:
+        return None, _order_failure("order_rejected", str(e), e.response)
+    except Exception as e:
+        general_logger.error(f"  Order submit failed, outcome unknown: {e}")
+        return None, _order_failure("order_outcome_unknown", str(e))
+    if response is None:
+        return None, _order_failure(
+            "order_outcome_unknown", "Exchange returned no response. The order may or may not exist."
+        )
+    return response, None
+
+
 @retry(
     stop=stop_after_attempt(2),
     wait=wait_exponential(multiplier=1, min=1, max=5),
     retry=retry_if_exception_type(Exception),
     reraise=True
 )
-def call_get_balance(exchange_interface, currency):
-    return exchange_interface.get_balance(currency)
+def call_get_balances(exchange_interface, currencies):
+    return exchange_interface.get_balances([ccy.upper() for ccy in currencies])
+
+def _replay_order(checkpoint, order_id, exchange_interface, symbol):
+    """
+    Result for an order intent a previous run already sent (redelivery/retry),
+    or None when that run never got it to the exchange (place it now).
+    """
+    if checkpoint["status"] == COMPLETED:
+        general_logger.info(f"  Order {order_id} already placed by a previous run: returning its result")
+        return checkpoint["result"]
+
+    found, order = _lookup_order(exchange_interface, symbol, order_id)
+    if found is False:
+        # The previous submit may still be in flight: give it the lookup window
+        order = _await_order(exchange_interface, symbol, order_id)
+        found = order is not None
+    if found is False:
+        general_logger.info(f"  Order {order_id} from an unfinished previous run is not on the exchange: placing it")
+        return None
+    if found:
+        general_logger.error(
+            f"  Order {order_id} was placed by a previous run that did not finish: not re-submitting"
+        )
+        return {
+            "status": "error",
+            "message": "A previous run placed this order but did not finish. Not re-submitted.",
+            "error": "order_placed_unconfirmed",
+            "client_order_id": order_id,
+            "order_response": order,
+        }
+    general_logger.error(
+        f"  Order {order_id} was sent by a previous run that did not finish: not re-submitting"
+    )
+    return {
+        "status": "error",
+        "message": "A previous run sent this order and its outcome is unknown. Not re-submitted.",
+        "error": "order_outcome_unknown",
+        "client_order_id": order_id,
+    }
+
 
-def execute_operation(user_id, api_key, exchange_id, perc_balance_operation, symbol, side, instance_id, max_amount_size=None, size_mode="percentage", flat_value=None, trace_id=None):
+def execute_operation(user_id, api_key, exchange_id, perc_balance_operation, symbol, side, instance_id, max_amount_size=None, size_mode="percentage", flat_value=None, trace_id=None, order_key=None):
     """
     Execute a trading operation on the exchange.
 
@@ -75,6 +235,10 @@ def execute_operation(user_id, api_key, exchange_id, perc_balance_operation, sym
         max_amount_size: Maximum size limit (optional, for copy trading)
         size_mode: "percentage" or "flat_value"
         flat_value: Exact amount to trade (used in flat_value mode for buys)
+        order_key: Identifies the signal this order answers (trace id, or the
+            task id). With it the order gets a deterministic client order id
+            and a checkpoint in the idempotency store, so running the task
+            again never places it twice.
 
     Returns:
         dict: Operation result with status and details
@@ -103,6 +267,14 @@ def execute_operation(user_id, api_key, exchange_id, perc_balance_operation, sym
         general_logger.info(f"OPERATION START | {exchange_label} | user:{user_id} | inst:{instance_id} | {symbol} | {side.upper()}")
         general_logger.info("-" * 80)
 
+        order_id = client_order_id(order_key, user_id, api_key, side) if order_key else None
+        if order_id:
+            checkpoint = get_idempotency_store().get(order_id, "order")
+            replayed = _replay_order(checkpoint, order_id, exchange_interface, symbol) if checkpoint else None
+            if replayed is not None:
+                status = "SKIPPED"
+                return replayed
+
         if base_currency is None or quote_currency is None:
             msg = (
                 f"Invalid symbol '{symbol}': unable to resolve base/quote currency. "
@@ -137,16 +309,12 @@ def execute_operation(user_id, api_key, exchange_id, perc_balance_operation, sym
                     "entry_ids": [],
                     "trace_id": trace_id,
                 }
-                get_client().send_task(
-                    "trade.save_operation",
-                    kwargs={"operation_data": virtual_operation_data},
-                    queue='db'
-                )
+                enqueue_task("trade.save_operation", {"operation_data": virtual_operation_data}, queue='db')
 
                 return {"status": "no_position", "message": "No open position entries found. Virtual sell recorded to unblock cycle."}
 
             # Get exchange balance as safety cap
-            balance_raw = call_get_balance(exchange_interface, ccy)
+            balance_raw = call_get_balances(exchange_interface, [ccy])[ccy.upper()]
             exchange_balance = Decimal(str(balance_raw))
 
             # Use min of position and exchange balance
@@ -165,20 +333,24 @@ def execute_operation(user_id, api_key, exchange_id, perc_balance_operation, sym
 
             # Place sell order
             size_float = float(size)
-            order_response = call_place_order(exchange_interface, symbol, side, size_float, ccy)
+            if order_id:
+                get_idempotency_store().put(order_id, "order", "started", {"size": size_float, "currency": ccy})
+            order_response, failure = submit_order(exchange_interface, symbol, side, size_float, ccy, order_id)
             executed_at_utc = datetime.now(timezone.utc)
 
             # Check if the exchange returned a valid response
             if order_response is None:
                 general_logger.error(
-                    f"  Order FAILED: Exchange returned no response (API error) | "
+                    f"  Order FAILED: {failure['error']} | "
                     f"SELL size={size_float} {ccy} | position_qty={position_qty} | exchange_balance={exchange_balance}"
                 )
                 status = "FAILED"
                 return {
                     "status": "error",
-                    "message": "Exchange returned no response. The order was likely rejected.",
-                    "error": "Exchange API returned None (HTTP error or rejected order)",
+                    "message": failure["message"],
+                    "error": failure["error"],
+                    "client_order_id": order_id,
+                    "exchange_response": failure["exchange_response"],
                     "sizing_context": {
                         "side": "sell",
                         "size": size_float,
@@ -204,20 +376,20 @@ def execute_operation(user_id, api_key, exchange_id, perc_balance_operation, sym
                 "executed_at": executed_at_utc.isoformat(),
                 "entry_ids": entry_ids,
                 "trace_id": trace_id,
+                "client_order_id": order_id,
             }
-            get_client().send_task(
-                "trade.save_operation",
-                kwargs={"operation_data": operation_data},
-                queue='db'
-            )
+            enqueue_task("trade.save_operation", {"operation_data": operation_data}, queue='db')
 
-            return {
+            result = {
                 "status": "success",
                 "message": "Operação executada e tarefa de salvamento enfileirada.",
                 "order_response": order_response,
                 "size": size_float,
                 "currency": ccy,
             }
+            if order_id:
+                get_idempotency_store().put(order_id, "order", COMPLETED, result)
+            return result
 
         else:
             # === BUY PATH: Percentage/flat_value sizing with fill extraction ===
@@ -237,16 +409,15 @@ def execute_operation(user_id, api_key, exchange_id, perc_balance_operation, sym
                 general_logger.error(f"  Sizing validation failed: {validation_error}")
                 return {"status": "validation_error", "message": validation_error}
 
-            # Get pre-buy base currency balance for fill fallback
+            # One request: quote balance for sizing, base balance for the fill fallback
             pre_buy_base_balance = None
             try:
-                pre_buy_base_raw = call_get_balance(exchange_interface, base_currency)
-                pre_buy_base_balance = Decimal(str(pre_buy_base_raw))
+                balances = call_get_balances(exchange_interface, [base_currency, ccy])
+                pre_buy_base_balance = Decimal(str(balances[base_currency.upper()]))
             except Exception as e:
                 general_logger.warning(f"  Could not get pre-buy base balance for fallback: {e}")
-
-            # Get quote currency balance
-            balance_raw = call_get_balance(exchange_interface, ccy)
+                balances = call_get_balances(exchange_interface, [ccy])
+            balance_raw = balances[ccy.upper()]
             balance = Decimal(str(balance_raw))
 
             # Compute order size via SizingSpec
@@ -268,7 +439,9 @@ def execute_operation(user_id, api_key, exchange_id, perc_balance_operation, sym
 
             # Convert Decimal to float for API calls and JSON serialization
             size_float = float(size)
-            order_response = call_place_order(exchange_interface, symbol, side, size_float, ccy)
+            if order_id:
+                get_idempotency_store().put(order_id, "order", "started", {"size": size_float, "currency": ccy})
+            order_response, failure = submit_order(exchange_interface, symbol, side, size_float, ccy, order_id)
             executed_at_utc = datetime.now(timezone.utc)
 
             # Check if the exchange returned a valid response
@@ -276,14 +449,16 @@ def execute_operation(user_id, api_key, exchange_id, perc_balance_operation, sym
                 sizing_ctx = sizing.to_dict()
                 sizing_ctx.update({"side": "buy", "size": size_float, "currency": ccy, "balance": balance_raw})
                 general_logger.error(
-                    f"  Order FAILED: Exchange returned no response (API error) | "
+                    f"  Order FAILED: {failure['error']} | "
                     f"BUY size={size_float} {ccy} | {sizing_ctx}"
                 )
                 status = "FAILED"
                 return {
                     "status": "error",
-                    "message": "Exchange returned no response. The order was likely rejected.",
-                    "error": "Exchange API returned None (HTTP error or rejected order)",
+                    "message": failure["message"],
+                    "error": failure["error"],
+                    "client_order_id": order_id,
+                    "exchange_response": failure["exchange_response"],
                     "sizing_context": sizing_ctx,
                     "order_response": {"raw_response": None, "response_type": "NoneType"},
                 }
@@ -297,7 +472,7 @@ def execute_operation(user_id, api_key, exchange_id, perc_balance_operation, sym
             # Fallback: compute from balance difference if extraction failed
             if filled_base_qty <= 0 and pre_buy_base_balance is not None:
                 try:
-                    post_buy_base_raw = call_get_balance(exchange_interface, base_currency)
+                    post_buy_base_raw = call_get_balances(exchange_interface, [base_currency])[base_currency.upper()]
                     post_buy_base_balance = Decimal(str(post_buy_base_raw))
                     filled_base_qty = post_buy_base_balance - pre_buy_base_balance
                     if filled_base_qty > 0:
@@ -322,20 +497,20 @@ def execute_operation(user_id, api_key, exchange_id, perc_balance_operation, sym
                 "filled_base_qty": str(filled_base_qty),
                 "base_currency": base_currency,
                 "trace_id": trace_id,
+                "client_order_id": order_id,
             }
-            get_client().send_task(
-                "trade.save_operation",
-                kwargs={"operation_data": operation_data},
-                queue='db'
-            )
+            enqueue_task("trade.save_operation", {"operation_data": operation_data}, queue='db')
 
-            return {
+            result = {
                 "status": "success",
                 "message": "Operação executada e tarefa de salvamento enfileirada.",
                 "order_response": order_response,
                 "size": size_float,
                 "currency": ccy,
             }
+            if order_id:
+                get_idempotency_store().put(order_id, "order", COMPLETED, result)
+            return result
 
     except Exception as e:
         general_logger.error(f"  Order FAILED: {e}")
@@ -0,0 +1,104 @@
+"""
+Transactional outbox for Celery tasks dispatched after a database write.
+
+A stage that saves rows and then publishes the follow-up task loses that task
+if the broker is unreachable after the commit. With OUTBOX_ENABLED=true the
+tasks are written to `task_outbox` in the same transaction as the rows
+(migrations/create_task_outbox.sql): both are committed or neither is. The
+relay (celeryManager/outbox_relay.py) publishes them in batches, in insertion
+order, and deletes them in the same transaction as the publish.
+
+Delivery is at-least-once: if the relay dies between publishing and
+committing, the batch is published again, with the same Celery task ids.
+
+With the flag off (or before the migration) tasks are published directly
+after the commit, as before.
+
+    dispatch = TaskDispatch()
+    with db_transaction() as db_client:
+        ...write rows...
+        dispatch.add("price.fetch_execution_price", {...}, queue="pricing")
+        dispatch.stage(db_client)
+    dispatch.publish()
+"""
+
+import json
+import os
+import uuid
+
+from log.log import general_logger
+from source.celery_client import get_client
+from source.context import get_db_connection
+from source.dbmanager import load_query
+
+CHANNEL = "task_outbox"
+OUTBOX_ENABLED = os.environ.get("OUTBOX_ENABLED", "false").strip().lower() not in ("false", "0", "no", "")
+
+
+def stage_tasks(db_client, tasks):
+    """
+    Write tasks to the outbox on the caller's transaction (the caller commits).
+
+    Args:
+        db_client: open DatabaseClient
+        tasks: list of (task_name, kwargs, queue); kwargs must be JSON-serializable
+
+    Returns:
+        int: rows staged
+    """
+    if not tasks:
+        return 0
+    db_client.cursor.execute(load_query("insert_task_outbox.sql"), (
+        [name for name, _, _ in tasks],
+        [json.dumps(kwargs) for _, kwargs, _ in tasks],
+        [queue for _, _, queue in tasks],
+        [str(uuid.uuid4()) for _ in tasks],
+    ))
+    return db_client.cursor.fetchone()[0]
+
+
+class TaskDispatch:
+    """Tasks that follow one transaction: staged in the outbox or published after it."""
+
+    def __init__(self):
+        self.tasks = []
+        self.staged = False
+
+    def add(self, task_name, kwargs, queue):
+        self.tasks.append((task_name, kwargs, queue))
+
+    def stage(self, db_client):
+        """Call inside the transaction, after the writes. No-op with the outbox off."""
+        if OUTBOX_ENABLED and self.tasks:
+            stage_tasks(db_client, self.tasks)
+            self.staged = True
+
+    def publish(self):
+        """Call after the commit: publishes whatever was not staged."""
+        if self.staged:
+            return
+        for task_name, kwargs, queue in self.tasks:
+            try:
+                get_client().send_task(task_name, kwargs=kwargs, queue=queue)
+            except Exception as e:
+                general_logger.error(f"[Outbox] Failed to dispatch {task_name} to '{queue}': {e}")
+
+
+def enqueue_task(task_name, kwargs, queue):
+    """
+    Hand off a single task outside any transaction.
+
+    With the outbox on, the task is committed to task_outbox on its own
+    connection, falling back to a direct publish if the database is
+    unavailable; otherwise it is published directly. Errors of the direct
+    publish propagate, like send_task.
+    """
+    if OUTBOX_ENABLED:
+        try:
+            with get_db_connection() as db_client:
+                stage_tasks(db_client, [(task_name, kwargs, queue)])
+                db_client.conn.commit()
+            return
+        except Exception as e:
+            general_logger.error(f"[Outbox] Failed to stage {task_name}, publishing directly: {e}")
+    get_client().send_task(task_name, kwargs=kwargs, queue=queue)
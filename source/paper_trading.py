@@ -16,9 +16,12 @@ import uuid
 from decimal import Decimal
 
 from log.log import general_logger
-from source.context import get_db_connection, get_timescale_db_connection
+from source.client import OrderNotSent, OrderRejected
+from source.context import get_db_connection
 from source.dbmanager import load_query
 from source.exchange_interface import ExchangeInterface
+from source.price_cache import get_price_cache
+from source.timescale import latest_price
 
 # Window matching the price enricher: never fill at a price older than this.
 PRICE_FRESHNESS = "5 minutes"
@@ -55,16 +58,19 @@ class PaperTradingInterface(ExchangeInterface):
 
     # --- price ---------------------------------------------------------------
     def _latest_price(self, normalized_symbol: str) -> Decimal:
-        query = load_query("select_latest_market_price.sql")
-        with get_timescale_db_connection() as cur:
-            cur.execute(query, (normalized_symbol, PRICE_FRESHNESS))
-            row = cur.fetchone()
-        if not row or row[0] is None:
+        cache = get_price_cache()
+        if cache is not None:
+            price = cache.latest_price(normalized_symbol)
+            if price is not None:
+                return price
+
+        price = latest_price(normalized_symbol, PRICE_FRESHNESS)
+        if price is None:
             raise PaperPriceUnavailable(
                 f"No oracle price for '{normalized_symbol}' within {PRICE_FRESHNESS}. "
                 f"Symbol must be tracked by the price oracle for paper trading."
             )
-        return Decimal(str(row[0]))
+        return price
 
     def get_current_price(self, symbol):
         return float(self._latest_price(_normalize(symbol)))
@@ -93,6 +99,13 @@ class PaperTradingInterface(ExchangeInterface):
             rows = db.cursor.fetchall() or []
         return [{"asset": r[0], "free": float(r[1])} for r in rows]
 
+    def get_balances(self, ccys):
+        query = load_query("select_paper_balances_all.sql")
+        with get_db_connection() as db:
+            db.cursor.execute(query, (self.api_key,))
+            amounts = {ccy: float(amount) for ccy, amount in db.cursor.fetchall()}
+        return {ccy.upper(): amounts.get(ccy.upper(), 0.0) for ccy in ccys}
+
     def _apply_fill(self, base_ccy, base_delta, quote_ccy, quote_delta):
         """Atomically apply both legs of a fill in a single transaction."""
         ensure = load_query("ensure_paper_balance.sql")
@@ -120,13 +133,15 @@ class PaperTradingInterface(ExchangeInterface):
             db.conn.commit()
 
     # --- orders --------------------------------------------------------------
-    def place_order(self, symbol, side, order_type, size, currency, price=None):
+    def place_order(self, symbol, side, order_type, size, currency, price=None, client_order_id=None):
         """
         Instant market fill at the latest oracle price.
 
         BUY:  `size`/`currency` is the quote amount to spend -> debit quote, credit base.
         SELL: `size`/`currency` is the base quantity to sell -> debit base, credit quote.
-        Returns a BingX-shaped response (or None on failure, mirroring real interfaces).
+        Returns a BingX-shaped response. Like the real interfaces, a failure
+        raises OrderRejected (no price, invalid side, insufficient balance) or
+        OrderNotSent (the fill transaction did not commit); it is never ambiguous.
         """
         try:
             normalized = _normalize(symbol)
@@ -150,7 +165,7 @@ class PaperTradingInterface(ExchangeInterface):
                 executed_base = base_qty
             else:
                 general_logger.error(f"[Paper] Invalid side '{side}'")
-                return None
+                raise OrderRejected(f"[Paper] Invalid side '{side}'")
 
             general_logger.info(
                 f"[Paper] FILLED {side_l.upper()} {normalized} | price={fill_price} "
@@ -162,6 +177,7 @@ class PaperTradingInterface(ExchangeInterface):
                 "paper": True,
                 "data": {
                     "orderId": str(uuid.uuid4()),
+                    "clientOrderId": client_order_id,
                     "symbol": normalized,
                     "side": side_l.upper(),
                     "type": "MARKET",
@@ -173,14 +189,20 @@ class PaperTradingInterface(ExchangeInterface):
                 },
             }
 
-        except PaperPriceUnavailable as e:
+        except OrderRejected:
+            raise
+        except (PaperPriceUnavailable, ValueError) as e:
             general_logger.error(f"[Paper] Order rejected: {e}")
-            return None
+            raise OrderRejected(f"[Paper] Order rejected: {e}") from e
         except Exception as e:
             general_logger.error(f"[Paper] Order failed: {e}")
-            return None
+            raise OrderNotSent(f"[Paper] Order failed: {e}") from e
 
     # --- read/no-op methods --------------------------------------------------
+    def get_order_by_client_id(self, symbol, client_order_id):
+        # Paper fills are local and never ambiguous: a failed fill was not applied
+        return None
+
     def get_order_status(self, symbol, order_id):
         return {"status": "FILLED", "orderId": order_id}
 
@@ -0,0 +1,65 @@
+"""
+Background LISTEN/NOTIFY consumer for the main PostgreSQL database.
+
+Runs a daemon thread holding one autocommit connection that LISTENs on the
+given channels and hands every notification to `on_notify(channel, payload)`.
+`on_connect()` runs after each (re)connection, before notifications are
+consumed: anything that happened while disconnected was not notified, so
+callers reload their full state there. Disconnections are retried with
+backoff; `connected` tells readers whether updates are currently flowing.
+"""
+
+import threading
+
+from log.log import general_logger
+from source.context import get_db_connection
+
+
+class PgListener:
+    def __init__(self, name, channels, on_notify, on_connect=None, on_disconnect=None, poll_seconds=1.0):
+        self.name = name
+        self.channels = tuple(channels)
+        self.on_notify = on_notify
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.poll_seconds = poll_seconds
+        self.connected = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"pg-listener-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                with get_db_connection() as db_client:
+                    conn = db_client.conn
+                    conn.autocommit = True
+                    for channel in self.channels:
+                        conn.execute(f"LISTEN {channel}")
+                    if self.on_connect:
+                        self.on_connect()
+                    self.connected = True
+                    backoff = 1
+                    general_logger.info(f"[PgListener:{self.name}] Listening on {', '.join(self.channels)}")
+
+                    while not self._stop.is_set():
+                        for notify in conn.notifies(timeout=self.poll_seconds):
+                            self.on_notify(notify.channel, notify.payload)
+            except Exception as e:
+                general_logger.error(f"[PgListener:{self.name}] Connection lost: {e}; retrying in {backoff}s")
+            finally:
+                if self.connected and self.on_disconnect:
+                    self.on_disconnect()
+                self.connected = False
+
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30)
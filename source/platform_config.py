@@ -0,0 +1,121 @@
+"""
+Process-local cache of platform_config with typed accessors.
+
+All keys are loaded on first use and kept current by a LISTEN thread on the
+`platform_config_changed` channel (see migrations/add_platform_config_notify.sql),
+so reads cost no round trip. While the listener is not connected (or with
+PLATFORM_CONFIG_LISTEN=false) the cache falls back to reloading the table
+when it is older than PLATFORM_CONFIG_TTL_SECONDS.
+
+The listener starts lazily in each process (threads don't survive fork), so
+it also works inside prefork children.
+
+    from source.platform_config import get_platform_config
+    rate = get_platform_config().get_decimal("commission_rate")
+"""
+
+import os
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+from log.log import general_logger
+from source.context import get_db_connection
+from source.pg_listener import PgListener
+
+CHANNEL = "platform_config_changed"
+
+
+class PlatformConfig:
+    def __init__(self, ttl_seconds, listen):
+        self.ttl_seconds = ttl_seconds
+        self.listen = listen
+        self._values = {}
+        self._loaded_at = 0.0  # monotonic
+        self._lock = threading.Lock()
+        self._listener = None
+        self._pid = None
+
+    # --- loading -------------------------------------------------------------
+    def reload(self):
+        with get_db_connection() as db_client:
+            db_client.cursor.execute("SELECT config_key, config_value FROM platform_config;")
+            values = dict(db_client.cursor.fetchall())
+        self._values = values  # swapped whole: readers never see a partial load
+        self._loaded_at = time.monotonic()
+        general_logger.info(f"[PlatformConfig] Loaded {len(values)} keys")
+
+    def _ensure_fresh(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self.reload()
+                    self._listener = None
+                    if self.listen:
+                        self._listener = PgListener(
+                            "platform-config", [CHANNEL],
+                            on_notify=lambda channel, key: self.reload(),
+                            on_connect=self.reload,
+                        ).start()
+                    self._pid = os.getpid()
+            return
+
+        if self._listener is not None and self._listener.connected:
+            return
+        if time.monotonic() - self._loaded_at > self.ttl_seconds:
+            with self._lock:
+                if time.monotonic() - self._loaded_at > self.ttl_seconds:
+                    try:
+                        self.reload()
+                    except Exception as e:
+                        # Keep serving the last values; retry after another TTL
+                        self._loaded_at = time.monotonic()
+                        general_logger.error(f"[PlatformConfig] Reload failed: {e}")
+
+    # --- typed readers -------------------------------------------------------
+    def get(self, key, default=None):
+        """Raw string value of `key`, or `default` when unset/empty."""
+        self._ensure_fresh()
+        value = self._values.get(key)
+        return default if value is None or value == "" else value
+
+    def get_decimal(self, key, default=None):
+        value = self.get(key)
+        if value is None:
+            return default
+        try:
+            return Decimal(str(value))
+        except InvalidOperation:
+            general_logger.error(f"[PlatformConfig] {key}={value!r} is not a number")
+            return default
+
+    def get_int(self, key, default=None):
+        value = self.get_decimal(key)
+        return default if value is None else int(value)
+
+    def get_bool(self, key, default=False):
+        value = self.get(key)
+        if value is None:
+            return default
+        return str(value).strip().lower() not in ("false", "0", "no")
+
+    def stats(self):
+        return {
+            "keys": len(self._values),
+            "listening": bool(self._listener and self._listener.connected),
+            "age_seconds": round(time.monotonic() - self._loaded_at, 3) if self._loaded_at else None,
+        }
+
+
+_config = None
+
+
+def get_platform_config():
+    """Process-wide platform_config cache (loaded on first read)."""
+    global _config
+    if _config is None:
+        _config = PlatformConfig(
+            ttl_seconds=float(os.environ.get("PLATFORM_CONFIG_TTL_SECONDS", "30")),
+            listen=os.environ.get("PLATFORM_CONFIG_LISTEN", "true").strip().lower() not in ("false", "0", "no"),
+        )
+    return _config
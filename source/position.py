@@ -1,9 +1,23 @@
+from contextlib import contextmanager
 from decimal import Decimal
 from source.context import get_db_connection
 from source.dbmanager import load_query
 from log.log import general_logger
 
 
+@contextmanager
+def _connection(db_client):
+    """
+    Yields (db_client, owns): the caller's client when given (its transaction,
+    no commit here), otherwise a new connection that the function commits.
+    """
+    if db_client is not None:
+        yield db_client, False
+        return
+    with get_db_connection() as own_client:
+        yield own_client, True
+
+
 def get_open_position(instance_id, user_id, symbol):
     """
     Get total open position quantity and entry IDs for a given instance/user/symbol.
@@ -28,39 +42,48 @@ def get_open_position(instance_id, user_id, symbol):
     return (total_qty, entry_ids)
 
 
-def add_position_entry(operation_id, instance_id, user_id, symbol, base_currency, base_qty):
+def add_position_entry(operation_id, instance_id, user_id, symbol, base_currency, base_qty,
+                       db_client=None):
     """
     Insert a new open position entry for a buy operation.
 
+    Args:
+        db_client: Optional open client; the entry is written in its
+            transaction and committed by the caller.
+
     Returns:
         int: The new entry ID.
     """
     query = load_query('insert_position_entry.sql')
-    with get_db_connection() as db_client:
-        db_client.cursor.execute(query, (
+    with _connection(db_client) as (client, owns):
+        client.cursor.execute(query, (
             operation_id, instance_id, user_id, symbol, base_currency, str(base_qty)
         ))
-        entry_id = db_client.cursor.fetchone()[0]
-        db_client.conn.commit()
+        entry_id = client.cursor.fetchone()[0]
+        if owns:
+            client.conn.commit()
 
     general_logger.info(f"Position entry created (ID: {entry_id}) for operation {operation_id} | inst:{instance_id} user:{user_id} {symbol} qty:{base_qty}")
     return entry_id
 
 
-def close_position_entries(entry_ids, sell_operation_id):
+def close_position_entries(entry_ids, sell_operation_id, db_client=None):
     """
     Close open position entries after a sell operation.
 
     Args:
         entry_ids: List of spot_position_entries IDs to close.
         sell_operation_id: The operation ID of the sell that consumed these entries.
+        db_client: Optional open client; the entries are closed in its
+            transaction and committed by the caller.
     """
     if not entry_ids:
         return
 
     query = load_query('close_position_entries.sql')
-    with get_db_connection() as db_client:
-        db_client.cursor.execute(query, (sell_operation_id, entry_ids))
-        db_client.conn.commit()
+    with _connection(db_client) as (client, owns):
+        client.cursor.execute(query, (sell_operation_id, entry_ids))
+        if owns:
+            client.conn.commit()
 
     general_logger.info(f"Closed {len(entry_ids)} position entries for sell operation {sell_operation_id}")
@@ -120,6 +120,21 @@ class WebhookData:
         
         return self.db_manager.fetch_data(query, tuple(params))
 
+    def get_pending_condition(self, instance_id, symbol, side, start_date):
+        """
+        Evaluate the condition server-side.
+
+        Returns (indicator_count, webhook_ids): distinct indicators that
+        signalled and the pending row ids to mark on dispatch.
+        """
+        query = self._load_query("select_pending_condition.sql")
+        params = (instance_id, symbol, side, start_date)
+        rows = self.db_manager.fetch_data(query, params)
+        if not rows:
+            return 0, []
+        indicator_count, webhook_ids = rows[0]
+        return indicator_count or 0, list(webhook_ids or [])
+
     def update_market_object_at_index(self, webhook_id, operation_task_id):
         query = self._load_query("update_market_object.sql")
         params = (
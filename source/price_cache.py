@@ -0,0 +1,292 @@
+"""
+Local last-price service fed from the price oracle (TimescaleDB market_trades).
+
+Paper fills and price enrichment only ever need "the newest trade at or before
+T within 5 minutes". Instead of a Timescale round trip per read, each process
+keeps a per-symbol ring buffer of recent (timestamp, price) ticks, filled by a
+background thread that tails market_trades incrementally.
+
+Only symbols this process actually looks up are tailed: the first lookup of a
+symbol misses and registers it, and symbols not looked up for
+LAST_PRICE_IDLE_SECONDS are dropped. Each poll reads just those symbols and
+borrows a pooled Timescale connection only for its duration; with nothing
+tracked the tail doesn't query at all.
+
+Consistency rules (a miss always means "ask Timescale", never "no price"):
+- `synced_at` is the Timescale NOW() of the last complete poll. A lookup at T
+  is only answered when T <= synced_at, i.e. the tail has already read every
+  tick Timescale had up to T. Each poll re-reads the last
+  LAST_PRICE_TAIL_OVERLAP_SECONDS to pick up slightly out-of-order inserts;
+  ticks read again are skipped (per-timestamp price sets). Large polls are
+  paged on the (timestamp, symbol, price) key of the distinct ticks, so a
+  burst of trades sharing one timestamp never stalls the tail.
+- Ticks older than the buffer's coverage (evicted, or before the symbol was
+  first tailed) are historical misses.
+- If the tail stops polling, lookups miss until it catches up again.
+
+Enabled with LAST_PRICE_CACHE_ENABLED=true; the tail starts lazily on first
+use in each process, so it also works inside prefork children.
+"""
+
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from log.log import general_logger
+from source.context import get_timescale_db_connection
+
+_MAX_PRICE = Decimal("Infinity")
+
+
+def _normalize(symbol):
+    return symbol.replace("-", "").replace("/", "").upper()
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class _SymbolTicks:
+    """Ring buffer of distinct (timestamp, price) for one symbol, oldest first."""
+
+    def __init__(self, max_ticks, tracked_from):
+        self.max_ticks = max_ticks
+        self.ticks = deque(maxlen=max_ticks)  # sorted
+        self._prices = {}  # timestamp -> prices of that timestamp in the ring
+        self.tracked_from = tracked_from  # Timescale time the tail started reading it
+        self.evicted_until = None  # newest timestamp pushed out of the ring
+        self.last_used = time.monotonic()
+
+    def add(self, ts, price):
+        if self.evicted_until is not None and ts <= self.evicted_until:
+            return  # already outside coverage (e.g. re-read by the overlap)
+        if price in self._prices.get(ts, ()):
+            return
+        tick = (ts, price)
+        if len(self.ticks) == self.max_ticks:
+            if tick < self.ticks[0]:
+                self.evicted_until = ts  # older than the whole ring: evicted at once
+                return
+            self._evict_oldest()
+        self._prices.setdefault(ts, set()).add(price)
+        if not self.ticks or tick >= self.ticks[-1]:
+            self.ticks.append(tick)  # the tail reads in order: the common case
+        else:
+            self.ticks.insert(bisect.bisect(self.ticks, tick), tick)
+
+    def _evict_oldest(self):
+        old_ts, old_price = self.ticks.popleft()
+        old_prices = self._prices[old_ts]
+        old_prices.discard(old_price)
+        if not old_prices:
+            del self._prices[old_ts]
+        self.evicted_until = old_ts
+
+    def newest_at_or_before(self, at):
+        index = bisect.bisect_right(self.ticks, (at, _MAX_PRICE))
+        return self.ticks[index - 1] if index else None
+
+
+class LastPriceCache:
+    def __init__(self, max_ticks, poll_seconds, overlap_seconds, batch_size, idle_seconds):
+        self.max_ticks = max_ticks
+        self.poll_seconds = poll_seconds
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.batch_size = batch_size
+        self.idle_seconds = idle_seconds
+        self._symbols = {}  # tailed symbols
+        self._requested = set()  # looked up, tailed from the next poll
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.synced_at = None
+        self._synced_monotonic = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    # --- readers -------------------------------------------------------------
+    def nearest_price(self, symbol, at, window=timedelta(minutes=5)):
+        """
+        Newest price at or before `at` and no older than `window`, or None
+        when the buffer can't answer authoritatively (use Timescale).
+        """
+        self._ensure_started()
+        at = _as_datetime(at)
+        with self._lock:
+            result = self._lookup(_normalize(symbol), at, at - window)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def latest_price(self, symbol, window=timedelta(minutes=5)):
+        """Newest price seen within `window` of the last sync, or None."""
+        self._ensure_started()
+        with self._lock:
+            if self.synced_at is None:
+                self._track(_normalize(symbol))
+                result = None
+            else:
+                result = self._lookup(_normalize(symbol), self.synced_at, self.synced_at - window)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def _track(self, symbol):
+        ticks = self._symbols.get(symbol)
+        if ticks is None:
+            self._requested.add(symbol)
+        else:
+            ticks.last_used = time.monotonic()
+        return ticks
+
+    def _lookup(self, symbol, at, oldest):
+        ticks = self._track(symbol)
+        if ticks is None or self.synced_at is None or at > self.synced_at:
+            return None
+        # Not fresh: the tail stalled, the buffer may lag Timescale
+        if time.monotonic() - self._synced_monotonic > max(5 * self.poll_seconds, 5):
+            return None
+        coverage = ticks.tracked_from
+        if ticks.evicted_until is not None:
+            coverage = max(coverage, ticks.evicted_until)
+        found = ticks.newest_at_or_before(at)
+        if found is None or found[0] < oldest:
+            return None
+        # A tick before coverage might hide a newer evicted/unread one
+        if found[0] <= coverage:
+            return None
+        return found[1]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "symbols": len(self._symbols),
+            "synced_at": self.synced_at.isoformat() if self.synced_at else None,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+        }
+
+    # --- tail ----------------------------------------------------------------
+    def _ensure_started(self):
+        # Threads don't survive fork: (re)start per process
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._symbols = {}
+            self._requested = set()
+            self.synced_at = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="last-price-tail", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        cursor_ts = None
+        while True:
+            try:
+                if self._symbols or self._requested:
+                    # Pooled connection only for the poll (committed on return,
+                    # so the next poll sees a new NOW())
+                    with get_timescale_db_connection() as cur:
+                        cursor_ts = self._poll(cur, cursor_ts)
+                time.sleep(self.poll_seconds)
+            except Exception as e:
+                general_logger.error(f"[LastPriceCache] Tail failed: {e}; retrying")
+                time.sleep(max(self.poll_seconds, 1))
+
+    def _poll(self, cur, cursor_ts):
+        cur.execute("SELECT NOW();")
+        db_now = cur.fetchone()[0]
+
+        with self._lock:
+            idle_before = time.monotonic() - self.idle_seconds
+            for symbol in [s for s, ticks in self._symbols.items() if ticks.last_used < idle_before]:
+                del self._symbols[symbol]
+            tailing = bool(self._symbols)
+            # Newly requested symbols are complete from this poll's NOW() on
+            for symbol in self._requested:
+                self._symbols.setdefault(symbol, _SymbolTicks(self.max_ticks, db_now))
+            self._requested = set()
+            symbols = list(self._symbols)
+
+        if cursor_ts is None or not tailing:
+            # Nothing tailed since the last poll: start reading from now
+            with self._lock:
+                self.synced_at = db_now
+                self._synced_monotonic = time.monotonic()
+            return db_now
+
+        # First page from the overlap, then keyset pagination on the distinct
+        # (timestamp, symbol, price) ticks; the cursor itself only advances to
+        # the newest timestamp seen, so the next poll keeps its overlap
+        rows = None
+        while True:
+            if rows is None:
+                cur.execute(
+                    """
+                    SELECT DISTINCT timestamp, symbol, price
+                    FROM market_trades
+                    WHERE symbol = ANY(%s)
+                    AND timestamp > %s
+                    ORDER BY timestamp, symbol, price
+                    LIMIT %s;
+                    """,
+                    (symbols, cursor_ts - self.overlap, self.batch_size),
+                )
+            else:
+                cur.execute(
+                    """
+                    SELECT DISTINCT timestamp, symbol, price
+                    FROM market_trades
+                    WHERE symbol = ANY(%s)
+                    AND (timestamp, symbol, price) > (%s, %s, %s)
+                    ORDER BY timestamp, symbol, price
+                    LIMIT %s;
+                    """,
+                    (symbols, *rows[-1], self.batch_size),
+                )
+            rows = cur.fetchall()
+            with self._lock:
+                for ts, symbol, price in rows:
+                    ticks = self._symbols.get(symbol)
+                    if ticks is not None:
+                        ticks.add(ts, Decimal(str(price)))
+            if rows:
+                cursor_ts = max(cursor_ts, rows[-1][0])
+            if len(rows) < self.batch_size:
+                break
+
+        with self._lock:
+            self.synced_at = db_now
+            self._synced_monotonic = time.monotonic()
+        return min(cursor_ts, db_now)
+
+
+_cache = None
+
+
+def get_price_cache():
+    """Process-wide cache, or None when LAST_PRICE_CACHE_ENABLED is off."""
+    global _cache
+    if os.environ.get("LAST_PRICE_CACHE_ENABLED", "false").strip().lower() in ("false", "0", "no", ""):
+        return None
+    if _cache is None:
+        _cache = LastPriceCache(
+            max_ticks=int(os.environ.get("LAST_PRICE_TICKS", "1024")),
+            poll_seconds=float(os.environ.get("LAST_PRICE_POLL_SECONDS", "0.5")),
+            overlap_seconds=float(os.environ.get("LAST_PRICE_TAIL_OVERLAP_SECONDS", "5")),
+            batch_size=int(os.environ.get("LAST_PRICE_TAIL_BATCH", "5000")),
+            idle_seconds=float(os.environ.get("LAST_PRICE_IDLE_SECONDS", "300")),
+        )
+    return _cache
@@ -0,0 +1,208 @@
+"""
+Consistent-hash routing of instance signals to logic shard queues.
+
+`webhook.processor` on the shared 'logic' queue runs signals of the same
+instance concurrently, so two signals milliseconds apart can both pass the
+interval check. With LOGIC_SHARD_COUNT > 0 the receipt routes every signal of
+an instance to one shard queue (`logic_shard_<n>`), each consumed by a single
+worker process (--concurrency=1): signals run in order per instance and in
+parallel across instances.
+
+Shards are placed on a hash ring with virtual nodes. Only shards whose queue
+has a consumer are on the ring, so when a shard worker leaves, its instances
+move to the remaining shards and only those instances move; when it comes
+back, they move back. Membership is read from the broker and cached for
+LOGIC_SHARD_MEMBERSHIP_TTL seconds. A shard joins as soon as its queue has a
+consumer, but leaves only after LOGIC_SHARD_DEPARTURE_CHECKS consecutive
+checks without one, so a transient reading does not reshuffle the ring. With
+no live shard, signals fall back to the shared 'logic' queue.
+
+Every process keeps its own view of the ring, so right after a change the
+receipt and a shard worker may briefly disagree. Messages queued on the wrong
+shard are moved, never processed twice:
+- a departed shard's queue has no consumer; the single shard drainer process
+  (celeryManager/shard_drainer.py) republishes its messages, in queue order,
+  to the instances' new owners. `route` itself only reads;
+- a shard worker holding messages of instances that now belong to another
+  live shard hands them over before processing (`moved_queue`).
+"""
+
+import bisect
+import hashlib
+import os
+import time
+
+from log.log import general_logger
+
+SHARD_QUEUE_PREFIX = "logic_shard_"
+VIRTUAL_NODES = 64
+
+
+def shard_queue_name(shard):
+    return f"{SHARD_QUEUE_PREFIX}{shard}"
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(str(value).encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent-hash ring; each node is placed at `replicas` points."""
+
+    def __init__(self, nodes=(), replicas=VIRTUAL_NODES):
+        self.replicas = replicas
+        self._points = []  # sorted hashes
+        self._owners = {}  # hash -> node
+        self._nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self):
+        return frozenset(self._nodes)
+
+    def add(self, node):
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for replica in range(self.replicas):
+            point = _hash(f"{node}#{replica}")
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node):
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        for replica in range(self.replicas):
+            point = _hash(f"{node}#{replica}")
+            if self._owners.pop(point, None) is not None:
+                del self._points[bisect.bisect_left(self._points, point)]
+
+    def node_for(self, key):
+        """Node owning `key` (first point clockwise), or None on an empty ring."""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+class ShardRouter:
+    """Maps instance ids to logic shard queues over the live shards."""
+
+    def __init__(self, shard_count, membership_ttl, departure_checks=1):
+        self.shard_count = shard_count
+        self.membership_ttl = membership_ttl
+        self.departure_checks = max(departure_checks, 1)
+        self.ring = HashRing()
+        self.version = 0  # bumped whenever ring membership changes
+        self._checked_at = None
+        self._missing = {}  # shard on the ring -> consecutive checks without a consumer
+
+    @property
+    def enabled(self):
+        return self.shard_count > 0
+
+    def shard_for(self, instance_id):
+        """Live shard owning the instance, or None if sharding is off/unavailable."""
+        if not self.enabled:
+            return None
+        self._refresh_membership()
+        return self.ring.node_for(instance_id)
+
+    def route(self, instance_id):
+        """Queue for a signal of `instance_id`; None means the shared 'logic' queue."""
+        shard = self.shard_for(instance_id)
+        return shard_queue_name(shard) if shard is not None else None
+
+    def moved_queue(self, instance_id, shard_index):
+        """
+        For the worker of `shard_index`: the queue of the live shard that now
+        owns the instance, or None when it is still this shard's (or the
+        ring is empty).
+        """
+        shard = self.shard_for(instance_id)
+        if shard is None or shard == shard_index:
+            return None
+        return shard_queue_name(shard)
+
+    def offline_shards(self):
+        """Shards currently off the ring; their queues may still hold messages."""
+        if not self.enabled:
+            return frozenset()
+        self._refresh_membership()
+        return frozenset(range(self.shard_count)) - self.ring.nodes
+
+    def _refresh_membership(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.membership_ttl:
+            return
+        self._checked_at = now
+
+        try:
+            live = self._live_shards()
+        except Exception as e:
+            # Keep the last known ring; the broker hiccup is usually transient.
+            general_logger.warning(f"[ShardRouter] Membership check failed, keeping current ring: {e}")
+            return
+
+        current = self.ring.nodes
+        for shard in current & live:
+            self._missing.pop(shard, None)
+        departed = set()
+        for shard in current - live:
+            self._missing[shard] = self._missing.get(shard, 0) + 1
+            if self._missing[shard] >= self.departure_checks:
+                departed.add(shard)
+        joined = live - current
+        if not departed and not joined:
+            return
+        for shard in departed:
+            self._missing.pop(shard, None)
+            self.ring.remove(shard)
+        for shard in joined:
+            self.ring.add(shard)
+        self.version += 1
+        general_logger.info(
+            f"[ShardRouter] Rebalanced ring: live shards {sorted(self.ring.nodes)} "
+            f"(joined {sorted(joined)}, left {sorted(departed)})"
+        )
+
+    def _live_shards(self):
+        """Shards whose queue has at least one consumer, per the broker."""
+        from celeryManager.celery_app import celery as celery_app
+
+        live = set()
+        with celery_app.connection_for_read() as conn:
+            for shard in range(self.shard_count):
+                channel = conn.channel()
+                try:
+                    _, _, consumers = channel.queue_declare(
+                        queue=shard_queue_name(shard), passive=True
+                    )
+                    if consumers > 0:
+                        live.add(shard)
+                except Exception:
+                    # Passive declare fails for a queue that does not exist yet.
+                    pass
+                finally:
+                    try:
+                        channel.close()
+                    except Exception:
+                        pass
+        return frozenset(live)
+
+
+_router = None
+
+
+def get_shard_router():
+    """Process-wide router, configured from the environment on first use."""
+    global _router
+    if _router is None:
+        _router = ShardRouter(
+            shard_count=int(os.environ.get("LOGIC_SHARD_COUNT", "0")),
+            membership_ttl=float(os.environ.get("LOGIC_SHARD_MEMBERSHIP_TTL", "5")),
+            departure_checks=int(os.environ.get("LOGIC_SHARD_DEPARTURE_CHECKS", "3")),
+        )
+    return _router
@@ -19,6 +19,8 @@ class OperationPayload(BaseModel):
     max_amount_size: Optional[float] = None
     size_mode: str = "percentage"
     flat_value: Optional[float] = None
+    # Idempotency key of the order (the owner's trace id; see source/idempotency.py)
+    order_key: Optional[str] = None
 
     @validator("perc_balance_operation")
     def validate_percentage(cls, v, values):
@@ -56,6 +58,10 @@ class OperationBuilder:
         self._operation_data["side"] = side
         return self
 
+    def set_order_key(self, order_key):
+        self._operation_data["order_key"] = order_key
+        return self
+
     def fetch_sharing_info_all(self):
         builders = []
 
@@ -102,6 +108,7 @@ class OperationBuilder:
                 "symbol": self._operation_data["symbol"],
                 "side": self._operation_data["side"],
                 "instance_id": data["instance_id"],
+                "order_key": self._operation_data.get("order_key"),
             }
             builder._operation_data.update(sizing.to_dict())
             builders.append(builder)
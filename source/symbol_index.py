@@ -0,0 +1,192 @@
+"""
+Process-shared index of price-oracle tracked symbols (exchange_symbols).
+
+The pricing worker's parent process loads every symbol at startup into an
+anonymous shared mmap (`start_symbol_index`, called from `worker_init`, i.e.
+before the prefork children exist) and keeps it current from a LISTEN thread
+on the `exchange_symbols_changed` channel (see
+migrations/add_exchange_symbols_notify.sql). Children inherit the mapping and
+read it lock-free; a newly tracked symbol is visible to all of them as soon as
+the NOTIFY arrives instead of after a per-process TTL.
+
+Layout: a header (sequence counter, last update time, listener state, entry
+count) followed by an open-addressing table of fixed-size slots. There is a
+single writer (the listener thread), so readers use a seqlock: they retry
+while the sequence is odd or changed during the read.
+
+Readers get None from `lookup` whenever the index can't answer authoritatively
+(disabled, not loaded in this process, listener disconnected); callers then
+fall back to querying the DB.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from log.log import general_logger
+from source.context import get_db_connection
+from source.pg_listener import PgListener
+
+CHANNEL = "exchange_symbols_changed"
+
+_HEADER = struct.Struct("<QdBI")  # seq, updated_at, listening, count
+_SYMBOL_BYTES = 31
+_SLOT = struct.Struct(f"<B{_SYMBOL_BYTES}s")  # state, symbol
+_EMPTY, _UNTRACKED, _TRACKED = 0, 1, 2
+_MAX_LOAD = 0.7
+
+
+def _normalize(symbol):
+    return symbol.replace("-", "").replace("/", "").upper()
+
+
+class SharedSymbolIndex:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buf = mmap.mmap(-1, _HEADER.size + capacity * _SLOT.size)
+        self._write_lock = threading.Lock()
+        # Per-process read metrics
+        self.lookups = 0
+        self.hits = 0
+
+    # --- header --------------------------------------------------------------
+    def _header(self):
+        return _HEADER.unpack_from(self._buf, 0)
+
+    def _set_header(self, seq, updated_at, listening, count):
+        _HEADER.pack_into(self._buf, 0, seq, updated_at, listening, count)
+
+    def set_listening(self, listening):
+        with self._write_lock:
+            seq, updated_at, _, count = self._header()
+            self._set_header(seq, updated_at, 1 if listening else 0, count)
+
+    # --- slots ---------------------------------------------------------------
+    def _probe(self, key):
+        """Yield slot indexes for `key` (linear probing)."""
+        start = zlib.crc32(key) % self.capacity
+        for i in range(self.capacity):
+            yield (start + i) % self.capacity
+
+    def _slot_offset(self, index):
+        return _HEADER.size + index * _SLOT.size
+
+    def _find(self, key):
+        """(index, state) of `key`, or (first empty index, _EMPTY)."""
+        for index in self._probe(key):
+            state, stored = _SLOT.unpack_from(self._buf, self._slot_offset(index))
+            if state == _EMPTY or stored.rstrip(b"\0") == key:
+                return index, state
+        return None, _EMPTY
+
+    # --- writer (listener thread) -------------------------------------------
+    def _write(self, mutate):
+        with self._write_lock:
+            seq, _, listening, count = self._header()
+            self._set_header(seq + 1, time.time(), listening, count)  # odd: write in progress
+            count = mutate(count)
+            self._set_header(seq + 2, time.time(), listening, count)
+
+    def _put(self, key, tracked, count):
+        index, state = self._find(key)
+        if index is None:
+            raise OverflowError("symbol index is full")
+        _SLOT.pack_into(self._buf, self._slot_offset(index), _TRACKED if tracked else _UNTRACKED, key)
+        return count + (1 if state == _EMPTY else 0)
+
+    def load(self, rows):
+        """Replace the whole index with [(symbol, is_tracked), ...]."""
+        rows = [(_normalize(symbol).encode()[:_SYMBOL_BYTES], bool(tracked)) for symbol, tracked in rows]
+        if len(rows) > self.capacity * _MAX_LOAD:
+            raise OverflowError(
+                f"{len(rows)} symbols exceed the index capacity ({self.capacity}); raise SYMBOL_INDEX_CAPACITY"
+            )
+
+        def mutate(_):
+            self._buf[_HEADER.size:] = bytes(len(self._buf) - _HEADER.size)
+            count = 0
+            for key, tracked in rows:
+                count = self._put(key, tracked, count)
+            return count
+
+        self._write(mutate)
+
+    def update(self, symbol, tracked):
+        key = _normalize(symbol).encode()[:_SYMBOL_BYTES]
+        self._write(lambda count: self._put(key, tracked, count))
+
+    # --- readers (any process) ----------------------------------------------
+    def lookup(self, symbol):
+        """True/False if the index is authoritative, None to fall back to the DB."""
+        self.lookups += 1
+        key = _normalize(symbol).encode()[:_SYMBOL_BYTES]
+        while True:
+            seq, _, listening, _ = self._header()
+            if not listening:
+                return None
+            if seq % 2:
+                continue
+            _, state = self._find(key)
+            if self._header()[0] == seq:
+                break
+        self.hits += 1
+        # Absent from a fully loaded index means not in exchange_symbols
+        return state == _TRACKED
+
+    def stats(self):
+        seq, updated_at, listening, count = self._header()
+        return {
+            "symbols": count,
+            "listening": bool(listening),
+            "staleness_seconds": round(time.time() - updated_at, 3) if updated_at else None,
+            "lookups": self.lookups,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else None,
+        }
+
+
+_index = None
+_listener = None
+
+
+def get_symbol_index():
+    """The shared index if started in this process tree, else None."""
+    return _index
+
+
+def start_symbol_index():
+    """
+    Create, load and keep the index current (call in the parent, pre-fork).
+
+    Enabled with SYMBOL_INDEX_ENABLED=true.
+    """
+    global _index, _listener
+    if _index is not None:
+        return _index
+    if os.environ.get("SYMBOL_INDEX_ENABLED", "false").strip().lower() in ("false", "0", "no", ""):
+        return None
+
+    index = SharedSymbolIndex(int(os.environ.get("SYMBOL_INDEX_CAPACITY", "16384")))
+
+    def reload():
+        with get_db_connection() as db_client:
+            db_client.cursor.execute("SELECT symbol, is_tracked FROM public.exchange_symbols;")
+            rows = db_client.cursor.fetchall()
+        index.load(rows)
+        index.set_listening(True)
+        general_logger.info(f"[SymbolIndex] Loaded {len(rows)} symbols")
+
+    def on_notify(channel, payload):
+        # Payload: "<SYMBOL>:<t|f>" (see the trigger in the migration)
+        symbol, _, tracked = payload.rpartition(":")
+        index.update(symbol, tracked == "t")
+
+    _listener = PgListener(
+        "symbol-index", [CHANNEL], on_notify,
+        on_connect=reload,
+        on_disconnect=lambda: index.set_listening(False),
+    ).start()
+    _index = index
+    return index
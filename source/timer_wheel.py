@@ -0,0 +1,95 @@
+"""
+Hierarchical timer wheel.
+
+Timers are bucketed by fire time into a few levels of slots: level 0 has one
+slot per tick, each higher level covers a whole revolution of the level below
+per slot. Adding a timer is O(1); advancing one tick touches a single level-0
+slot and, once per revolution, re-buckets one slot of the level above into
+finer slots ("cascading"). Memory is proportional to the timers held, not to
+how far in the future they fire.
+
+Used by the deferred-signal scheduler (celeryManager/deferred_scheduler.py).
+"""
+
+import time
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class TimerWheel:
+    """Hierarchical timer wheel with `tick_ms` resolution."""
+
+    def __init__(self, tick_ms=10, wheel_sizes=(256, 64, 64, 64), start_ms=None):
+        self.tick_ms = tick_ms
+        self.wheel_sizes = tuple(wheel_sizes)
+        # spans[k]: ticks covered by one slot of level k
+        self.spans = [1]
+        for size in self.wheel_sizes[:-1]:
+            self.spans.append(self.spans[-1] * size)
+        self.horizon_ticks = self.spans[-1] * self.wheel_sizes[-1]
+        self.levels = [[[] for _ in range(size)] for size in self.wheel_sizes]
+        self.overflow = []  # beyond the last level; re-added as time advances
+        self.current_tick = (now_ms() if start_ms is None else start_ms) // tick_ms
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, fire_at_ms, item):
+        """Schedule `item` to be returned by `advance` once `fire_at_ms` is reached."""
+        fire_tick = -(-fire_at_ms // self.tick_ms)  # ceil: never fire early
+        self._count += 1
+        self._place(max(fire_tick, self.current_tick + 1), item)
+
+    def _place(self, fire_tick, item):
+        delta = fire_tick - self.current_tick
+        if delta >= self.horizon_ticks:
+            self.overflow.append((fire_tick, item))
+            return
+        for level, span in reversed(list(enumerate(self.spans))):
+            if delta >= span or level == 0:
+                slot = (fire_tick // span) % self.wheel_sizes[level]
+                self.levels[level][slot].append((fire_tick, item))
+                return
+
+    def advance(self, until_ms=None):
+        """Move the wheel up to `until_ms` (default: now); returns due items in fire order."""
+        target_tick = (now_ms() if until_ms is None else until_ms) // self.tick_ms
+        due = []
+        while self.current_tick < target_tick:
+            self.current_tick += 1
+            tick = self.current_tick
+            self._cascade(tick)
+            slot = self.levels[0][tick % self.wheel_sizes[0]]
+            if slot:
+                self.levels[0][tick % self.wheel_sizes[0]] = []
+                for fire_tick, item in slot:
+                    if fire_tick <= tick:
+                        due.append(item)
+                    else:
+                        self._place(fire_tick, item)
+        self._count -= len(due)
+        return due
+
+    def _cascade(self, tick):
+        """Re-bucket the higher-level slots that start at `tick` into finer levels."""
+        if tick % self.horizon_ticks == 0 and self.overflow:
+            pending, self.overflow = self.overflow, []
+            for fire_tick, item in pending:
+                self._place(fire_tick, item)
+        for level in range(len(self.spans) - 1, 0, -1):
+            span = self.spans[level]
+            if tick % span:
+                continue
+            index = (tick // span) % self.wheel_sizes[level]
+            slot = self.levels[level][index]
+            if slot:
+                self.levels[level][index] = []
+                for fire_tick, item in slot:
+                    self._place(fire_tick, item)
+
+    def next_fire_ms(self):
+        """Upper bound for sleeping: the next tick boundary."""
+        return (self.current_tick + 1) * self.tick_ms
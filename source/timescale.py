@@ -0,0 +1,200 @@
+"""
+Pooled access to the price oracle database (TimescaleDB, psycopg 3).
+
+Every price read used to open its own psycopg2 connection. Here each process
+keeps a small psycopg_pool.ConnectionPool (created lazily, and again after a
+fork, since pool threads and sockets must not be shared with the parent) and
+the hot lookups run as prepared statements on the pooled connections.
+
+Settings (env):
+- TIMESCALE_DB / _USER / _PASSWORD / _HOST / _PORT: connection
+- TIMESCALE_POOL_MIN / TIMESCALE_POOL_MAX: pool size per process
+- TIMESCALE_POOL_TIMEOUT_SECONDS: wait for a free connection before failing
+- TIMESCALE_STATEMENT_TIMEOUT_MS: server-side statement_timeout per connection
+- TIMESCALE_STATS_EVERY: log per-query latency every N queries (0 disables)
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from decimal import Decimal
+
+from log.log import general_logger
+from source.dbmanager import load_query
+
+NEAREST_PRICE_QUERY = load_query("select_nearest_market_price.sql")
+NEAREST_PRICES_QUERY = load_query("select_nearest_market_prices.sql")
+LATEST_PRICE_QUERY = load_query("select_latest_market_price.sql")
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _conninfo():
+    return {
+        "dbname": os.getenv("TIMESCALE_DB"),
+        "user": os.getenv("TIMESCALE_USER"),
+        "password": os.getenv("TIMESCALE_PASSWORD"),
+        "host": os.getenv("TIMESCALE_HOST", "db_timescale"),
+        "port": int(os.getenv("TIMESCALE_PORT", "5432")),
+    }
+
+
+def get_timescale_pool():
+    """Connection pool of this process (opened on first use)."""
+    global _pool, _pool_pid
+    # A pool inherited from the parent after a fork is left alone (not closed)
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            return _pool
+        from psycopg_pool import ConnectionPool
+
+        timeout_ms = int(os.getenv("TIMESCALE_STATEMENT_TIMEOUT_MS", "2000"))
+        kwargs = dict(_conninfo())
+        if timeout_ms > 0:
+            kwargs["options"] = f"-c statement_timeout={timeout_ms}"
+
+        _pool = ConnectionPool(
+            kwargs=kwargs,
+            min_size=int(os.getenv("TIMESCALE_POOL_MIN", "1")),
+            max_size=int(os.getenv("TIMESCALE_POOL_MAX", "4")),
+            timeout=float(os.getenv("TIMESCALE_POOL_TIMEOUT_SECONDS", "5")),
+            check=ConnectionPool.check_connection,
+            name=f"timescale-{os.getpid()}",
+            open=True,
+        )
+        _pool_pid = os.getpid()
+        general_logger.info(
+            f"[Timescale] Pool opened (host={kwargs['host']}:{kwargs['port']}, "
+            f"statement_timeout={timeout_ms}ms)"
+        )
+        return _pool
+
+
+@contextmanager
+def timescale_cursor(statement_timeout_ms=None):
+    """
+    Cursor on a pooled connection. The transaction is committed (or rolled
+    back on error) when the connection goes back to the pool.
+
+    Args:
+        statement_timeout_ms: overrides the connection statement_timeout for
+            this transaction only (SET LOCAL)
+    """
+    try:
+        with get_timescale_pool().connection() as conn:
+            with conn.cursor() as cur:
+                if statement_timeout_ms is not None:
+                    cur.execute(f"SET LOCAL statement_timeout = {int(statement_timeout_ms)}")
+                yield cur
+    except Exception as e:
+        general_logger.error(f"[Timescale] Query failed: {e}")
+        raise
+
+
+# --- latency -----------------------------------------------------------------
+class QueryStats:
+    """Per-query latency of this process: count, errors, mean, p95 and max."""
+
+    def __init__(self, log_every, window=1000):
+        self.log_every = log_every
+        self.window = window
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, elapsed_ms, failed=False):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = {
+                    "count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "recent": deque(maxlen=self.window),
+                }
+            stats["count"] += 1
+            stats["errors"] += 1 if failed else 0
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["recent"].append(elapsed_ms)
+            should_log = self.log_every and stats["count"] % self.log_every == 0
+        if should_log:
+            general_logger.info(f"[Timescale] {name} latency: {self.snapshot(name)}")
+
+    def snapshot(self, name):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                return None
+            recent = sorted(stats["recent"])
+            return {
+                "count": stats["count"],
+                "errors": stats["errors"],
+                "mean_ms": round(stats["total_ms"] / stats["count"], 2),
+                "p95_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 2),
+                "max_ms": round(stats["max_ms"], 2),
+            }
+
+    def stats(self):
+        return {name: self.snapshot(name) for name in list(self._stats)}
+
+
+query_stats = QueryStats(int(os.getenv("TIMESCALE_STATS_EVERY", "1000")))
+
+
+@contextmanager
+def timed(name):
+    """Record the latency of the enclosed Timescale query under `name`."""
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        query_stats.record(name, (time.perf_counter() - started) * 1000, failed)
+
+
+# --- price lookups -----------------------------------------------------------
+def nearest_price(normalized_symbol, executed_at):
+    """
+    Newest market_trades price at or before `executed_at`, at most 5 minutes
+    older (prepared statement). Returns Decimal or None.
+    """
+    with timed("nearest_price"), timescale_cursor() as cur:
+        cur.execute(NEAREST_PRICE_QUERY, (normalized_symbol, executed_at, executed_at), prepare=True)
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def nearest_prices(lookups, statement_timeout_ms=None):
+    """
+    `nearest_price` for many rows in one query.
+
+    Args:
+        lookups: list of (id, normalized_symbol, executed_at)
+        statement_timeout_ms: optional override for this query
+
+    Returns:
+        dict {id: Decimal} only for the rows with a price
+    """
+    if not lookups:
+        return {}
+    ids, symbols, executed = (list(column) for column in zip(*lookups))
+    with timed("nearest_prices"), timescale_cursor(statement_timeout_ms) as cur:
+        cur.execute(NEAREST_PRICES_QUERY, (ids, symbols, executed))
+        return {row_id: price for row_id, price in cur.fetchall()}
+
+
+def latest_price(normalized_symbol, freshness):
+    """Newest price within `freshness` (an interval string) of now, or None."""
+    with timed("latest_price"), timescale_cursor() as cur:
+        cur.execute(LATEST_PRICE_QUERY, (normalized_symbol, freshness), prepare=True)
+        row = cur.fetchone()
+    if not row or row[0] is None:
+        return None
+    return Decimal(str(row[0]))
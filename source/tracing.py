@@ -59,7 +59,7 @@ def create_trace(trace_id, pattern, action, key_suffix, raw_message=None):
 
 def record_stage(trace_id, stage_name, status="completed", celery_task_id=None,
                  metadata=None, error=None, is_terminal=False,
-                 user_id=None, instance_id=None, symbol=None):
+                 user_id=None, instance_id=None, symbol=None, db_client=None):
     """
     Append a stage entry to the signal_traces row and update metadata.
 
@@ -76,6 +76,9 @@ def record_stage(trace_id, stage_name, status="completed", celery_task_id=None,
         user_id: Optional user_id to set on the trace row
         instance_id: Optional instance_id to set on the trace row
         symbol: Optional symbol to set on the trace row
+        db_client: Optional client with a transaction already in progress;
+            the stage is written in it (inside a savepoint, so a tracing
+            failure never aborts it) and committed by the caller
     """
     if trace_id is None:
         return
@@ -131,6 +134,11 @@ def record_stage(trace_id, stage_name, status="completed", celery_task_id=None,
 
         query = f"UPDATE signal_traces SET {', '.join(set_clauses)} WHERE trace_id = %s"
 
+        if db_client is not None:
+            with db_client.conn.transaction():
+                db_client.cursor.execute(query, tuple(params))
+            return
+
         with get_db_connection() as db_client:
             db_client.cursor.execute(query, tuple(params))
             db_client.conn.commit()
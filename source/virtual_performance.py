@@ -0,0 +1,109 @@
+"""
+Incremental strategy performance from virtual operations.
+
+A cycle is a closed virtual position (FIFO buy -> sell, base_qty 1) whose buy
+and sell are both priced; its return is sell_price / buy_price - 1. Each
+cycle is folded exactly once into the instance's row of
+virtual_strategy_performance:
+
+    cycle_count, win_count      (win_rate is a generated column)
+    sum_cycle_return            (average = sum / cycle_count)
+    equity *= 1 + cycle_return  (realized_return = equity - 1, compounded)
+    peak_equity, max_drawdown   (largest fall of equity from its peak)
+
+The price enrichment calls `apply_closed_cycles` with the operations it just
+priced, in the same transaction, so the summary never disagrees with the
+prices. Cycles are folded in close order. When a cycle closed before the
+instance's last folded cycle arrives late (a slow price, the catch-up), the
+instance's metrics are replayed from all its folded cycles in close order, so
+peak_equity and max_drawdown never depend on when prices were enriched.
+
+When the buy and the sell of a cycle are priced in concurrent transactions,
+neither sees the other's price and the cycle stays pending; the scheduled
+`virtual.apply_performance` catch-up folds it.
+"""
+
+from decimal import Decimal
+
+from source.dbmanager import load_query
+
+_ONE = Decimal(1)
+
+
+def fold_cycle(metrics, buy_price, sell_price, closed_at):
+    """Apply one cycle to a metrics dict (see the module docstring)."""
+    cycle_return = Decimal(sell_price) / Decimal(buy_price) - _ONE
+    metrics["cycle_count"] += 1
+    metrics["win_count"] += 1 if cycle_return > 0 else 0
+    metrics["sum_cycle_return"] += cycle_return
+    metrics["equity"] *= _ONE + cycle_return
+    metrics["peak_equity"] = max(metrics["peak_equity"], metrics["equity"])
+    drawdown = _ONE - metrics["equity"] / metrics["peak_equity"]
+    metrics["max_drawdown"] = max(metrics["max_drawdown"], drawdown)
+    metrics["last_cycle_at"] = closed_at
+    return metrics
+
+
+def _initial_metrics():
+    return {
+        "cycle_count": 0, "win_count": 0, "sum_cycle_return": Decimal(0),
+        "equity": _ONE, "peak_equity": _ONE, "max_drawdown": Decimal(0), "last_cycle_at": None,
+    }
+
+
+def apply_closed_cycles(db_client, operation_ids=None):
+    """
+    Fold newly complete cycles into virtual_strategy_performance.
+
+    Runs on the caller's transaction (the caller commits).
+
+    Args:
+        db_client: open DatabaseClient
+        operation_ids: virtual operations just priced; only cycles they
+            belong to are considered. None folds every pending cycle
+            (backfill).
+
+    Returns:
+        int: number of cycles folded
+    """
+    cur = db_client.cursor
+    ids = list(operation_ids) if operation_ids is not None else None
+    cur.execute(load_query("claim_virtual_performance_cycles.sql"), (ids, ids, ids))
+    cycles = cur.fetchall()
+    if not cycles:
+        return 0
+
+    owners = {}
+    for instance_id, user_id, _, _, _ in cycles:
+        owners[instance_id] = user_id
+    instance_ids = list(owners)
+
+    cur.execute(load_query("insert_virtual_strategy_performance.sql"), (instance_ids, list(owners.values())))
+    cur.execute(load_query("select_virtual_strategy_performance_for_update.sql"), (instance_ids,))
+    columns = ("cycle_count", "win_count", "sum_cycle_return", "equity", "peak_equity", "max_drawdown", "last_cycle_at")
+    summaries = {row[0]: dict(zip(columns, row[1:])) for row in cur.fetchall()}
+
+    # Claimed rows come ordered by instance, then close time
+    late = set()
+    for instance_id, _, closed_at, buy_price, sell_price in cycles:
+        last_cycle_at = summaries[instance_id]["last_cycle_at"]
+        if instance_id in late or (last_cycle_at is not None and closed_at < last_cycle_at):
+            late.add(instance_id)
+            continue
+        fold_cycle(summaries[instance_id], buy_price, sell_price, closed_at)
+
+    if late:
+        # Out-of-order cycles: rebuild those instances from their whole history
+        replayed = {instance_id: _initial_metrics() for instance_id in late}
+        cur.execute(load_query("select_virtual_performance_cycles.sql"), (sorted(late),))
+        for instance_id, closed_at, buy_price, sell_price in cur.fetchall():
+            fold_cycle(replayed[instance_id], buy_price, sell_price, closed_at)
+        summaries.update(replayed)
+
+    rows = [(instance_id, summaries[instance_id]) for instance_id in instance_ids]
+    cur.execute(
+        load_query("update_virtual_strategy_performance.sql"),
+        [[instance_id for instance_id, _ in rows]]
+        + [[metrics[column] for _, metrics in rows] for column in columns],
+    )
+    return len(cycles)